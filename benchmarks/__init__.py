@@ -0,0 +1,6 @@
+"""
+Benchmarks of the parsers, finders and exporters
+run against generated Moon+ Reader corpora.
+
+    python -m benchmarks --books 500 --output results.json
+"""
@@ -0,0 +1,186 @@
+"""
+Generator of synthetic Moon+ Reader libraries:
+notes (.an) and statistics (.po) files of PDF and FB2 books,
+either zlib-compressed the way the reader stores them or plain
+"""
+import os
+import random
+import zlib
+from dataclasses import asdict, dataclass
+from typing import List, Tuple
+
+from moonreader_tools.conf import NOTE_EXTENSION, STAT_EXTENSION
+
+DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua kernel process memory "
+    "страница книга заметка читатель глава"
+).split()
+
+COLORS = (-256, -16711936, -28160, -3368512, 1996532479)
+
+# Milliseconds, 2015-01-01 - 2020-01-01
+TIMESTAMP_RANGE = (1420070400000, 1577836800000)
+
+
+@dataclass
+class CorpusSpec:
+    """
+    Shape of the generated library
+
+    :param books: number of books
+    :param notes_mean: mean number of notes per book
+    :param distribution: how the number of notes is spread between books,\
+    one of DISTRIBUTIONS
+    :param pdf_ratio: share of PDF books, the rest are FB2 ones
+    :param compressed_ratio: share of the zlib-compressed files
+    :param words_mean: mean number of words in the note text
+    :param seed: seed making the corpus reproducible
+    """
+
+    books: int = 200
+    notes_mean: int = 50
+    distribution: str = "exponential"
+    pdf_ratio: float = 0.5
+    compressed_ratio: float = 0.5
+    words_mean: int = 30
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError("Unknown distribution: {}".format(self.distribution))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class GeneratedBook:
+    title: str
+    book_type: str
+    notes: int
+    compressed: bool
+    note_file: str
+    stat_file: str
+
+
+class CorpusGenerator:
+    """Writes books described by the spec into the directory"""
+
+    def __init__(self, spec: CorpusSpec) -> None:
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+
+    def generate(self, directory: str) -> List[GeneratedBook]:
+        os.makedirs(directory, exist_ok=True)
+        return [self.write_book(directory, i) for i in range(self.spec.books)]
+
+    def write_book(self, directory: str, index: int) -> GeneratedBook:
+        book_type = "pdf" if self.random.random() < self.spec.pdf_ratio else "fb2"
+        compressed = self.random.random() < self.spec.compressed_ratio
+        title = "Book_{:06d}".format(index)
+        notes = self.notes_count()
+        base_name = os.path.join(directory, "{}.{}".format(title, book_type))
+        if book_type == "pdf":
+            notes_text = self.pdf_notes_text(notes)
+        else:
+            notes_text = self.fb2_notes_text(title, notes)
+        note_file = base_name + NOTE_EXTENSION
+        stat_file = base_name + STAT_EXTENSION
+        self._write(note_file, notes_text, compressed)
+        self._write(stat_file, self.stats_text(), compressed)
+        return GeneratedBook(title, book_type, notes, compressed, note_file, stat_file)
+
+    def notes_count(self) -> int:
+        mean = self.spec.notes_mean
+        if self.spec.distribution == "fixed":
+            return mean
+        if self.spec.distribution == "uniform":
+            return self.random.randint(0, 2 * mean)
+        # few books with lots of notes and many books with only a few
+        return int(self.random.expovariate(1 / mean)) if mean else 0
+
+    def text(self) -> str:
+        words = max(1, int(self.random.expovariate(1 / self.spec.words_mean)))
+        return " ".join(self.random.choice(WORDS) for _ in range(words))
+
+    def timestamp(self) -> int:
+        return self.random.randint(*TIMESTAMP_RANGE)
+
+    def pdf_notes_text(self, notes: int) -> str:
+        parts = [str(self.random.randint(1, 1000))]
+        for _ in range(notes):
+            start = self.random.randint(0, 5000)
+            fields = [
+                str(self.random.randint(1, 500)),  # page
+                str(self.timestamp()),
+                str(start),
+                str(start + self.random.randint(1, 500)),
+                str(self.random.choice(COLORS)),
+                "0",  # style
+                self.text() if self.random.random() < 0.2 else "",  # note
+                self.text().replace(" ", " \r\n", 1),
+            ]
+            parts.append("#A*#" + fields[0])
+            parts.extend(
+                "#A{}#{}".format(i, field) for i, field in enumerate(fields[1:], 1)
+            )
+            parts.append("#A@#")
+        return "".join(parts)
+
+    def fb2_notes_text(self, title: str, notes: int) -> str:
+        path = "/storage/emulated/0/Books/{}.fb2".format(title)
+        lines = [str(self.random.randint(1, 100000)), "indent:false", "trim:false"]
+        for note_id in range(notes):
+            position = self.random.randint(0, 100000)
+            lines.extend(
+                [
+                    "#",
+                    str(note_id),
+                    title,
+                    path,
+                    path.lower(),
+                    str(self.random.randint(0, 50)),  # last chapter
+                    "0",
+                    str(position),
+                    str(self.random.randint(1, 500)),
+                    str(self.random.choice(COLORS)),
+                    str(self.timestamp()),
+                    "",
+                    self.text() if self.random.random() < 0.2 else "",
+                    self.text(),
+                    "0",
+                    "0",
+                    "1" if self.random.random() < 0.5 else "0",
+                ]
+            )
+        return "\n".join(lines) + "\n"
+
+    def stats_text(self) -> str:
+        pages = self.random.randint(1, 1000)
+        percentage = round(self.random.uniform(0, 100), 1)
+        extra = ""
+        if self.random.random() < 0.5:
+            extra = "@{}#{}".format(
+                self.random.randint(0, 50), self.random.randint(0, 100000)
+            )
+        return "{}*{}{}:{}%".format(self.timestamp(), pages, extra, percentage)
+
+    @staticmethod
+    def _write(filename: str, text: str, compressed: bool) -> None:
+        content = text.encode("utf-8")
+        if compressed:
+            content = zlib.compress(content)
+        with open(filename, "wb") as f:
+            f.write(content)
+
+
+def generate_corpus(directory: str, spec: CorpusSpec) -> List[GeneratedBook]:
+    """Writes the library described by spec into the directory"""
+    return CorpusGenerator(spec).generate(directory)
+
+
+def book_file_pairs(books: List[GeneratedBook]) -> List[Tuple[str, str]]:
+    return [(book.note_file, book.stat_file) for book in books]
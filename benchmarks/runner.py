@@ -0,0 +1,244 @@
+"""
+Runs the benchmarks against the generated corpus and saves
+timings as JSON, so that results of different commits can be compared
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.corpus import (
+    DISTRIBUTIONS,
+    CorpusSpec,
+    GeneratedBook,
+    book_file_pairs,
+    generate_corpus,
+)
+from moonreader_tools.exporters import JSONWriter
+from moonreader_tools.finders import FilesystemFinder
+from moonreader_tools.finders.fs.finder import parse_book
+from moonreader_tools.parsers import FB2NoteParser, PDFNoteParser, StatsAccessor
+
+# Benchmark takes the generated books and returns
+# the function doing the measured work and returning the number of items processed
+BenchmarkSetup = Callable[[str, List[GeneratedBook]], Callable[[], int]]
+
+BENCHMARKS: Dict[str, BenchmarkSetup] = {}
+
+
+def benchmark(name: str):
+    def register(setup: BenchmarkSetup) -> BenchmarkSetup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _read_files(filenames: List[str]) -> List[bytes]:
+    contents = []
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            contents.append(f.read())
+    return contents
+
+
+def _note_parser_benchmark(parser, book_type: str):
+    def setup(directory: str, books: List[GeneratedBook]):
+        # Files are read beforehand to measure the parsing only
+        contents = _read_files([b.note_file for b in books if b.book_type == book_type])
+
+        def run() -> int:
+            return sum(
+                len(parser.from_file_obj(io.BytesIO(content))) for content in contents
+            )
+
+        return run
+
+    return setup
+
+
+benchmark("pdf_parser")(_note_parser_benchmark(PDFNoteParser, "pdf"))
+benchmark("fb2_parser")(_note_parser_benchmark(FB2NoteParser, "fb2"))
+
+
+@benchmark("stats_parser")
+def stats_parser(directory: str, books: List[GeneratedBook]):
+    contents = _read_files([book.stat_file for book in books])
+
+    def run() -> int:
+        for content in contents:
+            StatsAccessor.stats_from_file_obj(io.BytesIO(content))
+        return len(contents)
+
+    return run
+
+
+@benchmark("book_parser_build")
+def book_parser_build(directory: str, books: List[GeneratedBook]):
+    pairs = book_file_pairs(books)
+
+    def run() -> int:
+        for note_file, stat_file in pairs:
+            parse_book(note_file, stat_file)
+        return len(pairs)
+
+    return run
+
+
+@benchmark("filesystem_finder")
+def filesystem_finder(directory: str, books: List[GeneratedBook]):
+    def run() -> int:
+        return sum(1 for _ in FilesystemFinder(directory).get_books())
+
+    return run
+
+
+@benchmark("json_export")
+def json_export(directory: str, books: List[GeneratedBook]):
+    parsed_books = list(FilesystemFinder(directory).get_books())
+
+    def run() -> int:
+        with JSONWriter(io.StringIO()) as writer:
+            return writer.write_all(parsed_books)
+
+    return run
+
+
+def measure(run: Callable[[], int], repeat: int) -> dict:
+    """Runs the function repeat times, the best time is used for throughput"""
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = run()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "items": items,
+        "repeat": repeat,
+        "min": best,
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "items_per_second": items / best if best else None,
+    }
+
+
+def run_benchmarks(
+    spec: CorpusSpec,
+    repeat: int = 5,
+    names: Optional[List[str]] = None,
+    directory: Optional[str] = None,
+) -> dict:
+    """Generates the corpus and runs the benchmarks against it"""
+    names = names or list(BENCHMARKS)
+    unknown = set(names) - BENCHMARKS.keys()
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(", ".join(sorted(unknown))))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = directory or temp_dir
+        books = generate_corpus(directory, spec)
+        results = {
+            name: measure(BENCHMARKS[name](directory, books), repeat) for name in names
+        }
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+            "corpus": dict(spec.to_dict(), notes=sum(b.notes for b in books)),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict) -> Dict[str, float]:
+    """Returns ratio of the best times of results to the baseline ones"""
+    return {
+        name: result["min"] / baseline["results"][name]["min"]
+        for name, result in results["results"].items()
+        if name in baseline["results"] and baseline["results"][name]["min"]
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def parse_args(argv=None):
+    defaults = CorpusSpec()
+    parser = argparse.ArgumentParser(description="Moon+ Reader tools benchmarks")
+    parser.add_argument("--books", type=int, default=defaults.books)
+    parser.add_argument("--notes-mean", type=int, default=defaults.notes_mean)
+    parser.add_argument(
+        "--distribution", choices=DISTRIBUTIONS, default=defaults.distribution
+    )
+    parser.add_argument("--pdf-ratio", type=float, default=defaults.pdf_ratio)
+    parser.add_argument(
+        "--compressed-ratio", type=float, default=defaults.compressed_ratio
+    )
+    parser.add_argument("--words-mean", type=int, default=defaults.words_mean)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--benchmark",
+        action="append",
+        choices=sorted(BENCHMARKS),
+        help="Benchmark to run, all of them are run by default.",
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        help="Directory to generate the corpus in, temporary one if not set.",
+    )
+    parser.add_argument("--output", help="JSON file to save the results to.")
+    parser.add_argument("--baseline", help="Results JSON file to compare with.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec = CorpusSpec(
+        books=args.books,
+        notes_mean=args.notes_mean,
+        distribution=args.distribution,
+        pdf_ratio=args.pdf_ratio,
+        compressed_ratio=args.compressed_ratio,
+        words_mean=args.words_mean,
+        seed=args.seed,
+    )
+    results = run_benchmarks(spec, args.repeat, args.benchmark, args.corpus_dir)
+    ratios = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            ratios = compare(results, json.load(f))
+    for name, result in results["results"].items():
+        line = "{:<20} {:>10.4f}s {:>14.1f} items/s".format(
+            name, result["min"], result["items_per_second"] or 0
+        )
+        if name in ratios:
+            line += " {:>7.2f}x baseline".format(ratios[name])
+        print(line)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Columnar storage of the notes of the whole library,
+allowing to filter and aggregate them without python loops
+over note objects. NumPy is used when it is installed,
+otherwise columns are kept in the standard library arrays.
+"""
+import array
+import collections
+import datetime
+import logging
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from moonreader_tools.datamodel.annotation import Note, NoteStyle
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.parsers.base import BookParser
+from moonreader_tools.parsers.note_extractor import NoteRecord
+from moonreader_tools.utils import (
+    get_book_type,
+    seconds_from_long_timestamp,
+    seconds_from_long_timestamps,
+    title_from_fname,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+STYLES = list(NoteStyle)
+STYLE_CODES = {style: code for code, style in enumerate(STYLES)}
+
+# array module typecode and numpy dtype of every column
+COLUMN_TYPES = {
+    "book_id": ("I", "uint32"),
+    "created": ("q", "int64"),  # seconds since epoch
+    "color": ("I", "uint32"),  # color bytes packed the same way files store them
+    "style": ("b", "int8"),  # index in STYLES
+    "text_start": ("q", "int64"),
+    "text_end": ("q", "int64"),
+    "note_start": ("q", "int64"),
+    "note_end": ("q", "int64"),
+}
+
+Color = Tuple[int, int, int, int]
+
+
+def pack_color(color: Color) -> int:
+    return struct.unpack("I", struct.pack("BBBB", *color))[0]
+
+
+def unpack_color(packed: int) -> Color:
+    return struct.unpack("BBBB", struct.pack("I", packed))  # type: ignore
+
+
+class NoteTableBuilder:
+    """Accumulates notes column by column"""
+
+    def __init__(self) -> None:
+        self.titles: List[str] = []
+        self.columns = {
+            name: array.array(typecode) for name, (typecode, _) in COLUMN_TYPES.items()
+        }
+        self._texts: List[str] = []
+        self._notes: List[str] = []
+        self._texts_length = 0
+        self._notes_length = 0
+
+    def add_book(self, title: str) -> int:
+        """Registers the book and returns its id"""
+        self.titles.append(title)
+        return len(self.titles) - 1
+
+    def add_record(self, book_id: int, record: NoteRecord) -> None:
+        """Adds note from the raw fields yielded by parsers' iter_records"""
+        text, timestamp, color, style, note = record
+        self._append(
+            book_id,
+            int(seconds_from_long_timestamp(timestamp)),
+            int(color) & 0xFFFFFFFF,
+            style,
+            text,
+            note,
+        )
+
+    def add_records(self, book_id: int, records: Sequence[NoteRecord]) -> None:
+        """Adds notes of the book, converting their fields column-wise"""
+        created = seconds_from_long_timestamps([record[1] for record in records])
+        for seconds, (text, _, color, style, note) in zip(created, records):
+            self._append(
+                book_id, int(seconds), int(color) & 0xFFFFFFFF, style, text, note
+            )
+
+    def add_note(self, book_id: int, note: Note) -> None:
+        self._append(
+            book_id,
+            int(note.created.timestamp()),
+            pack_color(note.color),
+            note.style,
+            note.text,
+            note.note,
+        )
+
+    def build(self) -> "NoteTable":
+        return NoteTable(
+            self.titles, self.columns, "".join(self._texts), "".join(self._notes)
+        )
+
+    def _append(self, book_id, created, color, style, text, note):
+        columns = self.columns
+        columns["book_id"].append(book_id)
+        columns["created"].append(created)
+        columns["color"].append(color)
+        columns["style"].append(STYLE_CODES[style])
+        columns["text_start"].append(self._texts_length)
+        self._texts_length += len(text)
+        columns["text_end"].append(self._texts_length)
+        self._texts.append(text)
+        columns["note_start"].append(self._notes_length)
+        self._notes_length += len(note)
+        columns["note_end"].append(self._notes_length)
+        self._notes.append(note)
+
+
+class NoteTable:
+    """
+    Notes of many books stored column-wise: book ids
+    referring to the table of titles, timestamps, packed colors,
+    style codes and offsets of texts in the shared text buffers.
+
+    Usage example:
+
+    table = NoteTable.from_files(pairs)
+    table.filter(since=datetime.datetime(2017, 1, 1)).count_by_month()
+    """
+
+    def __init__(
+        self,
+        titles: Sequence[str],
+        columns: Dict[str, Union[array.array, "np.ndarray"]],
+        text_buffer: str,
+        note_buffer: str,
+    ) -> None:
+        self.titles = titles
+        self.columns = {
+            name: self._as_column(name, column) for name, column in columns.items()
+        }
+        self.text_buffer = text_buffer
+        self.note_buffer = note_buffer
+
+    @classmethod
+    def from_books(cls, books: Iterable[Book]) -> "NoteTable":
+        """Builds the table from the books, e.g. the finder output"""
+        builder = NoteTableBuilder()
+        for book in books:
+            book_id = builder.add_book(book.title)
+            Note.decode_all(book.notes)
+            for note in book.notes:
+                builder.add_note(book_id, note)
+        return builder.build()
+
+    @classmethod
+    def from_finder(cls, finder, **kwargs) -> "NoteTable":
+        return cls.from_books(finder.get_books(**kwargs))
+
+    @classmethod
+    def from_files(cls, pairs: Iterable[Tuple[str, str]]) -> "NoteTable":
+        """
+        Builds the table from (notes file, statistics file) pairs
+        straight from the parsed fields, without creating note objects
+        """
+        builder = NoteTableBuilder()
+        for note_file, stat_file in pairs:
+            if not note_file:
+                continue
+            try:
+                book_type = get_book_type(note_file)
+                note_reader = BookParser(book_type).get_note_reader_by_type(book_type)
+                with open(note_file, "rb") as notes_fobj:
+                    records = list(note_reader.iter_records(notes_fobj))
+            except Exception:
+                err_msg = "Exception occured when reading notes of %s."
+                logger.exception(err_msg, note_file)
+                continue
+            book_id = builder.add_book(title_from_fname(note_file))
+            builder.add_records(book_id, records)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.columns["book_id"])
+
+    def text(self, index: int) -> str:
+        start, end = self.columns["text_start"][index], self.columns["text_end"][index]
+        return self.text_buffer[start:end]
+
+    def note(self, index: int) -> str:
+        start, end = self.columns["note_start"][index], self.columns["note_end"][index]
+        return self.note_buffer[start:end]
+
+    def row(self, index: int) -> dict:
+        """Returns all of the note fields"""
+        return {
+            "title": self.titles[self.columns["book_id"][index]],
+            "text": self.text(index),
+            "note": self.note(index),
+            "created": datetime.datetime.fromtimestamp(
+                int(self.columns["created"][index])
+            ),
+            "style": STYLES[self.columns["style"][index]],
+            "color": unpack_color(int(self.columns["color"][index])),
+        }
+
+    def filter(
+        self,
+        book: Optional[str] = None,
+        color: Optional[Color] = None,
+        style: Optional[NoteStyle] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+    ) -> "NoteTable":
+        """
+        Returns table with the notes matching all of the given conditions,
+        the time range includes since and excludes until
+        """
+        conditions = []
+        if book is not None:
+            book_ids = [i for i, title in enumerate(self.titles) if title == book]
+            conditions.append(("book_id", "in", book_ids))
+        if color is not None:
+            conditions.append(("color", "==", pack_color(color)))
+        if style is not None:
+            conditions.append(("style", "==", STYLE_CODES[style]))
+        if since is not None:
+            conditions.append(("created", ">=", int(since.timestamp())))
+        if until is not None:
+            conditions.append(("created", "<", int(until.timestamp())))
+        if not conditions:
+            return self
+        if np is not None:
+            return self._take(self._numpy_mask(conditions))
+        return self._take(self._matching_indexes(conditions))
+
+    def count(self, **conditions) -> int:
+        return len(self.filter(**conditions))
+
+    def count_by_book(self) -> Dict[str, int]:
+        counts: Dict[str, int] = collections.Counter()
+        for book_id, count in self._count_values("book_id").items():
+            counts[self.titles[book_id]] += count
+        return dict(counts)
+
+    def count_by_color(self) -> Dict[Color, int]:
+        return {
+            unpack_color(packed): count
+            for packed, count in self._count_values("color").items()
+        }
+
+    def count_by_style(self) -> Dict[NoteStyle, int]:
+        return {
+            STYLES[code]: count for code, count in self._count_values("style").items()
+        }
+
+    def count_by_month(self) -> Dict[Tuple[int, int], int]:
+        """Counts notes by (year, month) of their creation in UTC"""
+        created = self.columns["created"]
+        if np is not None:
+            if not len(created):
+                return {}
+            months = created.astype("datetime64[s]").astype("datetime64[M]")
+            months = months.astype("int64")
+            first_month = months.min()
+            counts = np.bincount(months - first_month)
+            return {
+                (1970 + int(month) // 12, int(month) % 12 + 1): int(count)
+                for month, count in zip(
+                    np.nonzero(counts)[0] + first_month, counts[counts > 0]
+                )
+            }
+        counts: Dict[Tuple[int, int], int] = collections.Counter()
+        days = collections.Counter(timestamp // 86400 for timestamp in created)
+        for day, count in days.items():
+            date = datetime.datetime.fromtimestamp(day * 86400, datetime.timezone.utc)
+            counts[(date.year, date.month)] += count
+        return dict(counts)
+
+    def _count_values(self, name: str) -> Dict[int, int]:
+        column = self.columns[name]
+        if np is not None:
+            values, counts = np.unique(column, return_counts=True)
+            return {int(value): int(count) for value, count in zip(values, counts)}
+        return collections.Counter(column)
+
+    def _numpy_mask(self, conditions):
+        mask = np.ones(len(self), dtype=bool)
+        for name, operator, value in conditions:
+            column = self.columns[name]
+            if operator == "in":
+                mask &= np.isin(column, value)
+            elif operator == "==":
+                mask &= column == value
+            elif operator == ">=":
+                mask &= column >= value
+            else:
+                mask &= column < value
+        return mask
+
+    def _matching_indexes(self, conditions):
+        indexes = range(len(self))
+        for name, operator, value in conditions:
+            column = self.columns[name]
+            if operator == "in":
+                value = set(value)
+                indexes = [i for i in indexes if column[i] in value]
+            elif operator == "==":
+                indexes = [i for i in indexes if column[i] == value]
+            elif operator == ">=":
+                indexes = [i for i in indexes if column[i] >= value]
+            else:
+                indexes = [i for i in indexes if column[i] < value]
+        return indexes
+
+    def _take(self, selection) -> "NoteTable":
+        if np is not None:
+            columns = {name: column[selection] for name, column in self.columns.items()}
+        else:
+            columns = {
+                name: array.array(column.typecode, (column[i] for i in selection))
+                for name, column in self.columns.items()
+            }
+        return NoteTable(self.titles, columns, self.text_buffer, self.note_buffer)
+
+    @staticmethod
+    def _as_column(name: str, column):
+        typecode, dtype = COLUMN_TYPES[name]
+        if np is not None:
+            if isinstance(column, array.array):
+                return np.frombuffer(column, dtype=dtype)
+            return np.asarray(column, dtype=dtype)
+        if isinstance(column, array.array):
+            return column
+        return array.array(typecode, column)
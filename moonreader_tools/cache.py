@@ -0,0 +1,155 @@
+"""
+Persistent cache of parsed books, allowing to skip parsing
+of the files that have not changed since the previous scan
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from moonreader_tools.datamodel.book import Book
+
+MISSING_FILE_FINGERPRINT = "-"
+
+
+def file_fingerprint(filename: str, stat_result=None, hash_content=False) -> str:
+    """
+    Builds the string identifying the state of the file,
+    consisting of its size, modification time and optionally
+    a hash of the content.
+
+    :param stat_result: already obtained os.stat_result, if any
+    """
+    if not filename:
+        return MISSING_FILE_FINGERPRINT
+    if stat_result is None:
+        stat_result = os.stat(filename)
+    fingerprint = "{}:{}".format(stat_result.st_size, stat_result.st_mtime_ns)
+    if hash_content:
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                content_hash.update(chunk)
+        fingerprint += ":" + content_hash.hexdigest()
+    return fingerprint
+
+
+class BookCache:
+    """
+    SQLite-backed storage of parsed books.
+
+    Every book is stored under a key (e.g. path to the book files
+    without extension) along with the fingerprint of the files
+    it was parsed from; the cached book is returned only if
+    the fingerprint is still the same. When max_entries is set
+    the least recently used books are evicted on every flush.
+    The cache may be shared between threads.
+
+    Usage example:
+
+    with BookCache("books.sqlite", max_entries=10000) as cache:
+        book = cache.get(key, fingerprint)
+        if book is None:
+            book = parse_book()
+            cache.put(key, fingerprint, book)
+    """
+
+    _COMMIT_EVERY = 500
+
+    def __init__(self, filename: str, max_entries: Optional[int] = None) -> None:
+        self.filename = filename
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            "key TEXT PRIMARY KEY, "
+            "fingerprint TEXT NOT NULL, "
+            "record TEXT NOT NULL, "
+            "last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS books_last_used ON books (last_used)"
+        )
+        row = self._connection.execute("SELECT MAX(last_used) FROM books").fetchone()
+        self._clock = row[0] or 0
+        self._pending_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def get(self, key: str, fingerprint: str) -> Optional[Book]:
+        """Returns cached book if its files have not changed, None otherwise"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprint, record FROM books WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] != fingerprint:
+                return None
+            self._write(
+                "UPDATE books SET last_used = ? WHERE key = ?", self._tick(), key
+            )
+        return Book.from_record(json.loads(row[1]))
+
+    def put(self, key: str, fingerprint: str, book: Book) -> None:
+        record = json.dumps(book.to_record(), ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO books (key, fingerprint, record, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                key,
+                fingerprint,
+                record,
+                self._tick(),
+            )
+
+    def invalidate(self, key: str) -> None:
+        """Drops the cached book, so it is parsed again next time"""
+        with self._lock:
+            self._write("DELETE FROM books WHERE key = ?", key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._write("DELETE FROM books")
+            self.flush()
+
+    def flush(self) -> None:
+        """Evicts least recently used books and persists pending changes"""
+        with self._lock:
+            if self.max_entries is not None:
+                self._evict(self.max_entries)
+            self._connection.commit()
+            self._pending_writes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    def _evict(self, max_entries: int) -> None:
+        excess = len(self) - max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM books WHERE key IN "
+                "(SELECT key FROM books ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _write(self, query: str, *params) -> None:
+        self._connection.execute(query, params)
+        self._pending_writes += 1
+        if self._pending_writes >= self._COMMIT_EVERY:
+            self.flush()
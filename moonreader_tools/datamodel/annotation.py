@@ -1,8 +1,16 @@
 import datetime
 import enum
-from typing import Tuple
+from typing import List, Optional, Sequence, Tuple
 
-from moonreader_tools.utils import color_tuple_as_hex_code
+from moonreader_tools.utils import (
+    color_tuple_as_hex_code,
+    color_tuple_from_overflowed_integer,
+    colors_from_overflowed_integers,
+    date_from_long_timestamp,
+    dates_from_long_timestamps,
+    hex_codes_from_color_tuples,
+    seconds_from_long_timestamps,
+)
 
 DEFAULT_COLOR = (0, 255, 255, 255)
 
@@ -15,11 +23,57 @@ class NoteStyle(enum.Enum):
     DELETED = "DELETED"
 
 
+class BookMeta:
+    """
+    Book-level fields repeated in every note of the FB2 notes file,
+    a single instance is shared by all notes of the book
+    """
+
+    __slots__ = ("title", "path", "path_lower")
+
+    def __init__(self, title: str, path: str = "", path_lower: str = "") -> None:
+        self.title = title
+        self.path = path
+        self.path_lower = path_lower
+
+    def to_record(self) -> tuple:
+        return (self.title, self.path, self.path_lower)
+
+    @classmethod
+    def from_record(cls, record) -> "BookMeta":
+        return cls(*record)
+
+    def __eq__(self, other):
+        if not isinstance(other, BookMeta):
+            return NotImplemented
+        return self.to_record() == other.to_record()
+
+    def __hash__(self):
+        return hash(self.to_record())
+
+    def __repr__(self):
+        return "<BookMeta: {}>".format(self.path or self.title)
+
+
 class Note:
     """
     A simple DTO representing book note in the system
     """
 
+    __slots__ = (
+        "_text",
+        "_created",
+        "_style",
+        "_color",
+        "_note",
+        "_raw_timestamp",
+        "_raw_color",
+        "_meta",
+        "_last_chapter",
+        "_last_position",
+        "_highlight_length",
+    )
+
     _REPR_TEXT_LENGTH = 100
 
     def __init__(
@@ -29,15 +83,99 @@ class Note:
         style: NoteStyle = NoteStyle.SELECTED,
         color: Tuple[int, int, int, int] = DEFAULT_COLOR,
         note: str = "",
+        meta: Optional[BookMeta] = None,
+        last_chapter: Optional[int] = None,
+        last_position: Optional[int] = None,
+        highlight_length: Optional[int] = None,
     ) -> None:
+        """
+        :param meta: metadata of the book shared by its notes, if known
+        :param last_chapter: chapter the note is made in (FB2 only)
+        :param last_position: position of the note in the chapter (FB2 only)
+        :param highlight_length: length of the highlighted text (FB2 only)
+        """
         self._text = text
         self._created = created
         self._style = style
         self._color = color
         self._note = note
+        self._raw_timestamp: Optional[str] = None
+        self._raw_color: Optional[str] = None
+        self._meta = meta
+        self._last_chapter = last_chapter
+        self._last_position = last_position
+        self._highlight_length = highlight_length
+
+    @classmethod
+    def from_raw(
+        cls,
+        text: str,
+        timestamp: str,
+        color: str,
+        style: NoteStyle = NoteStyle.SELECTED,
+        note: str = "",
+        meta: Optional[BookMeta] = None,
+        last_chapter: Optional[int] = None,
+        last_position: Optional[int] = None,
+        highlight_length: Optional[int] = None,
+    ) -> "Note":
+        """
+        Creates note from the timestamp and color tokens
+        as they're stored in MoonReader files,
+        the tokens are decoded on first access
+        """
+        instance = cls.__new__(cls)
+        instance._text = text
+        instance._created = None
+        instance._style = style
+        instance._color = None
+        instance._note = note
+        instance._raw_timestamp = timestamp
+        instance._raw_color = color
+        instance._meta = meta
+        instance._last_chapter = last_chapter
+        instance._last_position = last_position
+        instance._highlight_length = highlight_length
+        return instance
+
+    @staticmethod
+    def decode_all(notes: Sequence["Note"]) -> None:
+        """
+        Decodes raw timestamps and colors of many notes at once,
+        which is faster than decoding them on access one by one
+        """
+        pending = [note for note in notes if note._raw_timestamp is not None]
+        if pending:
+            dates = dates_from_long_timestamps([n._raw_timestamp for n in pending])
+            for note, created in zip(pending, dates):
+                note._created = created
+                note._raw_timestamp = None
+        pending = [note for note in notes if note._raw_color is not None]
+        if pending:
+            colors = colors_from_overflowed_integers([n._raw_color for n in pending])
+            for note, color in zip(pending, colors):
+                note._color = color
+                note._raw_color = None
+
+    @staticmethod
+    def validate_all(notes: Sequence["Note"]) -> None:
+        """
+        Checks that raw timestamps and colors of the notes can be decoded,
+        raising the error of the decoding otherwise; the notes are left
+        undecoded, so that their fields are still decoded on access
+        """
+        seconds_from_long_timestamps(
+            note._raw_timestamp for note in notes if note._raw_timestamp is not None
+        )
+        for str_color in {note._raw_color for note in notes}:
+            if str_color is not None:
+                color_tuple_from_overflowed_integer(int(str_color))
 
     @property
     def color(self):
+        if self._raw_color is not None:
+            self._color = color_tuple_from_overflowed_integer(int(self._raw_color))
+            self._raw_color = None
         return self._color
 
     @property
@@ -54,17 +192,90 @@ class Note:
 
     @property
     def created(self):
+        if self._raw_timestamp is not None:
+            self._created = date_from_long_timestamp(self._raw_timestamp)
+            self._raw_timestamp = None
         return self._created
 
     def to_dict(self):
+        return self._to_dict(color_tuple_as_hex_code(self.color))
+
+    @staticmethod
+    def to_dicts(notes: Sequence["Note"]) -> List[dict]:
+        """Serializes many notes at once, decoding their fields column-wise"""
+        Note.decode_all(notes)
+        color_codes = hex_codes_from_color_tuples([note.color for note in notes])
+        return [note._to_dict(code) for note, code in zip(notes, color_codes)]
+
+    def _to_dict(self, color_code: str) -> dict:
         return {
             "text": self.text,
             "note": self.note,
             "created": self.created.isoformat(),
             "style": self.style.value,
-            "color": color_tuple_as_hex_code(self.color),
+            "color": color_code,
         }
 
+    @property
+    def meta(self) -> Optional[BookMeta]:
+        return self._meta
+
+    @property
+    def last_chapter(self) -> Optional[int]:
+        return self._last_chapter
+
+    @property
+    def last_position(self) -> Optional[int]:
+        return self._last_position
+
+    @property
+    def highlight_length(self) -> Optional[int]:
+        return self._highlight_length
+
+    @property
+    def position(self) -> Optional[Tuple[int, int, int]]:
+        """Chapter, position in it and length of the highlight, if known"""
+        if self._last_chapter is None:
+            return None
+        return (self._last_chapter, self._last_position, self._highlight_length)
+
+    def to_record(self) -> tuple:
+        """
+        Compact JSON- and pickle-friendly representation of the note,
+        book metadata is not included, see Book.to_record
+        """
+        record = (
+            self.text,
+            self.note,
+            self.created.timestamp(),
+            self.style.value,
+            self.color,
+        )
+        position = self.position
+        if position is not None:
+            record += (position,)
+        return record
+
+    @classmethod
+    def from_record(cls, record, meta: Optional[BookMeta] = None) -> "Note":
+        """Restores the note from the output of to_record"""
+        text, note, created, style, color, *position = record
+        instance = cls(
+            text=text,
+            created=datetime.datetime.fromtimestamp(created),
+            style=NoteStyle(style),
+            color=tuple(color),
+            note=note,
+            meta=meta,
+        )
+        if position:
+            (
+                instance._last_chapter,
+                instance._last_position,
+                instance._highlight_length,
+            ) = position[0]
+        return instance
+
     def __repr__(self):
         return "<Note: {}>".format(self.text[: self._REPR_TEXT_LENGTH])
 
@@ -1,6 +1,6 @@
-from typing import List
+from typing import Callable, Iterable, List, Optional
 
-from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.annotation import BookMeta, Note
 from moonreader_tools.datamodel.statistics import Statistics
 
 
@@ -10,16 +10,46 @@ class Book:
     with its statistics and attached notes if any
     """
 
-    def __init__(self, title, stats=None, notes: List[Note] = None) -> None:
+    __slots__ = ("title", "_notes", "_notes_loader", "__stats")
+
+    # Fields of the book dictionary
+    FIELDS = ("title", "pages", "percentage", "notes")
+
+    def __init__(
+        self,
+        title,
+        stats=None,
+        notes: List[Note] = None,
+        notes_loader: Optional[Callable[[], List[Note]]] = None,
+    ) -> None:
         """
         :param title: Book title
         :param stats: Statistics object
         :param notes: list of Note objects
+        :param notes_loader: function returning notes of the book,\
+        called on the first access to the notes if they are not given
         """
         self.title = title
         self.stats = stats
         self.stats = stats or Statistics.empty_stats()
-        self.notes = notes or []
+        self._notes_loader = None if notes else notes_loader
+        self._notes = None if self._notes_loader else notes or []
+
+    @property
+    def notes(self) -> List[Note]:
+        if self._notes is None:
+            self._notes = self._notes_loader()  # type: ignore
+            self._notes_loader = None
+        return self._notes
+
+    @notes.setter
+    def notes(self, notes: List[Note]):
+        self._notes = notes
+        self._notes_loader = None
+
+    @property
+    def notes_loaded(self) -> bool:
+        return self._notes is not None
 
     @property
     def pages(self):
@@ -45,17 +75,54 @@ class Book:
     def percentage(self, value):
         self.stats.percentage = value
 
-    def to_dict(self):
-        """Serialize book to dictionary"""
-        book_dict = {
-            "title": self.title,
-            "pages": self.pages,
-            "percentage": self.percentage,
-            "notes": [note.to_dict() for note in self.notes],
-        }
+    def to_dict(self, fields: Optional[Iterable[str]] = None):
+        """
+        Serialize book to dictionary
+
+        :param fields: fields to be serialized, all of FIELDS by default,\
+        notes are not loaded unless they are requested
+        """
+        book_dict = {}
+        for field in self.FIELDS if fields is None else fields:
+            if field == "notes":
+                book_dict["notes"] = Note.to_dicts(self.notes)
+            elif field in self.FIELDS:
+                book_dict[field] = getattr(self, field)
+            else:
+                raise ValueError("Unknown book field: {}".format(field))
         return book_dict
 
+    def to_record(self) -> tuple:
+        """
+        Compact JSON- and pickle-friendly representation of the book
+        with its statistics and notes. Metadata shared by all
+        of the notes is stored once.
+        """
+        Note.decode_all(self.notes)
+        record = (
+            self.title,
+            self.stats.to_record(),
+            [note.to_record() for note in self.notes],
+        )
+        meta = self.notes[0].meta if self.notes else None
+        if meta is not None and all(note.meta is meta for note in self.notes):
+            record += (meta.to_record(),)
+        return record
+
+    @classmethod
+    def from_record(cls, record) -> "Book":
+        """Restores the book from the output of to_record"""
+        title, stats, notes, *meta = record
+        shared_meta = BookMeta.from_record(meta[0]) if meta else None
+        return cls(
+            title,
+            stats=Statistics.from_record(stats),
+            notes=[Note.from_record(note, shared_meta) for note in notes],
+        )
+
     def __str__(self):
+        if not self.notes_loaded:
+            return "<Book> {}: notes are not loaded".format(self.title)
         return "<Book> {}: {} notes".format(self.title, len(self.notes))
 
     def __repr__(self):
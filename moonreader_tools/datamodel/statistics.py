@@ -3,20 +3,29 @@ from typing import Optional
 
 
 class Statistics:
+    __slots__ = ("timestamp", "pages", "percentage", "no1", "no2")
+
     def __init__(
         self,
         timestamp: Optional[int] = None,
         pages: int = 0,
         percentage: int = 0,
+        no1: Optional[str] = None,
+        no2: Optional[str] = None,
         **kwargs
     ):
+        """
+        :param no1: unknown field of the statistics file
+        :param no2: unknown field of the statistics file
+        """
         if timestamp is None:
             self.timestamp = int(time.time())
         else:
             self.timestamp = timestamp
         self.pages = int(pages)
         self.percentage = float(percentage)
-        self._rest = kwargs
+        self.no1 = no1
+        self.no2 = no2
 
     def __repr__(self) -> str:
         return (
@@ -31,6 +40,21 @@ class Statistics:
     def to_dict(self):
         return {"percentage": self.percentage, "pages": self.pages}
 
+    def to_record(self) -> tuple:
+        """Compact JSON- and pickle-friendly representation of statistics"""
+        rest = {
+            name: getattr(self, name)
+            for name in ("no1", "no2")
+            if getattr(self, name) is not None
+        }
+        return (self.timestamp, self.pages, self.percentage, rest)
+
+    @classmethod
+    def from_record(cls, record) -> "Statistics":
+        """Restores statistics from the output of to_record"""
+        timestamp, pages, percentage, rest = record
+        return cls(timestamp, pages, percentage, **rest)
+
     @classmethod
     def empty_stats(cls):
         """Returns empty statistics object."""
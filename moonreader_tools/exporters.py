@@ -0,0 +1,155 @@
+"""
+Writers serializing books one by one as they are obtained
+from the finders, so that the whole library is never kept in memory
+"""
+import gzip
+import io
+import json
+import sys
+from typing import IO, Iterable, Optional, Sequence
+
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.instrumentation import NULL_METRICS, SERIALIZE, Metrics
+
+FORMATS = ("json", "ndjson")
+
+
+class BookWriter:
+    """
+    Base writer, books are written with write()
+    and the output is finished with close().
+    Output is not finished if the export fails.
+
+    Usage example:
+
+    with JSONWriter(sys.stdout) as writer:
+        writer.write_all(finder.get_books())
+    """
+
+    def __init__(
+        self,
+        stream: IO[str],
+        metrics: Metrics = NULL_METRICS,
+        fields: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        :param fields: book fields to be written, all of them by default
+        """
+        self.stream = stream
+        self.metrics = metrics
+        self.fields = fields
+        self.count = 0
+
+    def write(self, book: Book) -> None:
+        raise NotImplementedError
+
+    def write_all(self, books: Iterable[Book]) -> int:
+        """Writes all of the books and returns their number"""
+        for book in books:
+            with self.metrics.stage(SERIALIZE):
+                self.write(book)
+        return self.count
+
+    def close(self) -> None:
+        self.stream.flush()
+
+    def abort(self) -> None:
+        """
+        Flushes the books written so far without finishing the output,
+        so that the failed export doesn't look like the complete one
+        """
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _dumps(self, book: Book) -> str:
+        return json.dumps(book.to_dict(self.fields), ensure_ascii=False)
+
+
+class JSONWriter(BookWriter):
+    """Writes the {"books": [...]} document, one book at a time"""
+
+    def write(self, book: Book) -> None:
+        prefix = '{"books": [' if self.count == 0 else ", "
+        self.stream.write(prefix + self._dumps(book))
+        self.count += 1
+
+    def close(self) -> None:
+        self.stream.write('{"books": []}' if self.count == 0 else "]}")
+        self.stream.write("\n")
+        super().close()
+
+
+class NDJSONWriter(BookWriter):
+    """Writes every book as a JSON object on its own line"""
+
+    def write(self, book: Book) -> None:
+        self.stream.write(self._dumps(book) + "\n")
+        self.count += 1
+
+
+WRITERS = {"json": JSONWriter, "ndjson": NDJSONWriter}
+
+
+def open_output(filename: Optional[str] = None, compress: Optional[bool] = None):
+    """
+    Opens text stream for the output file or stdout if it is not given.
+    Output is gzip-compressed if compress is set, by default
+    files with the .gz suffix are compressed
+    """
+    if compress is None:
+        compress = bool(filename) and filename.endswith(".gz")  # type: ignore
+    if not filename:
+        if not compress:
+            return _UnclosedStream(sys.stdout)
+        return io.TextIOWrapper(
+            gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"), encoding="utf-8"
+        )
+    if compress:
+        return gzip.open(filename, "wt", encoding="utf-8")
+    return open(filename, "w", encoding="utf-8")
+
+
+def get_writer(
+    stream: IO[str],
+    fmt: str = "json",
+    metrics: Metrics = NULL_METRICS,
+    fields: Optional[Sequence[str]] = None,
+) -> BookWriter:
+    if fmt not in WRITERS:
+        raise ValueError("Unsupported output format: {}".format(fmt))
+    return WRITERS[fmt](stream, metrics, fields)
+
+
+def export_books(
+    books: Iterable[Book],
+    filename: Optional[str] = None,
+    fmt: str = "json",
+    compress: Optional[bool] = None,
+    metrics: Metrics = NULL_METRICS,
+    fields: Optional[Sequence[str]] = None,
+) -> int:
+    """Writes books to the file or stdout and returns their number"""
+    with open_output(filename, compress) as stream:
+        with get_writer(stream, fmt, metrics, fields) as writer:
+            return writer.write_all(books)
+
+
+class _UnclosedStream:
+    """Context manager for the streams that are not to be closed, e.g. stdout"""
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+
+    def __enter__(self):
+        return self.stream
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stream.flush()
@@ -0,0 +1,95 @@
+"""
+Helpers for the asyncio interface of the finders
+"""
+import asyncio
+import threading
+from typing import AsyncIterable, AsyncIterator, Awaitable, Iterable, TypeVar, Union
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def iterate_in_thread(iterable: Iterable[T], buffer_size=64) -> AsyncIterator[T]:
+    """
+    Consumes blocking iterable in the separate thread,
+    so that the event loop is not blocked while waiting for items.
+    At most buffer_size items are produced ahead of the consumer.
+    When the consumer stops early, the iterable is closed from
+    the producer thread, so that its cleanup runs there.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    free_slots = threading.Semaphore(buffer_size)
+    stopped = threading.Event()
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                free_slots.acquire()
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as err:
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, err))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+        finally:
+            # Generator can only be closed by the thread running it
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            free_slots.release()
+            yield item
+    finally:
+        stopped.set()
+        free_slots.release()
+
+
+async def as_completed_bounded(
+    awaitables: Union[Iterable[Awaitable[T]], AsyncIterable[Awaitable[T]]],
+    limit: int,
+) -> AsyncIterator["asyncio.Future[T]"]:
+    """
+    Schedules awaitables keeping at most limit of them pending
+    and yields them as they're done
+    """
+    if not isinstance(awaitables, AsyncIterable):
+        awaitables = _as_async_iterable(awaitables)
+    pending: set = set()
+    try:
+        async for awaitable in awaitables:
+            pending.add(asyncio.ensure_future(awaitable))
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+            else:
+                done = {future for future in pending if future.done()}
+                pending -= done
+            for future in done:
+                yield future
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                yield future
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _as_async_iterable(iterable: Iterable[T]) -> AsyncIterator[T]:
+    for item in iterable:
+        yield item
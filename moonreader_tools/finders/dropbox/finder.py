@@ -1,13 +1,30 @@
+import asyncio
+import functools
+import itertools
 import logging
+import os
+import zipfile
+from typing import Callable, Dict, List, Optional
 
+from moonreader_tools.cache import BookCache
+from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.finders.aio import as_completed_bounded, iterate_in_thread
+from moonreader_tools.finders.dropbox.scheduler import DownloadScheduler
+from moonreader_tools.finders.dropbox.sync import SyncState, sync_folder
 from moonreader_tools.finders.dropbox.utils import (
-    extract_book_paths_from_dir_entries,
     dicts_from_pairs,
+    download_file,
+    download_folder_zip,
+    iter_book_paths_from_dir_entries,
+    iter_folder_entries,
 )
+from moonreader_tools.instrumentation import CACHE, NULL_METRICS, PARSE, Metrics
+from moonreader_tools.parsers import StatsAccessor
 from moonreader_tools.parsers.base import BookParser
 from moonreader_tools.utils import (
     get_moonreader_files_from_filelist,
-    get_same_book_files,
+    iter_same_book_files,
     title_from_fname,
     get_book_type,
 )
@@ -18,19 +35,82 @@ class DropboxFinder:
 
     _DEFAULT_DROPBOX_PATH = "/Apps/Books/.Moon+/Cache"
 
-    def __init__(self, dropbox_client, books_path="", workers=8, logger=None):
+    # Dropbox limit of the number of entries in the folder archive
+    ZIP_MAX_ENTRIES = 10000
+    # Larger folders are downloaded file by file in bulk mode
+    BULK_MAX_SIZE = 1024**3
+    # Larger archives are kept in the temporary file instead of memory
+    ZIP_IN_MEMORY_SIZE = 64 * 1024**2
+    # Downloads are held while the books waiting to be consumed take that much
+    MAX_PENDING_BYTES = 64 * 1024**2
+
+    def __init__(
+        self,
+        dropbox_client,
+        books_path="",
+        workers=8,
+        logger=None,
+        sync_state: Optional[SyncState] = None,
+        cache: Optional[BookCache] = None,
+        metrics: Optional[Metrics] = None,
+        lazy_notes: bool = False,
+        bulk: bool = False,
+        bulk_max_size: Optional[int] = None,
+        max_pending_books: Optional[int] = None,
+        max_pending_bytes: Optional[int] = None,
+        scheduler_factory: Callable[..., DownloadScheduler] = DownloadScheduler,
+    ):
         """
 
         :param dropbox_client: Instantiated dropbox client
         :param books_path: Absolute path to dropbox's \
         dir with syncronized notes
-        :param workers: number of concurrent workers to download\
-        data from Dropbox
+        :param workers: maximum number of concurrent workers to download\
+        data from Dropbox, downloads start with fewer of them and their\
+        number adapts to the latency and throttling of the responses
+        :param sync_state: state of the previous run, if set along\
+        with the cache only the books changed since then are downloaded
+        :param cache: local store of the already downloaded books
+        :param metrics: collects time spent in every stage\
+        of reading books along with counters of bytes and notes
+        :param lazy_notes: whether only statistics files should be downloaded,\
+        notes files are downloaded on the first access to the book notes then;\
+        the sync state and the cache are not used in this mode
+        :param bulk: whether the whole folder should be downloaded\
+        as zip archive with a single request instead of downloading\
+        files one by one; used when all of the books are downloaded,\
+        i.e. not in incremental or lazy_notes modes
+        :param bulk_max_size: folders of larger total size are downloaded\
+        file by file even in bulk mode
+        :param max_pending_books: number of books being downloaded\
+        or downloaded and waiting to be consumed, limited by the\
+        number of workers if not set
+        :param max_pending_bytes: new downloads are not started while\
+        the downloaded books waiting to be consumed take that much
+        :param scheduler_factory: makes the scheduler of the downloads,\
+        called with DownloadScheduler arguments once for every run
         """
 
         self.__dropbox_client = dropbox_client
         self.books_path = books_path or self._DEFAULT_DROPBOX_PATH
         self.workers = workers
+        self.sync_state = sync_state
+        self.cache = cache
+        self.metrics = metrics or NULL_METRICS
+        self.max_pending_books = max_pending_books
+        self.max_pending_bytes = max_pending_bytes or self.MAX_PENDING_BYTES
+        self.scheduler_factory = scheduler_factory
+        self.lazy_notes = lazy_notes
+        self.bulk = bulk
+        self.bulk_max_size = bulk_max_size or self.BULK_MAX_SIZE
+
+    @property
+    def is_incremental(self) -> bool:
+        return (
+            self.sync_state is not None
+            and self.cache is not None
+            and not self.lazy_notes
+        )
 
     def get_books(self, path: str = "", book_count: int = None):
         """Obtains book objects from dropbox folder
@@ -38,33 +118,276 @@ class DropboxFinder:
         book data
         :param book_count: number of books to read
         """
+        path = self._resolve_path(path)
+        if self.is_incremental:
+            yield from self._get_books_incrementally(path, book_count)
+            return
+        if self.bulk and not self.lazy_notes:
+            yield from self._get_books_in_bulk(path, book_count)
+            return
+
+        display_paths = self._new_display_paths()
+        file_pairs = self._iter_file_pairs(path, book_count, display_paths)
+        for _, book in self._download_books(file_pairs, display_paths):
+            yield book
+
+    async def aget_books(
+        self, path: str = "", book_count: int = None, concurrency: int = None
+    ):
+        """
+        Asynchronous version of get_books:
+
+        async for book in finder.aget_books():
+            print(book.title)
+
+        Listing and downloads run in threads, downloads are scheduled
+        like in get_books: up to concurrency (finder's workers by default)
+        of them run at once and throttled ones are retried;
+        books are parsed in the default executor
+        """
+        path = self._resolve_path(path)
+        if self.is_incremental or (self.bulk and not self.lazy_notes):
+            async for book in iterate_in_thread(self.get_books(path, book_count)):
+                yield book
+            return
+
+        scheduler = self._new_scheduler(concurrency)
+        loop = asyncio.get_running_loop()
+        display_paths = self._new_display_paths()
+        book_dicts = dicts_from_pairs(
+            self.__dropbox_client,
+            self._iter_file_pairs(path, book_count, display_paths),
+            metrics=self.metrics,
+            skip_notes=self.lazy_notes,
+            scheduler=scheduler,
+            display_paths=display_paths,
+        )
+        # Downloaded books are not buffered, so that the scheduler
+        # holds new downloads while the parsing falls behind
+        books = (
+            loop.run_in_executor(None, self._make_book, book_dict)
+            async for book_dict in iterate_in_thread(book_dicts, buffer_size=1)
+        )
+        async for future in as_completed_bounded(books, scheduler.max_workers * 2):
+            try:
+                book = future.result()
+            except Exception:
+                self.metrics.incr("failures")
+                err_msg = "Exception occured when creating book object."
+                logging.exception(err_msg)
+            else:
+                self.metrics.incr("books")
+                yield book
+
+    def _resolve_path(self, path: str) -> str:
         if not path and not self.books_path:
             raise ValueError("Path to read data from is not specified")
-        if not path:
-            path = self.books_path
+        return path or self.books_path
+
+    def _new_scheduler(self, max_workers: Optional[int] = None) -> DownloadScheduler:
+        # Scheduler keeps the concurrency and statistics of the run,
+        # so concurrent runs can't share one
+        return self.scheduler_factory(
+            max_workers=max_workers or self.workers,
+            max_pending=self.max_pending_books,
+            max_pending_bytes=self.max_pending_bytes,
+            metrics=self.metrics,
+        )
+
+    def _new_display_paths(self) -> Optional[Dict[str, str]]:
+        """
+        Returns storage for the paths with the original case of the files
+        which are not downloaded, i.e. notes files in lazy_notes mode
+        """
+        return {} if self.lazy_notes else None
 
-        folder_contents = self.__dropbox_client.files_list_folder(path)
-        files = extract_book_paths_from_dir_entries(folder_contents.entries)
-        moonreader_files = get_moonreader_files_from_filelist(files)
+    def _iter_file_pairs(
+        self,
+        path: str,
+        book_count: Optional[int],
+        display_paths: Optional[Dict[str, str]] = None,
+    ):
+        # Listing, pairing and downloading are chained lazily,
+        # so books start downloading before the whole folder is listed
+        entries = iter_folder_entries(self.__dropbox_client, path, self.metrics)
+        if display_paths is not None:
+            entries = _record_display_paths(entries, display_paths)
+        files = iter_book_paths_from_dir_entries(entries)
+        file_pairs = iter_same_book_files(files)
         if book_count is not None:
-            file_pairs = get_same_book_files(moonreader_files)[:book_count]
-        else:
-            file_pairs = get_same_book_files(moonreader_files)
+            file_pairs = itertools.islice(file_pairs, book_count)
+        return file_pairs
+
+    def _get_books_incrementally(self, path: str, book_count: Optional[int]):
+        """
+        Lists only the changes made since the previous run and
+        downloads books whose files content hash has changed,
+        the rest of the books is taken from the cache
+        """
+        sync_folder(self.__dropbox_client, path, self.sync_state, self.metrics)
+        moonreader_files = get_moonreader_files_from_filelist(self.sync_state.files)
+        file_pairs = itertools.islice(
+            iter_same_book_files(moonreader_files), book_count
+        )
+
+        changed_pairs = {}
+        try:
+            for pair in file_pairs:
+                key = os.path.splitext(pair[0] or pair[1])[0]
+                fingerprint = self.sync_state.fingerprint(*pair)
+                with self.metrics.stage(CACHE):
+                    book = self.cache.get(key, fingerprint)
+                if book is None:
+                    self.metrics.incr("cache_misses")
+                    changed_pairs[pair] = key, fingerprint
+                else:
+                    self.metrics.incr("cache_hits")
+                    self.metrics.incr("books")
+                    yield book
+            for pair, book in self._download_books(list(changed_pairs)):
+                with self.metrics.stage(CACHE):
+                    self.cache.put(*changed_pairs[pair], book)
+                yield book
+        finally:
+            self.cache.flush()
+            self.sync_state.save()
+
+    def _get_books_in_bulk(self, path: str, book_count: Optional[int]):
+        """
+        Downloads the whole folder as zip archive and parses
+        books files straight from it, the folder is downloaded
+        file by file if it is too large for the archive
+        """
+        entries = list(iter_folder_entries(self.__dropbox_client, path, self.metrics))
+        file_pairs = itertools.islice(
+            iter_same_book_files(iter_book_paths_from_dir_entries(entries)),
+            book_count,
+        )
+        sizes = [getattr(entry, "size", None) for entry in entries]
+        # Sizes of the subfolders are not listed
+        total_size = None if None in sizes else sum(sizes)
+        if (
+            total_size is None
+            or total_size > self.bulk_max_size
+            or len(entries) >= self.ZIP_MAX_ENTRIES
+        ):
+            logging.info("Folder is too large to be downloaded at once: %s", path)
+            for _, book in self._download_books(file_pairs):
+                yield book
+            return
 
+        display_paths = {entry.path_lower: entry.path_display for entry in entries}
+        archive = download_folder_zip(
+            self.__dropbox_client,
+            path,
+            in_memory=total_size <= self.ZIP_IN_MEMORY_SIZE,
+            metrics=self.metrics,
+        )
+        with archive, zipfile.ZipFile(archive) as zip_file:
+            # Archive members are named after the folder and files
+            # with their original case, e.g. Cache/Book.pdf.an
+            members = {
+                os.path.basename(name).lower(): name
+                for name in zip_file.namelist()
+                if not name.endswith("/")
+            }
+            for pair in file_pairs:
+                try:
+                    book_dict = {"pair": pair}
+                    for key, file_path in zip(("note_file", "stat_file"), pair):
+                        book_dict[key] = self._open_archived_file(
+                            zip_file, members, display_paths, file_path
+                        )
+                    book = self._book_from_dict(book_dict, self.metrics)
+                except Exception:
+                    self.metrics.incr("failures")
+                    err_msg = "Exception occured when creating book object."
+                    logging.exception(err_msg)
+                else:
+                    self.metrics.incr("books")
+                    yield book
+
+    def _open_archived_file(
+        self,
+        zip_file: zipfile.ZipFile,
+        members: Dict[str, str],
+        display_paths: Dict[str, str],
+        path: str,
+    ):
+        if not path:
+            return "", None
+        name = members.get(os.path.basename(path))
+        if name is None:
+            # File was added to the folder after it had been listed
+            return download_file(self.__dropbox_client, path, self.metrics)
+        return display_paths.get(path, path), zip_file.open(name)
+
+    def _download_books(self, file_pairs, display_paths=None):
+        """Downloads books files and yields (pair, book) tuples"""
         for book_dict in dicts_from_pairs(
-            self.__dropbox_client, file_pairs, workers=self.workers
+            self.__dropbox_client,
+            file_pairs,
+            workers=self.workers,
+            metrics=self.metrics,
+            skip_notes=self.lazy_notes,
+            scheduler=self._new_scheduler(),
+            display_paths=display_paths,
         ):
             try:
-                note_file, stat_file = book_dict["note_file"], book_dict["stat_file"]
-                book_name = title_from_fname(note_file[0] or stat_file[0])
-                book_type = get_book_type(note_file[0] or stat_file[0])
-                with BookParser(book_type=book_type) as reader:
-                    reader = (
-                        reader.set_notes_fobj(note_file[1])
-                        .set_stats_fobj(stat_file[1])
-                        .set_book_name(book_name)
-                    )
-                    yield reader.build()
+                book = self._make_book(book_dict)
             except Exception:
+                self.metrics.incr("failures")
                 err_msg = "Exception occured when creating book object."
                 logging.exception(err_msg)
+            else:
+                self.metrics.incr("books")
+                yield book_dict["pair"], book
+
+    def _make_book(self, book_dict) -> Book:
+        if self.lazy_notes:
+            return self._lazy_book_from_dict(book_dict)
+        return self._book_from_dict(book_dict, self.metrics)
+
+    def _lazy_book_from_dict(self, book_dict) -> Book:
+        """Builds book from the statistics, notes are downloaded on access"""
+        note_path, _ = book_dict["note_file"]
+        stat_path, stat_fobj = book_dict["stat_file"]
+        # Both paths have the original case: downloaded statistics file
+        # has it in the metadata, notes file path is taken from the listing
+        book_name = title_from_fname(stat_path or note_path)
+        book_type = get_book_type(stat_path or note_path)
+        stats = None
+        if stat_fobj is not None:
+            with self.metrics.stage(PARSE):
+                stats = StatsAccessor.stats_from_file_obj(stat_fobj, self.metrics)
+        notes_loader = None
+        if note_path:
+            notes_loader = functools.partial(self._download_notes, note_path, book_type)
+        return Book(book_name, stats=stats, notes_loader=notes_loader)
+
+    def _download_notes(self, path: str, book_type: str) -> List[Note]:
+        _, notes_fobj = download_file(self.__dropbox_client, path, self.metrics)
+        note_reader = BookParser(book_type).get_note_reader_by_type(book_type)
+        with self.metrics.stage(PARSE):
+            notes = note_reader.from_file_obj(notes_fobj, metrics=self.metrics)
+        self.metrics.incr("notes", len(notes))
+        return notes
+
+    @staticmethod
+    def _book_from_dict(book_dict, metrics: Metrics = NULL_METRICS) -> Book:
+        note_file, stat_file = book_dict["note_file"], book_dict["stat_file"]
+        book_name = title_from_fname(note_file[0] or stat_file[0])
+        book_type = get_book_type(note_file[0] or stat_file[0])
+        with BookParser(book_type=book_type, metrics=metrics) as reader:
+            reader = (
+                reader.set_notes_fobj(note_file[1])
+                .set_stats_fobj(stat_file[1])
+                .set_book_name(book_name)
+            )
+            return reader.build()
+
+
+def _record_display_paths(entries, display_paths: Dict[str, str]):
+    for entry in entries:
+        display_paths[entry.path_lower] = entry.path_display
+        yield entry
@@ -0,0 +1,290 @@
+"""
+Schedules downloads from dropbox, adapting the number of concurrent
+ones to the latency and errors of the responses
+"""
+import collections
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import requests
+from dropbox.exceptions import InternalServerError, RateLimitError
+
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Errors worth retrying the download after, HTTP client errors
+# are not subclasses of the builtin ConnectionError and TimeoutError
+TRANSIENT_ERRORS = (
+    RateLimitError,
+    InternalServerError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Weight of the latest response in the smoothed latency
+LATENCY_SMOOTHING = 0.2
+
+_END = object()
+
+
+class DownloadScheduler:
+    """
+    Runs downloads in the thread pool, starting with a few concurrent
+    ones. Concurrency grows by one after every window of successful
+    downloads with the latency close to the best one seen and is halved
+    when downloads are throttled or fail with the transient errors.
+    Such downloads are retried after the jittered exponential backoff
+    or the delay requested by the server.
+
+    Every run resets the statistics and adapts the concurrency of
+    the scheduler, so concurrent runs need schedulers of their own.
+
+    Usage example:
+
+    scheduler = DownloadScheduler(max_workers=16)
+    for future in scheduler.run(download, paths):
+        print(future.result())
+    print(scheduler.report())
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        initial_workers: int = 2,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 60.0,
+        latency_factor: float = 2.0,
+        max_pending: Optional[int] = None,
+        max_pending_bytes: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """
+        :param max_workers: upper limit of the concurrent downloads
+        :param initial_workers: concurrent downloads to start with
+        :param max_retries: number of times the download failed\
+        with the transient error is retried before giving up
+        :param backoff: base delay before the first retry, in seconds
+        :param max_backoff: upper limit of the delay before the retry
+        :param latency_factor: downloads slower than the best one\
+        by more than this factor don't let concurrency grow
+        :param max_pending: upper limit of the items being downloaded\
+        or downloaded and not consumed yet, limited by concurrency only\
+        if not set
+        :param max_pending_bytes: new downloads are not started while\
+        the downloaded and not consumed results take that much
+        """
+        self.max_workers = max(1, max_workers)
+        self.concurrency = max(1, min(initial_workers, self.max_workers))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.latency_factor = latency_factor
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.metrics = metrics
+        self._clock = clock
+        self._sleep = sleep
+        self._latency: Optional[float] = None
+        self._best_latency = float("inf")
+        self._successes = 0
+        self._hold_until = 0.0
+        self._reset_stats()
+
+    def run(
+        self,
+        func: Callable[[T], R],
+        items: Iterable[T],
+        size: Optional[Callable[[R], int]] = None,
+    ) -> Iterator["Future[R]"]:
+        """
+        Calls func for every item, yielding futures of the finished calls
+        as soon as they are done. Calls failed with transient errors
+        are retried, so only their final outcome is yielded.
+
+        Items are taken from the iterable and submitted only when
+        the previous results are consumed: at most max_pending items
+        are downloaded or waiting to be yielded, and no new ones are
+        submitted while the finished results hold max_pending_bytes
+        (as measured by size) or more. Closing the generator cancels
+        the downloads, the running ones are abandoned.
+        """
+        self._reset_stats()
+        items = iter(items)
+        exhausted = False
+        sequence = itertools.count()
+        # Retries are kept ordered by the time they may be run at
+        retries: List[Tuple[float, int, T, int]] = []
+        running: Dict[Future, Tuple[T, int, float]] = {}
+        finished: Deque[Tuple[Future, int]] = collections.deque()
+        finished_bytes = 0
+        started = self._clock()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while True:
+                now = self._clock()
+                while self._has_free_slot(len(running), len(finished), finished_bytes):
+                    if retries and retries[0][0] <= now:
+                        _, _, item, attempt = heapq.heappop(retries)
+                    elif not exhausted:
+                        item, attempt = next(items, _END), 0  # type: ignore
+                        if item is _END:
+                            exhausted = True
+                            continue
+                    else:
+                        break
+                    future = executor.submit(func, item)
+                    running[future] = item, attempt, self._clock()
+                if finished:
+                    future, result_size = finished.popleft()
+                    finished_bytes -= result_size
+                    yield future
+                    continue
+                if not running:
+                    if not retries:
+                        break
+                    self._sleep(max(0.0, retries[0][0] - now))
+                    continue
+                timeout = max(0.0, retries[0][0] - now) if retries else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, attempt, submitted = running.pop(future)
+                    if self._should_retry(future, attempt, submitted):
+                        delay = self._retry_delay(future.exception(), attempt)
+                        self._on_throttled(delay)
+                        retry_at = self._clock() + delay
+                        heapq.heappush(
+                            retries, (retry_at, next(sequence), item, attempt + 1)
+                        )
+                        continue
+                    result_size = 0
+                    if size is not None and future.exception() is None:
+                        result_size = size(future.result())
+                    finished.append((future, result_size))
+                    finished_bytes += result_size
+        finally:
+            for future in running:
+                future.cancel()
+            # Running downloads can't be interrupted, they are left
+            # to finish in the background and their results are dropped
+            executor.shutdown(wait=False)
+            running.clear()
+            finished.clear()
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            self._stats["seconds"] = self._clock() - started
+            logger.info(
+                "Downloaded %d items in %.2fs (%.1f items/s), "
+                "%d retries, concurrency %d",
+                self._stats["completed"],
+                self._stats["seconds"],
+                self.throughput(),
+                self._stats["retries"],
+                self.concurrency,
+            )
+
+    def throughput(self) -> float:
+        """Items downloaded per second during the last run"""
+        seconds = self._stats["seconds"]
+        return self._stats["completed"] / seconds if seconds else 0.0
+
+    def report(self) -> dict:
+        """Returns statistics of the last run, suitable for JSON"""
+        return dict(
+            self._stats,
+            items_per_second=self.throughput(),
+            concurrency=self.concurrency,
+        )
+
+    def _reset_stats(self) -> None:
+        self._stats = {
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "seconds": 0.0,
+            "max_concurrency": self.concurrency,
+        }
+
+    def _has_free_slot(self, running: int, finished: int, finished_bytes: int) -> bool:
+        if running >= self.concurrency:
+            return False
+        if not running and not finished:
+            # Single item is always allowed, however large it is
+            return True
+        if self.max_pending is not None and running + finished >= self.max_pending:
+            return False
+        return self.max_pending_bytes is None or finished_bytes < self.max_pending_bytes
+
+    def _should_retry(self, future: Future, attempt: int, submitted: float) -> bool:
+        err = future.exception()
+        if err is None:
+            self._on_success(self._clock() - submitted)
+            return False
+        if isinstance(err, TRANSIENT_ERRORS) and attempt < self.max_retries:
+            logger.info("Download failed and is to be retried: %r", err)
+            return True
+        self._stats["failed"] += 1
+        return False
+
+    def _on_success(self, latency: float) -> None:
+        self._stats["completed"] += 1
+        # Latency is smoothed, so that single fast or slow responses
+        # don't affect the concurrency much
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+        self._best_latency = min(self._best_latency, self._latency)
+        if self._latency > self._best_latency * self.latency_factor:
+            # Responses slow down, the link or the server is saturated
+            self._successes = 0
+            return
+        self._successes += 1
+        if self._successes >= self.concurrency and self.concurrency < self.max_workers:
+            self.concurrency += 1
+            self._successes = 0
+            self._stats["max_concurrency"] = max(
+                self._stats["max_concurrency"], self.concurrency
+            )
+
+    def _on_throttled(self, delay: float) -> None:
+        self._stats["retries"] += 1
+        self.metrics.incr("retries")
+        self._successes = 0
+        now = self._clock()
+        # Downloads running along with the throttled one are likely
+        # to fail too, concurrency is decreased once for all of them
+        if now >= self._hold_until:
+            self.concurrency = max(1, self.concurrency // 2)
+            self._hold_until = now + delay
+
+    def _retry_delay(self, err: BaseException, attempt: int) -> float:
+        server_backoff = getattr(err, "backoff", None)
+        if server_backoff:
+            return server_backoff + random.uniform(0, self.backoff)
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return random.uniform(delay / 2, delay)
@@ -0,0 +1,107 @@
+"""
+Contains the state allowing to list only the changes
+of the dropbox folder made since the previous run
+"""
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Iterable, Optional
+
+import dropbox
+
+from moonreader_tools.instrumentation import LIST, NULL_METRICS, Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SyncState:
+    """
+    Dropbox list cursor and content hashes of the files
+    seen in the folder, persisted as JSON between runs
+    """
+
+    def __init__(self, filename: str = "") -> None:
+        self.filename = filename
+        self.path = ""
+        self.cursor = ""
+        self.files: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, filename: str) -> "SyncState":
+        """Reads the state from file, missing file gives an empty state"""
+        state = cls(filename)
+        if not os.path.exists(filename):
+            return state
+        with open(filename, encoding="utf-8") as state_file:
+            data = json.load(state_file)
+        state.path = data.get("path", "")
+        state.cursor = data.get("cursor", "")
+        state.files = data.get("files", {})
+        return state
+
+    def save(self) -> None:
+        """Atomically replaces the state file with the current state"""
+        if not self.filename:
+            return
+        data = {"path": self.path, "cursor": self.cursor, "files": self.files}
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fd, temp_name = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+                json.dump(data, temp_file, ensure_ascii=False)
+            os.replace(temp_name, self.filename)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+
+    def reset(self, path: str) -> None:
+        self.path = path
+        self.cursor = ""
+        self.files = {}
+
+    def apply_entries(self, entries: Iterable) -> None:
+        """
+        Updates known files with dropbox metadata entries;
+        entries without content hash (deleted files or folders)
+        are forgotten
+        """
+        for entry in entries:
+            content_hash = getattr(entry, "content_hash", None)
+            if content_hash:
+                self.files[entry.path_lower] = content_hash
+            else:
+                self.files.pop(entry.path_lower, None)
+
+    def fingerprint(self, *paths: Optional[str]) -> str:
+        """Identifies the state of the book files by their content hashes"""
+        return "|".join(self.files.get(path, "-") if path else "-" for path in paths)
+
+
+def sync_folder(
+    client: dropbox.Dropbox,
+    path: str,
+    state: SyncState,
+    metrics: Metrics = NULL_METRICS,
+) -> None:
+    """
+    Brings the state up to date with the dropbox folder,
+    listing only the changes if the state has a cursor for the path
+    """
+    result = None
+    if state.cursor and state.path == path:
+        try:
+            with metrics.stage(LIST):
+                result = client.files_list_folder_continue(state.cursor)
+        except dropbox.exceptions.ApiError:
+            logger.warning("Dropbox cursor for %s is outdated, listing again.", path)
+    if result is None:
+        state.reset(path)
+        with metrics.stage(LIST):
+            result = client.files_list_folder(path)
+    state.apply_entries(result.entries)
+    while result.has_more:
+        with metrics.stage(LIST):
+            result = client.files_list_folder_continue(result.cursor)
+        state.apply_entries(result.entries)
+    state.cursor = result.cursor
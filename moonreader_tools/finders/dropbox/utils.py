@@ -1,10 +1,15 @@
+import contextlib
+import functools
 import io
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Tuple, Optional
+import tempfile
+from typing import IO, Dict, Tuple, Optional
 
 import dropbox
 
+from moonreader_tools.finders.dropbox.scheduler import DownloadScheduler
+from moonreader_tools.instrumentation import DOWNLOAD, LIST, NULL_METRICS, Metrics
+
 # urllib3 produces noisy exceptions we disable
 logging.getLogger("urllib3.connectionpool").setLevel(logging.CRITICAL)
 
@@ -17,53 +22,155 @@ def extract_book_paths_from_dir_entries(entries):
     return [entry.path_lower for entry in entries]
 
 
-def dicts_from_pairs(client: dropbox.Dropbox, pairs, workers=8):
-    """This method requires rewriting"""
-    futures = set()
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        for i, pair in enumerate(pairs):
-            future = executor.submit(get_book_dict, client, pair)
-            futures.add(future)
-        try:
-            for future in as_completed(futures):
-                err = future.exception()
-                if err is None:
-                    yield future.result()
-                else:
-                    err_msg = "Error obtaining book dictionary data: {}"
-                    logger.error(err_msg.format(err))
-        except KeyboardInterrupt:
-            for future in futures:
-                future.cancel()
-            executor.shutdown()
-
-
-def get_book_dict(client: dropbox.Dropbox, pair: Tuple[Optional[str], Optional[str]]):
-    """This method requires rewriting"""
-    book_files_dict = {}
-    if not pair[0]:
-        metadata, response = client.files_download(pair[1])
-        book_files_dict["stat_file"] = (
-            metadata.path_display,
-            io.BytesIO(response.content),
-        )
-        book_files_dict["note_file"] = "", None
-    elif not pair[1]:
-        metadata, response = client.files_download(pair[0])
-        book_files_dict["note_file"] = (
-            metadata.path_display,
-            io.BytesIO(response.content),
-        )
-        book_files_dict["stat_file"] = "", None
-    else:
-        metadata_0, response_0 = client.files_download(pair[0])
-        metadata_1, response_1 = client.files_download(pair[1])
-        book_files_dict["note_file"] = (
-            metadata_0.path_display,
-            io.BytesIO(response_0.content),
-        )
-        book_files_dict["stat_file"] = (
-            metadata_1.path_display,
-            io.BytesIO(response_1.content),
+def iter_book_paths_from_dir_entries(entries):
+    """Lazily extracts paths from dropbox metadata objects"""
+    return (entry.path_lower for entry in entries)
+
+
+def iter_folder_entries(
+    client: dropbox.Dropbox, path: str, metrics: Metrics = NULL_METRICS
+):
+    """Yields metadata of every folder entry, following all of the pages"""
+    with metrics.stage(LIST):
+        result = client.files_list_folder(path)
+    yield from result.entries
+    while result.has_more:
+        with metrics.stage(LIST):
+            result = client.files_list_folder_continue(result.cursor)
+        yield from result.entries
+
+
+def dicts_from_pairs(
+    client: dropbox.Dropbox,
+    pairs,
+    workers=8,
+    metrics: Metrics = NULL_METRICS,
+    skip_notes: bool = False,
+    scheduler: Optional[DownloadScheduler] = None,
+    max_pending: Optional[int] = None,
+    max_pending_bytes: Optional[int] = None,
+    display_paths: Optional[Dict[str, str]] = None,
+):
+    """
+    Downloads files of the book pairs, yielding downloaded books
+    while the pairs are still being produced. Number of concurrent
+    downloads adapts to the responses up to the given workers,
+    throttled and timed out downloads are retried.
+    New downloads are started only as the books are consumed,
+    closing the generator cancels the pending ones
+
+    :param scheduler: scheduler to run downloads with, it keeps\
+    the concurrency learned by the previous runs
+    :param max_pending: number of books downloaded or waiting\
+    to be consumed at once, ignored if scheduler is given
+    :param max_pending_bytes: size of the downloaded books waiting\
+    to be consumed new downloads are held at, ignored if scheduler is given
+    :param display_paths: see get_book_dict
+    """
+    if scheduler is None:
+        scheduler = DownloadScheduler(
+            max_workers=workers,
+            max_pending=max_pending,
+            max_pending_bytes=max_pending_bytes,
+            metrics=metrics,
         )
+    download = functools.partial(
+        get_book_dict,
+        client,
+        metrics=metrics,
+        skip_notes=skip_notes,
+        display_paths=display_paths,
+    )
+    futures = scheduler.run(download, pairs, size=book_dict_size)
+    try:
+        yield from _results_of_futures(futures, metrics)
+    finally:
+        futures.close()
+
+
+def book_dict_size(book_dict) -> int:
+    """Returns number of bytes taken by the downloaded files of the book"""
+    size = 0
+    for _, file_obj in (book_dict["note_file"], book_dict["stat_file"]):
+        if isinstance(file_obj, io.BytesIO):
+            with file_obj.getbuffer() as view:
+                size += view.nbytes
+    return size
+
+
+def _results_of_futures(futures, metrics: Metrics = NULL_METRICS):
+    for future in futures:
+        err = future.exception()
+        if err is None:
+            yield future.result()
+        else:
+            metrics.incr("failures")
+            err_msg = "Error obtaining book dictionary data: {}"
+            logger.error(err_msg.format(err))
+
+
+def get_book_dict(
+    client: dropbox.Dropbox,
+    pair: Tuple[Optional[str], Optional[str]],
+    metrics: Metrics = NULL_METRICS,
+    skip_notes: bool = False,
+    display_paths: Optional[Dict[str, str]] = None,
+):
+    """
+    Downloads notes and statistics files of the book,
+    missing files are represented with ("", None)
+
+    :param skip_notes: whether only statistics file should be downloaded,\
+    notes file is represented with (path, None) then
+    :param display_paths: paths with the original case by the lowercased\
+    ones, used for the files which are not downloaded; paths of the pair\
+    are removed from it
+    """
+    book_files_dict = {"pair": pair}
+    for key, path in zip(("note_file", "stat_file"), pair):
+        display_path = path
+        if path and display_paths is not None:
+            display_path = display_paths.pop(path, path)
+        if not path:
+            book_files_dict[key] = ("", None)
+        elif skip_notes and key == "note_file":
+            book_files_dict[key] = (display_path, None)
+        else:
+            book_files_dict[key] = download_file(client, path, metrics)
     return book_files_dict
+
+
+def download_file(
+    client: dropbox.Dropbox, path: str, metrics: Metrics = NULL_METRICS
+) -> Tuple[str, io.BytesIO]:
+    """Downloads the file, returning its path and content"""
+    with metrics.stage(DOWNLOAD):
+        metadata, response = client.files_download(path)
+        content = response.content
+    metrics.incr("bytes_downloaded", len(content))
+    return metadata.path_display, io.BytesIO(content)
+
+
+def download_folder_zip(
+    client: dropbox.Dropbox,
+    path: str,
+    in_memory: bool = True,
+    metrics: Metrics = NULL_METRICS,
+) -> IO[bytes]:
+    """
+    Downloads the whole folder as zip archive with a single request,
+    the archive is kept in memory or in the temporary file
+    """
+    archive: IO[bytes] = io.BytesIO() if in_memory else tempfile.TemporaryFile()
+    try:
+        with metrics.stage(DOWNLOAD):
+            _, response = client.files_download_zip(path)
+            with contextlib.closing(response):
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    archive.write(chunk)
+        metrics.incr("bytes_downloaded", archive.tell())
+        archive.seek(0)
+    except BaseException:
+        archive.close()
+        raise
+    return archive
@@ -0,0 +1,92 @@
+"""
+Discovery of MoonReader files in the local directories
+"""
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from moonreader_tools.conf import NOTE_EXTENSION, STAT_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+MOONREADER_SUFFIXES = (NOTE_EXTENSION, STAT_EXTENSION)
+
+PathLike = Union[str, "os.PathLike[str]"]
+
+
+def scan_directory(
+    path: PathLike, suffixes=MOONREADER_SUFFIXES, recursive: bool = False
+) -> Tuple[List[os.DirEntry], List[str]]:
+    """
+    Lists the directory once, returning entries of the files
+    with the given suffixes and paths of the subdirectories
+    to be scanned (if recursive).
+
+    Entries are filtered by their names and the file type
+    reported by the directory listing itself, so no extra
+    system calls are made for the skipped ones.
+    """
+    files, subdirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffixes):
+                if entry.is_file():
+                    files.append(entry)
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+    return files, subdirs
+
+
+def scan_files(
+    roots: Iterable[PathLike],
+    suffixes=MOONREADER_SUFFIXES,
+    recursive: bool = False,
+    workers: int = 8,
+) -> Iterator[os.DirEntry]:
+    """
+    Yields entries of the files with the given suffixes found
+    in the roots and, if recursive, in all of their subdirectories.
+    Directories are listed in the thread pool of the given size,
+    entries are yielded as soon as their directory is listed,
+    so they come in no particular order across directories.
+    Symlinks to directories are not followed. Subdirectories
+    that can't be listed are logged and skipped.
+    """
+    roots = [os.fspath(root) for root in roots]
+    if workers <= 1 or (len(roots) == 1 and not recursive):
+        yield from _scan_serially(roots, suffixes, recursive)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {
+            executor.submit(scan_directory, root, suffixes, recursive) for root in roots
+        }
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        files, subdirs = future.result()
+                    except OSError as err:
+                        logger.warning("Directory can't be listed: %s", err)
+                        continue
+                    for subdir in subdirs:
+                        pending.add(
+                            executor.submit(scan_directory, subdir, suffixes, True)
+                        )
+                    yield from files
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _scan_serially(roots: List[str], suffixes, recursive: bool):
+    directories = list(reversed(roots))
+    while directories:
+        try:
+            files, subdirs = scan_directory(directories.pop(), suffixes, recursive)
+        except OSError as err:
+            logger.warning("Directory can't be listed: %s", err)
+            continue
+        directories.extend(reversed(subdirs))
+        yield from files
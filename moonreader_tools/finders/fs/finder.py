@@ -1,16 +1,142 @@
+import asyncio
+import collections
+import functools
+import heapq
+import io
+import itertools
 import logging
+import os
 import pathlib
-from typing import Optional
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+from moonreader_tools.cache import BookCache, file_fingerprint
+from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.finders.aio import as_completed_bounded, iterate_in_thread
+from moonreader_tools.finders.fs.discovery import scan_files
+from moonreader_tools.instrumentation import (
+    CACHE,
+    LIST,
+    NULL_METRICS,
+    OPEN,
+    PARSE,
+    READ,
+    Metrics,
+)
+from moonreader_tools.parsers import StatsAccessor
 from moonreader_tools.parsers.base import BookParser
 from moonreader_tools.utils import (
-    get_moonreader_files,
-    get_same_book_files,
+    iter_same_book_files,
     title_from_fname,
     get_book_type,
 )
 
 
+def parse_book(note_file: str, stat_file: str, metrics: Metrics = NULL_METRICS) -> Book:
+    """Builds book from the pair of its notes and statistics files"""
+    book_name = title_from_fname(note_file or stat_file)
+    book_type = get_book_type(note_file or stat_file)
+    with BookParser(book_type=book_type, metrics=metrics) as reader:
+        reader = (
+            reader.set_notes_file(note_file)
+            .set_stats_file(stat_file)
+            .set_book_name(book_name)
+        )
+        return reader.build()
+
+
+def parse_notes(
+    note_file: str, book_type: str, metrics: Metrics = NULL_METRICS
+) -> List[Note]:
+    """Parses notes file of the book"""
+    note_reader = BookParser(book_type).get_note_reader_by_type(book_type)
+    with metrics.stage(OPEN):
+        notes_fobj = open(note_file, "rb")
+    with notes_fobj, metrics.stage(PARSE):
+        notes = note_reader.from_file_obj(notes_fobj, metrics=metrics)
+    metrics.incr("notes", len(notes))
+    return notes
+
+
+def parse_book_lazily(
+    note_file: str, stat_file: str, metrics: Metrics = NULL_METRICS
+) -> Book:
+    """
+    Builds book from its statistics file only,
+    notes file is parsed on the first access to the notes
+    """
+    book_name = title_from_fname(note_file or stat_file)
+    book_type = get_book_type(note_file or stat_file)
+    stats = None
+    if stat_file:
+        _, stat_content = read_book_files("", stat_file, metrics)
+        with metrics.stage(PARSE):
+            stats = StatsAccessor.stats_from_file_obj(io.BytesIO(stat_content))
+    notes_loader = None
+    if note_file:
+        notes_loader = functools.partial(parse_notes, note_file, book_type, metrics)
+    return Book(book_name, stats=stats, notes_loader=notes_loader)
+
+
+def parse_book_record(note_file: str, stat_file: str) -> tuple:
+    """
+    Runs in the worker process, the book is returned
+    in the compact form to be cheaply passed between processes
+    """
+    return parse_book(note_file, stat_file).to_record()
+
+
+def parse_book_record_with_metrics(note_file: str, stat_file: str) -> tuple:
+    """Version of parse_book_record also returning metrics of the worker"""
+    metrics = Metrics()
+    record = parse_book(note_file, stat_file, metrics).to_record()
+    return record, metrics.report()
+
+
+def read_book_files(note_file: str, stat_file: str, metrics: Metrics = NULL_METRICS):
+    """Reads content of the book files, None is returned for missing ones"""
+    contents = []
+    for fname in (note_file, stat_file):
+        if not fname:
+            contents.append(None)
+            continue
+        with metrics.stage(READ), open(fname, "rb") as f:
+            contents.append(f.read())
+        metrics.incr("bytes_read", len(contents[-1]))
+    return tuple(contents)
+
+
+def parse_book_contents(
+    note_file: str,
+    stat_file: str,
+    note_content,
+    stat_content,
+    metrics: Metrics = NULL_METRICS,
+):
+    """Builds book from already read content of its files"""
+    book_name = title_from_fname(note_file or stat_file)
+    book_type = get_book_type(note_file or stat_file)
+    with BookParser(book_type=book_type, metrics=metrics) as reader:
+        reader.set_book_name(book_name)
+        if note_content is not None:
+            reader.set_notes_fobj(io.BytesIO(note_content))
+        if stat_content is not None:
+            reader.set_stats_fobj(io.BytesIO(stat_content))
+        return reader.build()
+
+
+def parse_book_contents_record(*args) -> tuple:
+    """Version of parse_book_contents to be run in the worker process"""
+    return parse_book_contents(*args).to_record()
+
+
 class FilesystemFinder:
     """Class to obtain books from file system
     Usage example:
@@ -18,29 +144,403 @@ class FilesystemFinder:
     extractor = FilesystemDownloader('/some/path/')
     for book in extractor.get_books():
         print(book.title)
+
+    Several directories may be given, their subdirectories
+    are searched too if recursive is set:
+
+    extractor = FilesystemDownloader(['/some/path/', '/other/path'], recursive=True)
     """
 
-    def __init__(self, path=""):
-        self.path = pathlib.Path(path)
+    # Starting the process pool costs more than parsing
+    # of the small libraries serially
+    PARALLEL_THRESHOLD = 64
+
+    # Ways to tell how recently the book was read, see get_recent_books
+    RECENCY_KEYS = ("timestamp", "mtime")
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike, Iterable[Union[str, os.PathLike]]] = "",
+        cache: Optional[BookCache] = None,
+        hash_content: bool = False,
+        workers: int = 1,
+        executor: Optional[Executor] = None,
+        ordered: bool = True,
+        metrics: Optional[Metrics] = None,
+        recursive: bool = False,
+        scan_workers: int = 8,
+        lazy_notes: bool = False,
+    ):
+        """
+        :param path: directory with MoonReader files or list of them
+        :param cache: cache of already parsed books, books\
+        whose files have not changed are not parsed again
+        :param hash_content: whether file content hash should be\
+        taken into account when checking if cached book is stale
+        :param workers: number of processes to parse books in
+        :param executor: executor to parse books in instead of\
+        the process pool created for every get_books call
+        :param ordered: whether books parsed in parallel should be\
+        returned in the order of files, or as soon as they're parsed
+        :param metrics: collects time spent in every stage\
+        of reading books along with counters of bytes and notes
+        :param recursive: whether subdirectories should be searched too
+        :param scan_workers: number of threads listing directories
+        :param lazy_notes: whether only statistics files should be parsed,\
+        notes files are parsed on the first access to the book notes then
+        """
+        if isinstance(path, (str, os.PathLike)):
+            path = [path]
+        self.paths = [pathlib.Path(p) for p in path]
+        self.path = self.paths[0] if self.paths else pathlib.Path("")
+        self.cache = cache
+        self.hash_content = hash_content
+        self.workers = workers
+        self.executor = executor
+        self.ordered = ordered
+        self.metrics = metrics or NULL_METRICS
+        self.recursive = recursive
+        self.scan_workers = scan_workers
+        self.lazy_notes = lazy_notes
 
     def get_books(self, book_count: Optional[int] = None):
-        """Obtains book objects from local directory"""
-        if not self.path.exists() or not self.path.is_dir():
-            raise ValueError("Path does not exist or is not a dir.")
+        """
+        Obtains book objects from local directory
 
-        moonreader_files = get_moonreader_files(self.path)
-        tuples = get_same_book_files(moonreader_files)
+        :param book_count: number of books to read, directories\
+        are not listed any further once they are found
+        """
+        self._check_paths()
+
+        # Directories are listed, files are paired and books
+        # are parsed at the same time
+        entries = self._new_entries()
+        book_files = self._iter_book_files(entries)
+        pairs = itertools.islice(book_files, book_count)
+        try:
+            if self.lazy_notes:
+                # Statistics files are too small to be parsed in parallel
+                yield from self._get_books_serially(pairs, entries)
+                return
+            if self.executor is not None:
+                yield from self._get_books_in_executor(pairs, entries, self.executor)
+                return
+            head = []
+            if self.workers > 1:
+                head = list(itertools.islice(pairs, self.PARALLEL_THRESHOLD))
+            tuples = itertools.chain(head, pairs)
+            if len(head) >= self.PARALLEL_THRESHOLD:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    yield from self._get_books_in_executor(tuples, entries, executor)
+            else:
+                yield from self._get_books_serially(tuples, entries)
+        finally:
+            book_files.close()
+            if self.cache is not None:
+                self.cache.flush()
+
+    def get_recent_books(self, count: int, by: str = "timestamp") -> Iterator[Book]:
+        """
+        Obtains count most recently read books, the most recent first.
+
+        :param by: "timestamp" orders books by the timestamp\
+        of their statistics, "mtime" by the modification time\
+        of their files, which doesn't require reading them;\
+        notes are parsed only for the selected books
+        """
+        if by not in self.RECENCY_KEYS:
+            raise ValueError("Unknown recency key: {}".format(by))
+        self._check_paths()
+        entries = self._new_entries(by)
+        book_files = self._iter_book_files(entries)
+        # Min-heap of the most recent books found so far,
+        # books found earlier win ties
+        heap: List[Tuple[int, int, Tuple[str, str]]] = []
+        try:
+            for index, pair in enumerate(book_files):
+                try:
+                    item = (self._recency(pair, entries, by), -index, pair)
+                except Exception:
+                    self.metrics.incr("failures")
+                    err_msg = "Exception occured when creating book object."
+                    logging.exception(err_msg)
+                    self._forget_entries(entries, pair)
+                    continue
+                if len(heap) < count:
+                    heapq.heappush(heap, item)
+                elif heap and item > heap[0]:
+                    _, _, evicted = heapq.heapreplace(heap, item)
+                    self._forget_entries(entries, evicted)
+                else:
+                    self._forget_entries(entries, pair)
+        finally:
+            book_files.close()
+        recent = [pair for _, _, pair in sorted(heap, reverse=True)]
+        try:
+            yield from self._get_books_serially(recent, entries)
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+
+    async def aget_books(self, book_count: Optional[int] = None, concurrency: int = 8):
+        """
+        Asynchronous version of get_books:
+
+        async for book in finder.aget_books():
+            print(book.title)
+
+        Files are read in threads, at most concurrency books at once,
+        and parsed in the finder's executor or the default one
+        """
+        self._check_paths()
+        if self.lazy_notes:
+            books = itertools.islice(self.get_books(), book_count)
+            async for book in iterate_in_thread(books):
+                yield book
+            return
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load_book(note_file: str, stat_file: str) -> Book:
+            async with semaphore:
+                key, fingerprint, book = await loop.run_in_executor(
+                    None, self._get_cached_book, note_file, stat_file, entries
+                )
+                if book is not None:
+                    return book
+                contents = await loop.run_in_executor(
+                    None, read_book_files, note_file, stat_file, self.metrics
+                )
+            if isinstance(self.executor, ProcessPoolExecutor):
+                record = await loop.run_in_executor(
+                    self.executor,
+                    parse_book_contents_record,
+                    note_file,
+                    stat_file,
+                    *contents,
+                )
+                book = Book.from_record(record)
+            else:
+                book = await loop.run_in_executor(
+                    self.executor,
+                    parse_book_contents,
+                    note_file,
+                    stat_file,
+                    *contents,
+                    self.metrics,
+                )
+            if self.cache is not None:
+                await loop.run_in_executor(
+                    None, self._put_cached_book, key, fingerprint, book
+                )
+            return book
+
+        entries = self._new_entries()
+        pairs = itertools.islice(self._iter_book_files(entries), book_count)
+        books = (load_book(*pair) async for pair in iterate_in_thread(pairs))
+        try:
+            async for future in as_completed_bounded(books, concurrency * 2):
+                try:
+                    book = future.result()
+                except Exception:
+                    self.metrics.incr("failures")
+                    err_msg = "Exception occured when creating book object."
+                    logging.exception(err_msg)
+                else:
+                    self.metrics.incr("books")
+                    yield book
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+
+    def _check_paths(self) -> None:
+        if not self.paths:
+            raise ValueError("Path is not specified.")
+        for path in self.paths:
+            if not path.exists() or not path.is_dir():
+                raise ValueError("Path does not exist or is not a dir.")
+
+    def _new_entries(self, by: str = "") -> Optional[Dict[str, os.DirEntry]]:
+        """
+        Returns storage for the directory entries of the found files
+        if their stat info is going to be used, None otherwise
+        """
+        # Cache is not used in lazy_notes mode
+        if (self.cache is not None and not self.lazy_notes) or by == "mtime":
+            return {}
+        return None
+
+    @staticmethod
+    def _forget_entries(entries: Optional[Dict], pair: Tuple[str, str]) -> None:
+        if entries is not None:
+            for fname in pair:
+                entries.pop(fname, None)
+
+    def _iter_book_files(self, entries: Optional[Dict[str, os.DirEntry]]):
+        """
+        Yields pairs of the book files as soon as both of them are found,
+        directory entries of the files are put into entries unless it is None,
+        so that their stat info is reused; entries of the pair are to be
+        removed once it is consumed, so they don't pile up
+        """
+        return iter_same_book_files(self._iter_file_paths(entries))
+
+    def _iter_file_paths(self, entries: Optional[Dict[str, os.DirEntry]]):
+        scanner = scan_files(
+            self.paths, recursive=self.recursive, workers=self.scan_workers
+        )
+        try:
+            while True:
+                with self.metrics.stage(LIST):
+                    entry = next(scanner, None)
+                if entry is None:
+                    return
+                if entries is not None:
+                    entries[entry.path] = entry
+                yield entry.path
+        finally:
+            scanner.close()
+
+    def _recency(self, pair: Tuple[str, str], entries: Optional[Dict], by: str) -> int:
+        if by == "mtime":
+            assert entries is not None
+            return max(entries[fname].stat().st_mtime_ns for fname in pair if fname)
+        stat_file = pair[1]
+        if not stat_file:
+            return -1
+        _, stat_content = read_book_files("", stat_file, self.metrics)
+        if not stat_content:
+            return -1
+        with self.metrics.stage(PARSE):
+            stats = StatsAccessor.stats_from_file_obj(io.BytesIO(stat_content))
+        return int(stats.timestamp)
+
+    def _get_books_serially(
+        self, tuples: Iterable[Tuple[str, str]], entries: Optional[Dict]
+    ):
+        for note_file, stat_file in tuples:
+            try:
+                book = self._get_book(note_file, stat_file, entries)
+            except Exception:
+                self.metrics.incr("failures")
+                err_msg = "Exception occured when creating book object."
+                logging.exception(err_msg)
+            else:
+                self.metrics.incr("books")
+                yield book
+
+    def _get_books_in_executor(
+        self,
+        tuples: Iterable[Tuple[str, str]],
+        entries: Optional[Dict],
+        executor: Executor,
+    ) -> Iterator[Book]:
+        """
+        Parses books in the executor keeping a limited number
+        of them in flight, cached books are not sent to the executor
+        """
+        max_pending = max(self.workers, 1) * 4
+        pending: collections.deque = collections.deque()
         try:
             for note_file, stat_file in tuples:
-                book_name = title_from_fname(note_file or stat_file)
-                book_type = get_book_type(note_file or stat_file)
-                with BookParser(book_type=book_type) as reader:
-                    reader = (
-                        reader.set_notes_file(note_file)
-                        .set_stats_file(stat_file)
-                        .set_book_name(book_name)
+                try:
+                    pending.append(
+                        self._submit(executor, note_file, stat_file, entries)
                     )
-                    yield reader.build()
-        except Exception:
-            err_msg = "Exception occured when creating book object."
-            logging.exception(err_msg)
+                except Exception:
+                    self.metrics.incr("failures")
+                    err_msg = "Exception occured when creating book object."
+                    logging.exception(err_msg)
+                if len(pending) >= max_pending:
+                    yield from self._collect(pending, wait_all=False)
+            yield from self._collect(pending, wait_all=True)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def _submit(
+        self,
+        executor: Executor,
+        note_file: str,
+        stat_file: str,
+        entries: Optional[Dict],
+    ):
+        key, fingerprint, book = self._get_cached_book(note_file, stat_file, entries)
+        if book is not None:
+            future: Future = Future()
+            future.set_result(book)
+            return None, future
+        if self.metrics.enabled:
+            future = executor.submit(
+                parse_book_record_with_metrics, note_file, stat_file
+            )
+        else:
+            future = executor.submit(parse_book_record, note_file, stat_file)
+        return (key, fingerprint), future
+
+    def _collect(self, pending: collections.deque, wait_all: bool):
+        """Yields parsed books, waiting for at least one of them to be ready"""
+        while pending:
+            if self.ordered:
+                cache_entry, future = pending.popleft()
+            else:
+                done, _ = wait(
+                    [future for _, future in pending], return_when=FIRST_COMPLETED
+                )
+                cache_entry, future = next(item for item in pending if item[1] in done)
+                pending.remove((cache_entry, future))
+            try:
+                book = future.result()
+                if not isinstance(book, Book):
+                    if self.metrics.enabled:
+                        book, report = book
+                        self.metrics.merge(report)
+                    book = Book.from_record(book)
+            except Exception:
+                self.metrics.incr("failures")
+                err_msg = "Exception occured when creating book object."
+                logging.exception(err_msg)
+            else:
+                if cache_entry is not None:
+                    self._put_cached_book(*cache_entry, book)
+                self.metrics.incr("books")
+                yield book
+            if not wait_all:
+                return
+
+    def _get_book(
+        self, note_file: str, stat_file: str, entries: Optional[Dict]
+    ) -> Book:
+        if self.lazy_notes:
+            self._forget_entries(entries, (note_file, stat_file))
+            return parse_book_lazily(note_file, stat_file, self.metrics)
+        key, fingerprint, book = self._get_cached_book(note_file, stat_file, entries)
+        if book is None:
+            book = parse_book(note_file, stat_file, self.metrics)
+            self._put_cached_book(key, fingerprint, book)
+        return book
+
+    def _get_cached_book(self, note_file: str, stat_file: str, entries: Optional[Dict]):
+        """Returns cache key, files fingerprint and cached book if any"""
+        if self.cache is None:
+            return None, None, None
+        assert entries is not None
+        with self.metrics.stage(CACHE):
+            key = os.path.abspath(os.path.splitext(note_file or stat_file)[0])
+            fingerprint = "|".join(
+                file_fingerprint(
+                    fname,
+                    entries.pop(fname).stat() if fname else None,
+                    hash_content=self.hash_content,
+                )
+                for fname in (note_file, stat_file)
+            )
+            book = self.cache.get(key, fingerprint)
+        self.metrics.incr("cache_hits" if book is not None else "cache_misses")
+        return key, fingerprint, book
+
+    def _put_cached_book(self, key: str, fingerprint: str, book: Book) -> None:
+        if self.cache is None:
+            return
+        with self.metrics.stage(CACHE):
+            self.cache.put(key, fingerprint, book)
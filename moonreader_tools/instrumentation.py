@@ -0,0 +1,161 @@
+"""
+Optional instrumentation of the book reading pipeline:
+time spent in every stage (listing, opening, reading,
+decompression, decoding, parsing, serialization...) and counters
+of the processed bytes, notes and failures.
+
+Usage example:
+
+metrics = Metrics()
+finder = FilesystemFinder(path, metrics=metrics)
+books = list(finder.get_books())
+print(metrics.format_report())
+"""
+import collections
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Stages of the book reading pipeline
+LIST = "list"
+OPEN = "open"
+DOWNLOAD = "download"
+READ = "read"
+INFLATE = "inflate"
+DECODE = "decode"
+PARSE = "parse"
+CACHE = "cache"
+SERIALIZE = "serialize"
+
+# Receives kind of the metric ("time" or "count"), its name and value
+MetricsCallback = Callable[[str, str, float], None]
+
+
+class Metrics:
+    """
+    Accumulates time spent in stages and counters.
+    Time of the nested stages is not counted in the outer
+    ones, so stage times add up to the measured wall time.
+    """
+
+    enabled = True
+
+    def __init__(self, callback: Optional[MetricsCallback] = None) -> None:
+        self.callback = callback
+        self.timings: Dict[str, float] = collections.defaultdict(float)
+        self.calls: Dict[str, int] = collections.Counter()
+        self.counters: Dict[str, int] = collections.Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name: str) -> "_Stage":
+        """Context manager measuring the time spent in the stage"""
+        return _Stage(self, name)
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            self.timings[name] += seconds
+            self.calls[name] += calls
+        if self.callback is not None:
+            self.callback("time", name, seconds)
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+        if self.callback is not None:
+            self.callback("count", name, value)
+
+    def report(self) -> dict:
+        """Returns the accumulated metrics, suitable for JSON"""
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"seconds": seconds, "calls": self.calls[name]}
+                    for name, seconds in self.timings.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, report: dict) -> None:
+        """Adds metrics reported elsewhere, e.g. in the worker process"""
+        for name, stage in report["stages"].items():
+            self.add_time(name, stage["seconds"], stage["calls"])
+        for name, value in report["counters"].items():
+            self.incr(name, value)
+
+    def format_report(self) -> str:
+        report = self.report()
+        total = sum(stage["seconds"] for stage in report["stages"].values())
+        lines = ["{:<12} {:>10} {:>8} {:>10}".format("stage", "seconds", "%", "calls")]
+        for name, stage in sorted(
+            report["stages"].items(), key=lambda item: -item[1]["seconds"]
+        ):
+            lines.append(
+                "{:<12} {:>10.4f} {:>8.1f} {:>10}".format(
+                    name,
+                    stage["seconds"],
+                    100 * stage["seconds"] / total if total else 0,
+                    stage["calls"],
+                )
+            )
+        for name, value in sorted(report["counters"].items()):
+            lines.append("{:<12} {:>10}".format(name, value))
+        return "\n".join(lines)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start", "nested")
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.nested = 0.0
+        self.metrics._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self.start
+        stack = self.metrics._stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+        self.metrics.add_time(self.name, elapsed - self.nested)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class NullMetrics(Metrics):
+    """Metrics doing nothing, used when instrumentation is disabled"""
+
+    enabled = False
+
+    _STAGE = _NullStage()
+
+    def stage(self, name: str) -> "_NullStage":  # type: ignore
+        return self._STAGE
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        pass
+
+    def incr(self, name: str, value: int = 1) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
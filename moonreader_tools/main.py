@@ -2,14 +2,23 @@
 This file contains entry poin for the CLI.
 """
 import argparse
+import cProfile
+import datetime
 import json
 import logging
 import os
-import pprint
+import sys
+import time
 
 import dropbox
 
+from moonreader_tools.cache import BookCache
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.exporters import FORMATS, export_books
 from moonreader_tools.finders import DropboxFinder, FilesystemFinder
+from moonreader_tools.finders.dropbox.sync import SyncState
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+from moonreader_tools.search import SearchIndex
 
 from .conf import DEFAULT_DROPBOX_PATH, log_format
 
@@ -18,48 +27,291 @@ logging_handlers = [logging.StreamHandler(), logging.FileHandler("moonreader.log
 logging.basicConfig(format=log_format, handlers=logging_handlers, level=logging.DEBUG)
 
 
-def parse_args():
-    parser = argparse.ArgumentParser(description="Main parser")
-    parser.add_argument("--path", help="Path to get data from", default=".")
-    parser.add_argument("--output-file", help="File to place parsed data.")
+def add_source_arguments(parser, default_path=None):
+    """Adds arguments defining where and how books are obtained from"""
+    parser.add_argument(
+        "--path",
+        nargs="+",
+        help="Path or several paths to get data from",
+        default=default_path and [default_path],
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Look for the books in subdirectories of the paths as well.",
+    )
     parser.add_argument("--dropbox-token", help="Token to access your dropbox account")
     parser.add_argument(
         "--dropbox-path",
         default=DEFAULT_DROPBOX_PATH,
         help="Token to access your dropbox account",
     )
+    parser.add_argument(
+        "--dropbox-bulk",
+        action="store_true",
+        help="Download the whole dropbox folder as zip archive with a single request.",
+    )
     parser.add_argument(
         "--book-count",
-        default=50,
         type=int,
-        help="Number of books to get data about from dropbox.",
+        help="Number of books to get data about, all of them by default.",
     )
     parser.add_argument(
         "--workers", default=8, type=int, help="Number of threads/processes to use."
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Output books as soon as they are parsed by the workers.",
+    )
+    parser.add_argument(
+        "--dropbox-state",
+        help="JSON file to keep dropbox listing state in, used along with "
+        "--cache-file to download only the books changed since the last run.",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="SQLite file to cache parsed books in, "
+        "only new or changed books are parsed when it is set.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Maximum number of books to keep in the cache.",
+    )
+    parser.add_argument(
+        "--cache-hash",
+        action="store_true",
+        help="Compare file content hashes as well to detect changed books.",
+    )
+
+
+def parse_fields(value: str):
+    """Parses comma-separated list of book fields"""
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in Book.FIELDS]
+    if unknown or not fields:
+        raise argparse.ArgumentTypeError(
+            "unknown book fields: {}, available ones are: {}".format(
+                ", ".join(unknown) or "-", ", ".join(Book.FIELDS)
+            )
+        )
+    return fields
 
 
-def main():
-    args = parse_args()
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Main parser")
+    add_source_arguments(parser, default_path=".")
+    parser.add_argument(
+        "--output-file",
+        help="File to place parsed data, stdout is used if it is not set.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="json",
+        help="Output format: single JSON document or JSON object per line.",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        default=None,
+        help="Compress the output, files with .gz suffix are compressed anyway.",
+    )
+    parser.add_argument(
+        "--recent",
+        type=int,
+        metavar="N",
+        help="Output only N most recently read books from the local paths.",
+    )
+    parser.add_argument(
+        "--recent-by",
+        choices=FilesystemFinder.RECENCY_KEYS,
+        default="timestamp",
+        help="Tell recently read books by the statistics timestamp "
+        "or by the cheaper to get modification time of their files.",
+    )
+    parser.add_argument(
+        "--fields",
+        type=parse_fields,
+        help="Comma-separated book fields to output, e.g. title,percentage. "
+        "Notes files are not read unless notes are among them.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print time spent in every stage of reading and exporting books.",
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="File to dump cProfile statistics to, implies --profile.",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_search_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="moon_tools search",
+        description="Search highlights and notes of the indexed books. "
+        "Index is updated with the books from --path or dropbox if they are set.",
+    )
+    parser.add_argument(
+        "query",
+        nargs="*",
+        help="Terms the notes should contain, phrases are put in quotes: '\"some phrase\"'",
+    )
+    parser.add_argument(
+        "--index-file", required=True, help="SQLite file to keep the index in."
+    )
+    add_source_arguments(parser)
+    parser.add_argument("--book", help="Title of the book to search in.")
+    parser.add_argument("--color", help="Hex code of the notes color, e.g. #ff00ff.")
+    parser.add_argument(
+        "--since",
+        type=datetime.datetime.fromisoformat,
+        help="Search in notes created at or after the date, e.g. 2017-01-31.",
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.datetime.fromisoformat,
+        help="Search in notes created before the date.",
+    )
+    parser.add_argument("--limit", type=int, help="Maximum number of notes to show.")
+    parser.add_argument(
+        "--format",
+        choices=("text", "ndjson"),
+        default="text",
+        help="Output format: readable text or JSON object per line.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "search":
+        search(parse_search_args(argv[1:]))
+        return
+    args = parse_args(argv)
+    metrics = None
+    if args.profile or args.profile_output:
+        metrics = Metrics()
+    profiler = None
+    if args.profile_output:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        export(args, metrics)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
+        if metrics is not None:
+            print(metrics.format_report(), file=sys.stderr)
+            print(
+                "total {:>16.4f}".format(time.perf_counter() - started),
+                file=sys.stderr,
+            )
+
+
+def build_finder(args, cache=None, metrics=None, lazy_notes=False):
+    """Creates finder for the source set in the arguments, if any"""
     if args.dropbox_token:
         client = dropbox.Dropbox(args.dropbox_token)
-        finder = DropboxFinder(client, workers=args.workers)
+        sync_state = None
+        if args.dropbox_state:
+            sync_state = SyncState.load(args.dropbox_state)
+        return DropboxFinder(
+            client,
+            books_path=args.dropbox_path,
+            workers=args.workers,
+            sync_state=sync_state,
+            cache=cache,
+            metrics=metrics,
+            lazy_notes=lazy_notes,
+            bulk=args.dropbox_bulk,
+        )
     elif args.path:
-        if not os.path.exists(args.path):
-            raise OSError("Specified path does not exist.")
-        if not os.path.isdir(args.path):
-            raise ValueError("Folder should be specified.")
-        finder = FilesystemFinder(path=args.path)
-    else:
+        for path in args.path:
+            if not os.path.exists(path):
+                raise OSError("Specified path does not exist.")
+            if not os.path.isdir(path):
+                raise ValueError("Folder should be specified.")
+        return FilesystemFinder(
+            path=args.path,
+            recursive=args.recursive,
+            cache=cache,
+            hash_content=args.cache_hash,
+            workers=args.workers,
+            ordered=not args.unordered,
+            metrics=metrics,
+            lazy_notes=lazy_notes,
+        )
+    return None
+
+
+def open_cache(args):
+    if args.cache_file:
+        return BookCache(args.cache_file, max_entries=args.cache_size)
+    return None
+
+
+def export(args, metrics=None):
+    cache = open_cache(args)
+    lazy_notes = args.fields is not None and "notes" not in args.fields
+    finder = build_finder(args, cache, metrics, lazy_notes)
+    if finder is None:
         return
-    books = finder.get_books()
-    book_dict = {"books": [book.to_dict() for book in books]}
-    if args.output_file:
-        with open(args.output_file, "w") as result_f:
-            json.dump(book_dict, result_f, ensure_ascii=False)
+    if args.recent is not None:
+        if not isinstance(finder, FilesystemFinder):
+            raise ValueError("Recent books may be taken from the local paths only.")
+        books = finder.get_recent_books(args.recent, by=args.recent_by)
     else:
-        pprint.pprint(book_dict, indent=2, width=120)
+        books = finder.get_books(book_count=args.book_count)
+    try:
+        export_books(
+            books,
+            filename=args.output_file,
+            fmt=args.format,
+            compress=args.gzip,
+            metrics=metrics or NULL_METRICS,
+            fields=args.fields,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def search(args):
+    with SearchIndex(args.index_file) as index:
+        cache = open_cache(args)
+        finder = build_finder(args, cache)
+        if finder is not None:
+            try:
+                indexed = index.update(
+                    finder.get_books(book_count=args.book_count),
+                    prune=args.book_count is None,
+                )
+            finally:
+                if cache is not None:
+                    cache.close()
+            logging.info("%d new or changed books indexed.", indexed)
+        hits = index.search(
+            " ".join(args.query),
+            book=args.book,
+            color=args.color,
+            since=args.since,
+            until=args.until,
+            limit=args.limit,
+        )
+    for hit in hits:
+        if args.format == "ndjson":
+            print(json.dumps(hit.to_dict(), ensure_ascii=False))
+        else:
+            print("{} [{}] {}".format(hit.title, hit.created.isoformat(), hit.text))
+            if hit.note:
+                print("    " + hit.note)
 
 
 if __name__ == "__main__":
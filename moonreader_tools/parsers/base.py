@@ -1,6 +1,8 @@
 import logging
 
+from moonreader_tools.datamodel.annotation import Note
 from moonreader_tools.datamodel.book import Book
+from moonreader_tools.instrumentation import NULL_METRICS, OPEN, PARSE
 from moonreader_tools.parsers import FB2NoteParser, PDFNoteParser, StatsAccessor
 from moonreader_tools.utils import get_book_type, title_from_fname
 
@@ -19,6 +21,8 @@ class BookParser:
         self._stats_fobj = None
         self._book_type = book_type
         self._stats_reader = kwargs.get("stats_reader", StatsAccessor())
+        self._chunk_size = kwargs.get("chunk_size")
+        self._metrics = kwargs.get("metrics", NULL_METRICS)
 
     @classmethod
     def from_files(cls, notes_file, stats_file):
@@ -56,12 +60,14 @@ class BookParser:
 
     def set_notes_file(self, note_filepath: str):
         if note_filepath:
-            self.set_notes_fobj(open(note_filepath, "rb"))
+            with self._metrics.stage(OPEN):
+                self.set_notes_fobj(open(note_filepath, "rb"))
         return self
 
     def set_stats_file(self, stats_filepath: str):
         if stats_filepath:
-            self.set_stats_fobj(open(stats_filepath, "rb"))
+            with self._metrics.stage(OPEN):
+                self.set_stats_fobj(open(stats_filepath, "rb"))
         return self
 
     def set_notes_fobj(self, note_fobj):
@@ -91,8 +97,19 @@ class BookParser:
             return Book(title=self._book_name)
         note_reader = self.get_note_reader_by_type(self._book_type)
         notes, stats = [], None  # type: ignore
+        metrics = self._metrics
         if self._notes_fobj:
-            notes = note_reader.from_file_obj(self._notes_fobj)
+            with metrics.stage(PARSE):
+                notes = note_reader.from_file_obj(
+                    self._notes_fobj, self._chunk_size, metrics
+                )
+                # Malformed tokens are to fail here, along with the rest
+                # of the book parsing, rather than on access to the notes
+                Note.validate_all(notes)
+            metrics.incr("notes", len(notes))
         if self._stats_fobj:
-            stats = self._stats_reader.stats_from_file_obj(self._stats_fobj)
+            with metrics.stage(PARSE):
+                stats = self._stats_reader.stats_from_file_obj(
+                    self._stats_fobj, metrics
+                )
         return Book(title=self._book_name, stats=stats, notes=notes)
@@ -1,8 +1,62 @@
-from typing import List
+import operator
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from moonreader_tools.parsers.file_reader import FileReader
-from moonreader_tools.datamodel.annotation import Note
-from moonreader_tools.parsers.note_extractor import NoteExtractorMixin
+from moonreader_tools.datamodel.annotation import BookMeta, Note
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+from moonreader_tools.parsers.note_extractor import (
+    NoteExtractorMixin,
+    NoteRecord,
+    compile_record_decoder,
+)
+
+MetaCache = Dict[Tuple[str, ...], BookMeta]
+NoteDecoder = Callable[[Sequence[str], MetaCache], Note]
+
+
+def _int_or_none(token: str) -> Optional[int]:
+    try:
+        return int(token)
+    except ValueError:
+        return None
+
+
+def compile_note_decoder(
+    fields: Dict[str, slice],
+    meta_fields: Sequence[str],
+    position_fields: Sequence[str],
+) -> NoteDecoder:
+    """
+    Builds the function creating FB2 note straight from its lines,
+    book metadata is looked up in the given cache to be shared
+    """
+    decode_record = compile_record_decoder(fields, style_field=fields["style"])
+    meta_getter = operator.itemgetter(*(fields[name].start for name in meta_fields))
+    position_getter = operator.itemgetter(
+        *(fields[name].start for name in position_fields)
+    )
+    from_raw = Note.from_raw
+
+    def decode(lines: Sequence[str], metas: MetaCache) -> Note:
+        text, timestamp, color, style, note = decode_record(lines)
+        key = meta_getter(lines)
+        meta = metas.get(key)
+        if meta is None:
+            meta = metas[key] = BookMeta(*key)
+        chapter, position, length = position_getter(lines)
+        return from_raw(
+            text,
+            timestamp,
+            color,
+            style,
+            note,
+            meta,
+            _int_or_none(chapter),
+            _int_or_none(position),
+            _int_or_none(length),
+        )
+
+    return decode
 
 
 class FB2NoteParser(FileReader, NoteExtractorMixin):
@@ -32,20 +86,87 @@ class FB2NoteParser(FileReader, NoteExtractorMixin):
         (13, 3, "style"),  # is note deleted, e.g.
     ]
 
+    # Fields repeated in every note of the book, shared via BookMeta
+    META_FIELDS = ("title", "path", "path_lower")
+    POSITION_FIELDS = ("last_chapter", "last_position", "highlight_length")
+
+    HEADER_LENGTH = 3
+
+    # Decoders of the note lines laid out according to NOTE_SCHEME,
+    # faster equivalents of record_from_dictionary and from_str_list
+    _FIELDS = {name: slice(pos, pos + length) for pos, length, name in NOTE_SCHEME}
+    _decode_record = staticmethod(
+        compile_record_decoder(_FIELDS, style_field=_FIELDS["style"])
+    )
+    _decode_note = staticmethod(
+        compile_note_decoder(_FIELDS, META_FIELDS, POSITION_FIELDS)
+    )
+
+    @classmethod
+    def from_file_obj(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> List[Note]:
+        return list(cls.iter_notes(flike_obj, chunk_size, metrics))
+
     @classmethod
-    def from_file_obj(cls, flike_obj) -> List[Note]:
-        return cls.from_text(cls.read_file_obj(flike_obj))
+    def iter_notes(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[Note]:
+        """Lazily yields notes while reading file-like object line by line"""
+        return cls.iter_notes_from_lines(cls.iter_lines(flike_obj, chunk_size, metrics))
+
+    @classmethod
+    def iter_records(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[NoteRecord]:
+        """Lazily yields raw note fields without creating note objects"""
+        lines = cls.iter_lines(flike_obj, chunk_size, metrics)
+        return map(cls._decode_record, cls._iter_note_line_chunks(lines))
 
     @classmethod
     def from_text(cls, text: str) -> List[Note]:
         """Creates FB2 note from text"""
-        lines = text.splitlines()
-        if len(lines) < 3:
+        return list(cls.iter_notes_from_lines(text.splitlines()))
+
+    @classmethod
+    def iter_notes_from_lines(cls, lines: Iterable[str]) -> Iterator[Note]:
+        """
+        Consumes lines of the notes file and yields each note
+        as soon as the splitter line following it is met,
+        notes with the same book metadata share its single instance
+        """
+        decode = cls._decode_note
+        metas: MetaCache = {}
+        for note_lines in cls._iter_note_line_chunks(lines):
+            yield decode(note_lines, metas)
+
+    @classmethod
+    def _iter_note_line_chunks(cls, lines: Iterable[str]) -> Iterator[List[str]]:
+        """Groups lines of the notes file by notes they belong to"""
+        header_lines = 0
+        note_lines: Optional[List[str]] = None
+        for line in lines:
+            if header_lines < cls.HEADER_LENGTH:
+                header_lines += 1
+            elif line == cls.NOTE_SPLITTER:
+                if note_lines is not None:
+                    yield note_lines
+                note_lines = []
+            elif note_lines is not None:
+                note_lines.append(line)
+        if header_lines < cls.HEADER_LENGTH:
             raise ValueError("Incorrect FB2 notes text")
-        _, _note_lines = cls.split_note_text(lines)
-        text_chunks = cls._note_text_chunks(_note_lines)
-        notes = [cls.single_note_from_text(text_chunk) for text_chunk in text_chunks]
-        return notes
+        if note_lines is not None:
+            yield note_lines
 
     @classmethod
     def single_note_from_text(cls, text_chunk: str) -> Note:
@@ -54,13 +175,44 @@ class FB2NoteParser(FileReader, NoteExtractorMixin):
         return cls.from_str_list(lines)
 
     @classmethod
-    def from_str_list(cls, str_list: list) -> Note:
+    def from_str_list(cls, str_list: list, metas: Optional[MetaCache] = None) -> Note:
         """In text file single note is presented as a sequence of lines,
-        this method creates Note object from them"""
+        this method creates Note object from them
+
+        :param metas: already created metadata instances to be reused
+        """
+        note_dict = cls._dict_from_str_list(str_list)
+        last_chapter, last_position, highlight_length = (
+            cls._int_field(note_dict, name) for name in cls.POSITION_FIELDS
+        )
+        return Note.from_raw(
+            *cls.record_from_dictionary(note_dict),
+            meta=cls._shared_meta(note_dict, metas),
+            last_chapter=last_chapter,
+            last_position=last_position,
+            highlight_length=highlight_length,
+        )
+
+    @classmethod
+    def _shared_meta(cls, note_dict: dict, metas: Optional[MetaCache]) -> BookMeta:
+        key = tuple("".join(note_dict[name]) for name in cls.META_FIELDS)
+        if metas is None:
+            return BookMeta(*key)
+        meta = metas.get(key)
+        if meta is None:
+            meta = metas[key] = BookMeta(*key)
+        return meta
+
+    @staticmethod
+    def _int_field(note_dict: dict, name: str) -> Optional[int]:
+        return _int_or_none("".join(note_dict[name]))
+
+    @classmethod
+    def _dict_from_str_list(cls, str_list: list) -> dict:
         book_dict = {}
         for item in cls.NOTE_SCHEME:
             book_dict[item[cls.NAME]] = cls._extract_note_part(item, str_list)
-        return cls.note_from_dictionary(book_dict)
+        return book_dict
 
     @classmethod
     def _extract_note_part(cls, item_part, token_list):
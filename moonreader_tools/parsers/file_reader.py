@@ -1,4 +1,17 @@
+import codecs
+import itertools
+import mmap
+import os
 import zlib
+from typing import Iterable, Iterator, Optional, Union
+
+from moonreader_tools.instrumentation import (
+    DECODE,
+    INFLATE,
+    NULL_METRICS,
+    READ,
+    Metrics,
+)
 
 
 class FileReader:
@@ -7,17 +20,145 @@ class FileReader:
     files
     """
 
+    # Upper bound for the amount of raw, inflated and decoded
+    # data held in memory at once while reading files in chunks
+    CHUNK_SIZE = 64 * 1024
+
     @classmethod
-    def read_file_obj(cls, flike_obj) -> str:
+    def read_file_obj(cls, flike_obj, metrics: Metrics = NULL_METRICS) -> str:
         """Creates note object from file-like object"""
-        content = flike_obj.read()
-        if cls._is_zipped(content):
-            content = cls._read_zipped_content(content)
-        else:
-            content = content
-        if isinstance(content, bytes):
-            content = content.decode("utf-8")
-        return content
+        return "".join(cls.iter_text_chunks(flike_obj, metrics=metrics))
+
+    @classmethod
+    def iter_lines(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[str]:
+        """
+        Yields lines of the file-like object one by one
+        the same way str.splitlines() would split its whole content
+        """
+        return cls._lines_from_chunks(
+            cls.iter_text_chunks(flike_obj, chunk_size, metrics)
+        )
+
+    @classmethod
+    def iter_text_chunks(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[str]:
+        """Yields decoded pieces of the file-like object content"""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in cls.iter_byte_chunks(flike_obj, chunk_size, metrics):
+            if isinstance(chunk, str):
+                yield chunk
+                continue
+            with metrics.stage(DECODE):
+                text = decoder.decode(chunk)
+            yield text
+        yield decoder.decode(b"", final=True)
+
+    @classmethod
+    def iter_byte_chunks(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[Union[bytes, str]]:
+        """
+        Yields pieces of the file-like object content,
+        inflating zlib-compressed files on the fly.
+        Files opened in text mode produce str pieces.
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        raw_chunks = cls._iter_raw_chunks(flike_obj, chunk_size, metrics)
+        head = None
+        for chunk in raw_chunks:
+            head = chunk if head is None else head + chunk
+            if len(head) >= 2:
+                break
+        if head is None:
+            return iter(())
+        chunks = itertools.chain([head], raw_chunks)
+        if cls._is_zipped(head):
+            return cls._inflate_chunks(chunks, chunk_size, metrics)
+        return chunks
+
+    @classmethod
+    def _iter_raw_chunks(
+        cls, flike_obj, chunk_size: int, metrics: Metrics = NULL_METRICS
+    ):
+        mapped = cls._mmap_file_obj(flike_obj)
+        if mapped is None:
+            while True:
+                with metrics.stage(READ):
+                    chunk = flike_obj.read(chunk_size)
+                if not chunk:
+                    return
+                metrics.incr("bytes_read", len(chunk))
+                yield chunk
+        with mapped:
+            for start in range(flike_obj.tell(), len(mapped), chunk_size):
+                with metrics.stage(READ):
+                    chunk = mapped[start : start + chunk_size]
+                metrics.incr("bytes_read", len(chunk))
+                yield chunk
+
+    @staticmethod
+    def _mmap_file_obj(flike_obj) -> Optional[mmap.mmap]:
+        """
+        Maps regular files opened in binary mode into memory,
+        so they're paged in by the OS instead of being copied
+        """
+        if "b" not in getattr(flike_obj, "mode", ""):
+            return None
+        try:
+            fileno = flike_obj.fileno()
+            if os.fstat(fileno).st_size == 0:
+                return None
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _inflate_chunks(
+        chunks: Iterable[bytes], chunk_size: int, metrics: Metrics = NULL_METRICS
+    ) -> Iterator[bytes]:
+        """Incrementally decompresses zlib stream, chunk_size bytes at most"""
+        decompressor = zlib.decompressobj()
+        for chunk in chunks:
+            while chunk:
+                with metrics.stage(INFLATE):
+                    inflated = decompressor.decompress(chunk, chunk_size)
+                metrics.incr("bytes_inflated", len(inflated))
+                yield inflated
+                chunk = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+    @staticmethod
+    def _lines_from_chunks(chunks: Iterable[str]) -> Iterator[str]:
+        """Splits stream of text chunks into lines"""
+        pending = ""
+        for chunk in chunks:
+            if not chunk:
+                continue
+            lines = (pending + chunk).splitlines(True)
+            pending = lines.pop()
+            for line in lines:
+                yield line.splitlines()[0]
+            # "\r" may be followed by "\n" from the next chunk
+            if pending.endswith("\r"):
+                continue
+            stripped = pending.splitlines()[0]
+            if stripped != pending:
+                yield stripped
+                pending = ""
+        if pending:
+            yield pending.splitlines()[0]
 
     @classmethod
     def _read_zipped_content(cls, str_content) -> bytes:
@@ -31,9 +172,17 @@ class FileReader:
         """Decompresses zipped string"""
         return zlib.decompress(zipped_str)
 
-    @staticmethod
-    def _is_zipped(str_text: str) -> bool:
-        """Checks whether given sequence is compressed with zip"""
-        if len(str_text) < 2:
+    # zlib headers of the default window size, depending on the compression level
+    ZLIB_HEADERS = frozenset((b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda"))
+
+    @classmethod
+    def _is_zipped(cls, str_text: Union[bytes, str]) -> bool:
+        """
+        Checks whether given sequence is compressed with zip,
+        zlib header depends on the compression level (78 01, 78 5e,
+        78 9c or 78 da)
+        """
+        # Content of the files opened in text mode is never compressed
+        if not isinstance(str_text, (bytes, bytearray)):
             return False
-        return (str_text[0], str_text[1]) == (int("78", base=16), int("9c", base=16))
+        return bytes(str_text[:2]) in cls.ZLIB_HEADERS
@@ -1,11 +1,66 @@
 import datetime
-from typing import Tuple
+import operator
+from typing import Callable, Mapping, Optional, Sequence, Tuple
 
 from moonreader_tools import utils
 from moonreader_tools.datamodel.annotation import NoteStyle, Note
 
 DELETED_MARKER = "*DELETED*"
 
+# Fields in the order of Note.from_raw arguments
+NoteRecord = Tuple[str, str, str, NoteStyle, str]
+
+RecordDecoder = Callable[[Sequence[str]], NoteRecord]
+
+
+def compile_record_decoder(
+    fields: Mapping[str, slice], style_field: Optional[slice] = None
+) -> RecordDecoder:
+    """
+    Builds the function taking note tokens straight to the note record,
+    equivalent to record_from_dictionary applied to the dictionary
+    built from the schema, but without creating the dictionary
+    and checking its fields for every note.
+
+    :param fields: positions of the note fields in the tokens,\
+    text, timestamp, color and note are to be single tokens
+    :param style_field: positions of the style tokens, note is deleted\
+    if the last one of them is the deleted marker; if not set,\
+    all of the notes are selected
+    """
+    required = ("text", "timestamp", "color", "note")
+    for name in required:
+        field = fields[name]
+        if field.stop - field.start != 1:
+            raise ValueError("Field {} is not a single token".format(name))
+    get_fields = operator.itemgetter(*(fields[name].start for name in required))
+    min_tokens = max(fields[name].stop for name in required)
+    selected, deleted = NoteStyle.SELECTED, NoteStyle.DELETED
+
+    if style_field is None:
+
+        def decode(tokens: Sequence[str]) -> NoteRecord:
+            if len(tokens) < min_tokens:
+                raise ValueError("Incorrect note: {}".format(tokens))
+            text, timestamp, color, note = get_fields(tokens)
+            return text, timestamp, color, selected, note
+
+        return decode
+
+    min_tokens = max(min_tokens, style_field.start + 1)
+    style_stop = style_field.stop
+
+    def decode_styled(tokens: Sequence[str]) -> NoteRecord:
+        token_count = len(tokens)
+        if token_count < min_tokens:
+            raise ValueError("Incorrect note: {}".format(tokens))
+        text, timestamp, color, note = get_fields(tokens)
+        if tokens[min(token_count, style_stop) - 1] == DELETED_MARKER:
+            return text, timestamp, color, deleted, note
+        return text, timestamp, color, selected, note
+
+    return decode_styled
+
 
 class NoteExtractorMixin(object):
 
@@ -43,16 +98,25 @@ class NoteExtractorMixin(object):
 
     @classmethod
     def note_from_dictionary(cls, note_dict: dict) -> Note:
+        # Timestamp and color are decoded lazily by the note itself
+        return Note.from_raw(*cls.record_from_dictionary(note_dict))
+
+    @classmethod
+    def record_from_dictionary(cls, note_dict: dict) -> NoteRecord:
+        """
+        Extracts note fields without creating the note object:
+        text, raw timestamp, raw color, style and manual note text
+        """
         assert (
             cls.REQUIRED_FIELDS < note_dict.keys()
         ), "Some of the required keys for the note are missing: " + str(
             cls.REQUIRED_FIELDS - note_dict.keys()
         )
 
-        return Note(
-            text=cls.extract_text(note_dict),
-            created=cls.extract_created(note_dict),
-            color=cls.extract_color(note_dict),
-            style=cls.extract_style(note_dict),
-            note=cls.extract_manual_note_text(note_dict),
+        return (
+            cls.extract_text(note_dict),
+            utils.one_obj_or_list(note_dict["timestamp"]),
+            utils.one_obj_or_list(note_dict["color"]),
+            cls.extract_style(note_dict),
+            cls.extract_manual_note_text(note_dict),
         )
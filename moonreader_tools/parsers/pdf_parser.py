@@ -1,8 +1,14 @@
 import re
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from moonreader_tools.parsers.file_reader import FileReader
 from moonreader_tools.datamodel.annotation import Note
-from moonreader_tools.parsers.note_extractor import NoteExtractorMixin
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+from moonreader_tools.parsers.note_extractor import (
+    NoteExtractorMixin,
+    NoteRecord,
+    compile_record_decoder,
+)
 
 
 class PDFNoteParser(FileReader, NoteExtractorMixin):
@@ -13,6 +19,8 @@ class PDFNoteParser(FileReader, NoteExtractorMixin):
     PARSED_FORMAT = "PDF"
 
     SPLITTER_PATTERN = r"#A[0-9@\*]#"
+    SPLITTER_RE = re.compile(SPLITTER_PATTERN)
+    NOTE_RE = re.compile(re.escape(NOTE_START) + ".*?" + re.escape(NOTE_END), re.DOTALL)
     CORRESP_TABLE = (
         (0, "unknown_1"),
         (1, "page"),
@@ -25,35 +33,124 @@ class PDFNoteParser(FileReader, NoteExtractorMixin):
         (8, "text"),
         (9, None),
     )
+    # Decoder of the tokens laid out according to CORRESP_TABLE,
+    # faster equivalent of record_from_dictionary(_dict_from_tokens(tokens))
+    _decode_record = staticmethod(
+        compile_record_decoder(
+            {name: slice(pos, pos + 1) for pos, name in CORRESP_TABLE if name}
+        )
+    )
+
+    @classmethod
+    def from_file_obj(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> List[Note]:
+        return list(cls.iter_notes(flike_obj, chunk_size, metrics))
+
+    @classmethod
+    def iter_notes(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[Note]:
+        """Lazily yields notes while reading file-like object chunk by chunk"""
+        chunks = cls.iter_text_chunks(flike_obj, chunk_size, metrics)
+        decode, from_raw = cls._decode_record, Note.from_raw
+        for tokens in cls._iter_note_tokens_from_chunks(chunks):
+            yield from_raw(*decode(tokens))
 
     @classmethod
-    def from_file_obj(cls, flike_obj):
-        return cls.from_text(cls.read_file_obj(flike_obj))
+    def iter_records(
+        cls,
+        flike_obj,
+        chunk_size: Optional[int] = None,
+        metrics: Metrics = NULL_METRICS,
+    ) -> Iterator[NoteRecord]:
+        """Lazily yields raw note fields without creating note objects"""
+        chunks = cls.iter_text_chunks(flike_obj, chunk_size, metrics)
+        return map(cls._decode_record, cls._iter_note_tokens_from_chunks(chunks))
 
     @classmethod
-    def from_text(cls, text):
+    def from_text(cls, text) -> List[Note]:
         """Creates PDF note class instance from string"""
-        note_texts = cls._find_note_text_pieces(text)
-        notes = cls._notes_from_note_texts(note_texts)
-        return notes
+        return list(cls.iter_notes_from_text(text))
+
+    @classmethod
+    def iter_notes_from_text(cls, text: str) -> Iterator[Note]:
+        """Yields notes one by one as they are found in the text"""
+        decode, from_raw = cls._decode_record, Note.from_raw
+        for tokens in cls._iter_note_tokens(text):
+            yield from_raw(*decode(tokens))
+
+    @classmethod
+    def _iter_note_tokens(cls, text: str) -> Iterator[List[str]]:
+        for tokens, _ in cls._scan_note_tokens(text):
+            yield tokens
+
+    @classmethod
+    def _iter_note_tokens_from_chunks(
+        cls, chunks: Iterable[str]
+    ) -> Iterator[List[str]]:
+        """
+        Scans stream of text chunks, carrying over only
+        the unfinished note to the next chunk. Pieces of the
+        unfinished note are joined and scanned only once
+        its end marker is found, so long notes spanning
+        many chunks are still scanned once
+        """
+        # End marker may be split between the chunks,
+        # so the end of the pending text is checked along with the chunk
+        overlap = len(cls.NOTE_END) - 1
+        pending: List[str] = []
+        tail = ""
+        for chunk in chunks:
+            if cls.NOTE_END not in chunk and cls.NOTE_END not in tail + chunk[:overlap]:
+                if chunk:
+                    pending.append(chunk)
+                    tail = (tail + chunk[-overlap:])[-overlap:]
+                continue
+            pending.append(chunk)
+            text = "".join(pending)
+            consumed = 0
+            for tokens, consumed in cls._scan_note_tokens(text):
+                yield tokens
+            rest = text[consumed:]
+            pending = [rest] if rest else []
+            tail = rest[-overlap:]
+
+    @classmethod
+    def _scan_note_tokens(cls, text: str) -> Iterator[Tuple[List[str], int]]:
+        """
+        Walks the text once, splitting it by note markers,
+        and yields token lists laid out the same way
+        re.split(SPLITTER_PATTERN, note_text) would produce them,
+        along with the offset the note ends at
+        """
+        tokens: Optional[List[str]] = None
+        token_start = 0
+        for match in cls.SPLITTER_RE.finditer(text):
+            marker = match.group()
+            if marker == cls.NOTE_START:
+                tokens = [""]
+            elif tokens is None:
+                # Marker outside of the note, e.g. in the file header
+                continue
+            else:
+                tokens.append(text[token_start : match.start()])
+                if marker == cls.NOTE_END:
+                    tokens.append("")
+                    yield tokens, match.end()
+                    tokens = None
+            token_start = match.end()
 
     @classmethod
     def _find_note_text_pieces(cls, text):
         """Splits notes text and return notes"""
-        notes = []
-
-        _text = text
-        while _text:
-            start_pos = _text.find(cls.NOTE_START)
-            end_pos = _text.find(cls.NOTE_END)
-            if start_pos != -1 and end_pos != -1:
-                note_len = len(cls.NOTE_END)
-                note_text = _text[start_pos : end_pos + note_len]
-                notes.append(note_text)
-            else:
-                break
-            _text = _text[end_pos + len(cls.NOTE_END) :]
-        return notes
+        return [match.group() for match in cls.NOTE_RE.finditer(text)]
 
     @classmethod
     def _notes_from_note_texts(cls, note_texts):
@@ -66,12 +163,20 @@ class PDFNoteParser(FileReader, NoteExtractorMixin):
         token_dict = cls._dict_from_text(text)
         return cls.note_from_dictionary(token_dict)
 
+    @classmethod
+    def note_from_tokens(cls, note_tokens: List[str]) -> Note:
+        """Create note from the list of already splitted tokens"""
+        return Note.from_raw(*cls._decode_record(note_tokens))
+
     @classmethod
     def _dict_from_text(cls, text):
         """Split note's text according to regex, and return fields"""
+        return cls._dict_from_tokens(cls.SPLITTER_RE.split(text))
 
-        note_tokens = re.split(cls.SPLITTER_PATTERN, text)
-        assert len(note_tokens) > 8
+    @classmethod
+    def _dict_from_tokens(cls, note_tokens):
+        if len(note_tokens) < 9:
+            raise ValueError("Incorrect PDF note: {}".format(note_tokens))
         note_dict = {}
         for item in cls.CORRESP_TABLE:
             if not item[1]:
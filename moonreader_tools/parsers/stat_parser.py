@@ -3,19 +3,30 @@ Contains class responsible for Statistics object
 reading and writing to files
 """
 import io
+import logging
 import os
 import re
+import stat
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
 
 from moonreader_tools.parsers.file_reader import FileReader
 from moonreader_tools.conf import STAT_EXTENSION
 from moonreader_tools.datamodel.statistics import Statistics
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+
+logger = logging.getLogger(__name__)
 
 
 class StatsAccessor(FileReader):
     """
-    Parse statistics file and return proper DTO
+    Parse statistics file and return proper DTO,
+    or write statistics back in the format Moon+ Reader uses
     """
 
+    DEFAULT_COMPRESSION_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+
     _STATISTICS_FORMAT = r"""
 (^(?P<timestamp>[\d]+))     # When book was added to the shelf
 (\*(?P<pages>[\d]+))        # total number of pages
@@ -34,8 +45,10 @@ class StatsAccessor(FileReader):
         return Statistics(**items)
 
     @classmethod
-    def stats_from_file_obj(cls, flike_obj) -> Statistics:
-        content = cls.read_file_obj(flike_obj)
+    def stats_from_file_obj(
+        cls, flike_obj, metrics: Metrics = NULL_METRICS
+    ) -> Statistics:
+        content = cls.read_file_obj(flike_obj, metrics)
         if isinstance(content, type(b"bytes")):
             content = content.decode("utf-8")
         if len(content) == 0:
@@ -48,5 +61,128 @@ class StatsAccessor(FileReader):
             raise ValueError("File does not exist: {}".format(filename))
         assert filename.endswith(STAT_EXTENSION)
 
-        with io.open(filename, encoding="utf-8") as stat_file:
+        with io.open(filename, "rb") as stat_file:
             return cls.stats_from_file_obj(stat_file)
+
+    @staticmethod
+    def stats_to_string(stats: Statistics) -> str:
+        """Serializes statistics the way stats_from_string expects them"""
+        text = "{}*{}".format(stats.timestamp, stats.pages)
+        if stats.no1 is not None:
+            text += "@{}".format(stats.no1)
+        if stats.no2 is not None:
+            text += "#{}".format(stats.no2)
+        # Finished books are marked with "100%" instead of "100.0%"
+        percentage = "100" if stats.percentage >= 100 else repr(stats.percentage)
+        return "{}:{}%".format(text, percentage)
+
+    @classmethod
+    def stats_to_bytes(
+        cls,
+        stats: Statistics,
+        compress: bool = False,
+        level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> bytes:
+        content = cls.stats_to_string(stats).encode("utf-8")
+        if compress:
+            return zlib.compress(content, level)
+        return content
+
+    @classmethod
+    def stats_to_file_obj(
+        cls,
+        stats: Statistics,
+        flike_obj,
+        compress: bool = False,
+        level: int = DEFAULT_COMPRESSION_LEVEL,
+    ) -> None:
+        flike_obj.write(cls.stats_to_bytes(stats, compress, level))
+
+    @classmethod
+    def stats_to_file(
+        cls,
+        stats: Statistics,
+        filename: str,
+        compress: Optional[bool] = None,
+        level: int = DEFAULT_COMPRESSION_LEVEL,
+        fsync: bool = False,
+    ) -> None:
+        """
+        Atomically replaces the statistics file: content is written
+        into the temporary file in the same directory, which is then
+        renamed, so readers never see partially written file.
+
+        :param compress: whether the file should be zlib-compressed,\
+        by default the compression of the existing file is kept\
+        and new files are not compressed
+        :param level: zlib compression level
+        :param fsync: whether the content should be flushed to the disk\
+        before the file is replaced
+        """
+        assert filename.endswith(STAT_EXTENSION)
+        file_mode = None
+        try:
+            with open(filename, "rb") as stat_file:
+                head = stat_file.read(2)
+                file_mode = stat.S_IMODE(os.fstat(stat_file.fileno()).st_mode)
+        except FileNotFoundError:
+            head = b""
+        if compress is None:
+            compress = cls._is_zipped(head)
+        content = cls.stats_to_bytes(stats, compress, level)
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        temp_name = os.path.join(
+            dirname, "{}.{}.tmp".format(os.path.basename(filename), os.urandom(6).hex())
+        )
+        # Unlike mkstemp, which creates the file readable by the owner only,
+        # the new file gets the usual permissions: 0o666 masked by umask
+        fd = os.open(
+            temp_name,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0),
+            0o666,
+        )
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(content)
+                if fsync:
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+            if file_mode is not None:
+                os.chmod(temp_name, file_mode)
+            os.replace(temp_name, filename)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+
+    @classmethod
+    def stats_to_files(
+        cls,
+        items: Iterable[Tuple[str, Statistics]],
+        compress: Optional[bool] = None,
+        level: int = DEFAULT_COMPRESSION_LEVEL,
+        fsync: bool = False,
+        workers: int = 1,
+    ) -> int:
+        """
+        Writes statistics of many books, see stats_to_file.
+        Files are written in the thread pool if workers are more than one,
+        files that can't be written are logged and skipped.
+
+        :param items: pairs of the statistics file name and statistics
+        :return: number of the written files
+        """
+
+        def write(item: Tuple[str, Statistics]) -> bool:
+            filename, stats = item
+            try:
+                cls.stats_to_file(stats, filename, compress, level, fsync)
+            except Exception:
+                logger.exception("Statistics file %s can't be written.", filename)
+                return False
+            return True
+
+        if workers <= 1:
+            return sum(map(write, items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return sum(executor.map(write, items))
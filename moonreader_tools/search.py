@@ -0,0 +1,333 @@
+"""
+Persistent full-text index of the highlighted texts
+and notes of the library, allowing to look quotes up
+without reading the book files again
+"""
+import datetime
+import functools
+import hashlib
+import json
+import re
+import shlex
+import sqlite3
+import threading
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.utils import color_tuple_as_hex_code
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into case-insensitive terms"""
+    return TOKEN_RE.findall(text.casefold())
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """
+    Splits query into separate terms and phrases,
+    phrases are enclosed in double quotes:
+
+    >>> parse_query('kernel "context switch"')
+    (['kernel'], [['context', 'switch']])
+    """
+    terms: List[str] = []
+    phrases: List[List[str]] = []
+    lexer = shlex.shlex(query, posix=True)
+    lexer.quotes = '"'
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    for token in lexer:
+        words = tokenize(token)
+        if len(words) == 1:
+            terms.extend(words)
+        elif words:
+            phrases.append(words)
+    return terms, phrases
+
+
+@functools.lru_cache(maxsize=256)
+def phrase_pattern(phrase: str) -> "re.Pattern":
+    """
+    Compiles pattern matching the words of the phrase
+    separated by anything but word characters
+    """
+    words = phrase.split()
+    return re.compile(r"(?<!\w)" + r"\W+".join(map(re.escape, words)) + r"(?!\w)")
+
+
+def _contains_phrase(text: str, note: str, phrase: str) -> bool:
+    pattern = phrase_pattern(phrase)
+    return bool(pattern.search(text.casefold()) or pattern.search(note.casefold()))
+
+
+def _note_terms(text: str, note: str) -> set:
+    return set(tokenize(text)).union(tokenize(note))
+
+
+def book_fingerprint(book: Book) -> str:
+    """Identifies content of the book to skip indexing of unchanged ones"""
+    record = json.dumps(book.to_record(), ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(record.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SearchHit(NamedTuple):
+    title: str
+    text: str
+    note: str
+    created: datetime.datetime
+    color: str
+    style: str
+
+    def to_dict(self) -> dict:
+        return dict(self._asdict(), created=self.created.isoformat())
+
+
+class SearchIndex:
+    """
+    SQLite-backed inverted index mapping terms of the note
+    texts to the notes containing them.
+
+    Usage example:
+
+    with SearchIndex("index.sqlite") as index:
+        index.update(finder.get_books())
+        for hit in index.search('"context switch"', since=datetime(2017, 1, 1)):
+            print(hit.title, hit.text)
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.create_function(
+            "contains_phrase", 3, _contains_phrase, deterministic=True
+        )
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS books ("
+            "id INTEGER PRIMARY KEY, "
+            "title TEXT NOT NULL, "
+            "fingerprint TEXT NOT NULL, "
+            "UNIQUE (title, fingerprint));"
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "id INTEGER PRIMARY KEY, "
+            "book_id INTEGER NOT NULL, "
+            "text TEXT NOT NULL, "
+            "note TEXT NOT NULL, "
+            "created INTEGER NOT NULL, "
+            "color TEXT NOT NULL, "
+            "style TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS notes_book_id ON notes (book_id);"
+            "CREATE INDEX IF NOT EXISTS notes_created ON notes (created, id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, "
+            "note_id INTEGER NOT NULL, "
+            "PRIMARY KEY (term, note_id)) WITHOUT ROWID;"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        """Returns number of the indexed notes"""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def titles(self) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT title FROM books ORDER BY title"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def update(self, books: Iterable[Book], prune: bool = True) -> int:
+        """
+        Indexes new and changed books, returning the number of indexed ones.
+        Previous versions of the changed books are removed from the index.
+        When prune is set the books are taken as the whole library
+        and the indexed books missing from it are removed.
+        """
+        seen = set()
+        changed_titles = set()
+        indexed = 0
+        with self._lock:
+            for book in books:
+                book_id, is_new = self._add_book(book)
+                seen.add(book_id)
+                indexed += is_new
+                if is_new:
+                    changed_titles.add(book.title)
+            if prune:
+                rows = self._connection.execute("SELECT id FROM books").fetchall()
+            else:
+                rows = [
+                    row
+                    for title in changed_titles
+                    for row in self._connection.execute(
+                        "SELECT id FROM books WHERE title = ?", (title,)
+                    )
+                ]
+            # Books of the same title given along are all kept
+            self._remove_books([row[0] for row in rows if row[0] not in seen])
+            self._connection.commit()
+        return indexed
+
+    def update_book(self, book: Book) -> bool:
+        """
+        Replaces indexed notes of the book with the same title,
+        returns False if the book has not changed
+        """
+        with self._lock:
+            book_id, is_new = self._add_book(book)
+            stale = [
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT id FROM books WHERE title = ? AND id != ?",
+                    (book.title, book_id),
+                )
+            ]
+            self._remove_books(stale)
+            self._connection.commit()
+        return is_new
+
+    def remove_book(self, title: str) -> None:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id FROM books WHERE title = ?", (title,)
+            ).fetchall()
+            self._remove_books([row[0] for row in rows])
+            self._connection.commit()
+
+    def search(
+        self,
+        query: str = "",
+        book: Optional[str] = None,
+        color: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[SearchHit]:
+        """
+        Finds notes containing all of the query terms and phrases,
+        matching notes are returned from the oldest to the newest.
+
+        :param query: terms and phrases in double quotes
+        :param book: title of the book
+        :param color: hex code of the note color, e.g. #ff00ff
+        :param since: the earliest creation time
+        :param until: creation time notes are to be created before
+        """
+        terms, phrases = parse_query(query)
+        conditions, params = [], []  # type: ignore
+        all_terms = sorted(set(terms).union(*phrases))
+        if all_terms:
+            conditions.append(
+                "notes.id IN ({})".format(
+                    " INTERSECT ".join(
+                        ["SELECT note_id FROM postings WHERE term = ?"] * len(all_terms)
+                    )
+                )
+            )
+            params.extend(all_terms)
+        for phrase in phrases:
+            conditions.append("contains_phrase(notes.text, notes.note, ?)")
+            params.append(" ".join(phrase))
+        if book is not None:
+            conditions.append("books.title = ?")
+            params.append(book)
+        if color is not None:
+            conditions.append("notes.color = ?")
+            params.append(color.lower())
+        if since is not None:
+            conditions.append("notes.created >= ?")
+            params.append(int(since.timestamp()))
+        if until is not None:
+            conditions.append("notes.created < ?")
+            params.append(int(until.timestamp()))
+        sql = (
+            "SELECT books.title, notes.text, notes.note, notes.created, "
+            "notes.color, notes.style FROM notes "
+            "JOIN books ON books.id = notes.book_id"
+        )
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY notes.created, notes.id"
+        if limit is not None:
+            sql += " LIMIT {:d}".format(limit)
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [
+            SearchHit(
+                title,
+                text,
+                note,
+                datetime.datetime.fromtimestamp(created),
+                color_code,
+                style,
+            )
+            for title, text, note, created, color_code, style in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def _add_book(self, book: Book) -> Tuple[int, bool]:
+        """Indexes the book unless it is already indexed, returns its id"""
+        fingerprint = book_fingerprint(book)
+        row = self._connection.execute(
+            "SELECT id FROM books WHERE title = ? AND fingerprint = ?",
+            (book.title, fingerprint),
+        ).fetchone()
+        if row is not None:
+            return row[0], False
+        book_id = self._connection.execute(
+            "INSERT INTO books (title, fingerprint) VALUES (?, ?)",
+            (book.title, fingerprint),
+        ).lastrowid
+        postings = []
+        Note.decode_all(book.notes)
+        for note in book.notes:
+            note_id = self._connection.execute(
+                "INSERT INTO notes (book_id, text, note, created, color, style) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    book_id,
+                    note.text,
+                    note.note,
+                    int(note.created.timestamp()),
+                    color_tuple_as_hex_code(note.color).lower(),
+                    note.style.value,
+                ),
+            ).lastrowid
+            postings.extend(
+                (term, note_id) for term in _note_terms(note.text, note.note)
+            )
+        self._connection.executemany(
+            "INSERT INTO postings (term, note_id) VALUES (?, ?)", postings
+        )
+        return book_id, True
+
+    def _remove_books(self, book_ids: Sequence[int]) -> None:
+        for book_id in book_ids:
+            # Postings are looked up by the terms of the note
+            # to avoid keeping the index of postings by notes
+            notes = self._connection.execute(
+                "SELECT id, text, note FROM notes WHERE book_id = ?", (book_id,)
+            )
+            self._connection.executemany(
+                "DELETE FROM postings WHERE term = ? AND note_id = ?",
+                [
+                    (term, note_id)
+                    for note_id, text, note in notes.fetchall()
+                    for term in _note_terms(text, note)
+                ],
+            )
+            self._connection.execute("DELETE FROM notes WHERE book_id = ?", (book_id,))
+            self._connection.execute("DELETE FROM books WHERE id = ?", (book_id,))
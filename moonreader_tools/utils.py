@@ -3,13 +3,20 @@ Module contains helper functions used across the library
 """
 
 import datetime
+import functools
 import os
 import struct
-from typing import Tuple, Iterable, Union, List, Any
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
 
 from .conf import ALLOWED_TYPES, NOTE_EXTENSION, STAT_EXTENSION
 from .errors import BookTypeError
 
+Color = Tuple[int, int, int, int]
+
+# Libraries have only a handful of distinct highlight colors,
+# so the decoded ones are kept instead of being decoded for every note
+COLOR_CACHE_SIZE = 1024
+
 
 def validate_book_ext(ext: str) -> None:
     allowed = ALLOWED_TYPES
@@ -90,8 +97,12 @@ def one_obj_or_list(seq: List[Any]) -> Union[List[Any], Any]:
 def get_moonreader_files(path: str) -> Iterable[str]:
     """Return sequence of MoonReader statistsics and note files
     in the given path"""
-    files = (os.path.join(path, component) for component in os.listdir(path))
-    return get_moonreader_files_from_filelist(files)
+    with os.scandir(path) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.name.endswith((NOTE_EXTENSION, STAT_EXTENSION))
+        ]
 
 
 def get_moonreader_files_from_filelist(file_list: Iterable[str]) -> Iterable[str]:
@@ -100,13 +111,37 @@ def get_moonreader_files_from_filelist(file_list: Iterable[str]) -> Iterable[str
     return (f for f in file_list if f.endswith((NOTE_EXTENSION, STAT_EXTENSION)))
 
 
-def date_from_long_timestamp(str_timestamp: str) -> datetime.datetime:
+def seconds_from_long_timestamp(str_timestamp: str) -> float:
     """Moonreader files utilize awkward timestamp version,
-    so we trim it and calculate date"""
-    return datetime.datetime.fromtimestamp(float(str_timestamp[:10]))
+    so we trim it to get seconds since epoch"""
+    return float(str_timestamp[:10])
+
+
+def date_from_long_timestamp(str_timestamp: str) -> datetime.datetime:
+    """Calculates date of the Moonreader timestamp"""
+    return datetime.datetime.fromtimestamp(seconds_from_long_timestamp(str_timestamp))
+
 
+def seconds_from_long_timestamps(str_timestamps: Iterable[str]) -> List[float]:
+    """Converts the column of timestamps to seconds since epoch"""
+    return [
+        seconds_from_long_timestamp(str_timestamp) for str_timestamp in str_timestamps
+    ]
 
-def color_tuple_from_overflowed_integer(number: int) -> Tuple[int, int, int, int]:
+
+def dates_from_long_timestamps(
+    str_timestamps: Iterable[str],
+) -> List[datetime.datetime]:
+    """Batch version of date_from_long_timestamp"""
+    fromtimestamp = datetime.datetime.fromtimestamp
+    return [
+        fromtimestamp(seconds)
+        for seconds in seconds_from_long_timestamps(str_timestamps)
+    ]
+
+
+@functools.lru_cache(maxsize=COLOR_CACHE_SIZE)
+def color_tuple_from_overflowed_integer(number: int) -> Color:
     """
     Internally we get the color stored as the overflowed
     signed integer, so we put it back into
@@ -116,7 +151,20 @@ def color_tuple_from_overflowed_integer(number: int) -> Tuple[int, int, int, int
     return struct.unpack("BBBB", struct.pack("i", number))  # type: ignore
 
 
-def color_tuple_as_hex_code(color_tuple: Tuple[int, int, int, int]) -> str:
+def colors_from_overflowed_integers(str_colors: Sequence[str]) -> List[Color]:
+    """
+    Batch version of color_tuple_from_overflowed_integer taking
+    the column of color tokens, every distinct token is decoded once
+    """
+    decoded = {
+        str_color: color_tuple_from_overflowed_integer(int(str_color))
+        for str_color in set(str_colors)
+    }
+    return [decoded[str_color] for str_color in str_colors]
+
+
+@functools.lru_cache(maxsize=COLOR_CACHE_SIZE)
+def color_tuple_as_hex_code(color_tuple: Color) -> str:
     """
     >>> color_tuple_as_hex_code((0, 255, 0, 255))
     >>> "#FF00FF"
@@ -126,6 +174,11 @@ def color_tuple_as_hex_code(color_tuple: Tuple[int, int, int, int]) -> str:
     )
 
 
+def hex_codes_from_color_tuples(color_tuples: Iterable[Color]) -> List[str]:
+    """Batch version of color_tuple_as_hex_code"""
+    return [color_tuple_as_hex_code(tuple(color)) for color in color_tuples]
+
+
 def get_same_book_files(files: Iterable[str]) -> List[Tuple[str, str]]:
     """Returns pairs of files that belong to the same book"""
     pairs = []
@@ -153,3 +206,30 @@ def get_same_book_files(files: Iterable[str]) -> List[Tuple[str, str]]:
                 pairs.append(("", fname))
                 files_set.remove(fname)
     return pairs
+
+
+def iter_same_book_files(files: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Yields pairs of files that belong to the same book
+    as soon as both of them are met in the given files;
+    books having only one of the files are yielded
+    after all of the files are consumed
+    """
+    unpaired: Dict[str, str] = {}
+    for fname in files:
+        if not fname.endswith((NOTE_EXTENSION, STAT_EXTENSION)):
+            continue
+        is_note = fname.endswith(NOTE_EXTENSION)
+        book_path = os.path.splitext(fname)[0]
+        pair_fname = unpaired.pop(book_path, None)
+        if pair_fname is None or pair_fname.endswith(NOTE_EXTENSION) == is_note:
+            unpaired[book_path] = fname
+        elif is_note:
+            yield fname, pair_fname
+        else:
+            yield pair_fname, fname
+    for fname in unpaired.values():
+        if fname.endswith(NOTE_EXTENSION):
+            yield fname, ""
+        else:
+            yield "", fname
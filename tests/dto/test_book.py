@@ -1,3 +1,8 @@
+import datetime
+
+import pytest
+
+from moonreader_tools.datamodel.annotation import BookMeta, Note
 from moonreader_tools.datamodel.book import Book
 
 
@@ -13,3 +18,49 @@ def test_book_is_properly_constructed_with_defaults():
 
 def test_book_is_properly_serialized_into_dict():
     pass
+
+
+def test_shared_note_metadata_is_stored_once_in_record():
+    meta = BookMeta("Title", "/Books/Title.fb2", "/books/title.fb2")
+    notes = [
+        Note(text=str(i), created=datetime.datetime(2017, 1, 1), meta=meta)
+        for i in range(3)
+    ]
+    record = Book("Title", notes=notes).to_record()
+
+    restored = Book.from_record(record)
+
+    assert record[-1] == meta.to_record()
+    assert restored.notes[0].meta == meta
+    assert all(note.meta is restored.notes[0].meta for note in restored.notes)
+
+
+def test_record_without_metadata_is_restored():
+    notes = [Note(text="text", created=datetime.datetime(2017, 1, 1))]
+    restored = Book.from_record(Book("Title", notes=notes).to_record())
+
+    assert restored.notes[0].meta is None
+
+
+def test_notes_are_loaded_on_first_access():
+    notes = [Note(text="text", created=datetime.datetime(2017, 1, 1))]
+    calls = []
+
+    def load():
+        calls.append(1)
+        return notes
+
+    book = Book("Title", notes_loader=load)
+
+    assert not book.notes_loaded
+    assert book.to_dict(["title", "percentage"]) == {"title": "Title", "percentage": 0}
+    assert calls == []
+    assert book.notes is notes
+    assert book.notes is notes
+    assert book.notes_loaded
+    assert calls == [1]
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError):
+        Book("Title").to_dict(["title", "author"])
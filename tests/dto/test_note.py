@@ -1,6 +1,8 @@
 import datetime
 
-from moonreader_tools.datamodel.annotation import NoteStyle, Note
+import pytest
+
+from moonreader_tools.datamodel.annotation import BookMeta, NoteStyle, Note
 
 
 def test_valid_defaults_for_note():
@@ -12,3 +14,76 @@ def test_valid_defaults_for_note():
     assert n.style == NoteStyle.SELECTED
     assert n.color == (0, 255, 255, 255)
     assert n.note == note
+
+
+def test_raw_note_fields_are_decoded_on_access():
+    n = Note.from_raw(text="text", timestamp="1451686942123", color="-256")
+
+    assert n.created == datetime.datetime.fromtimestamp(1451686942)
+    assert n.color == (0, 255, 255, 255)
+    assert n.to_dict()["color"] == "#ffffff"
+
+
+def test_note_has_no_instance_dict():
+    n = Note(text="text", created=datetime.datetime.utcnow())
+
+    assert not hasattr(n, "__dict__")
+
+
+def test_note_position_survives_record_round_trip():
+    meta = BookMeta("Title", "/Books/Title.fb2", "/books/title.fb2")
+    n = Note.from_raw(
+        text="text",
+        timestamp="1451686942123",
+        color="-256",
+        meta=meta,
+        last_chapter=2,
+        last_position=222,
+        highlight_length=131,
+    )
+
+    restored = Note.from_record(n.to_record(), meta)
+
+    assert restored.position == (2, 222, 131)
+    assert restored.meta is meta
+
+
+def test_note_without_position_keeps_short_record():
+    n = Note(text="text", created=datetime.datetime(2017, 1, 1))
+
+    assert n.position is None
+    assert len(n.to_record()) == 5
+    assert Note.from_record(n.to_record()).position is None
+
+
+def test_raw_fields_of_many_notes_are_decoded_at_once():
+    tokens = [("1451686942123", "-256"), ("1441449604670", "-16711936")]
+    notes = [Note.from_raw("text", timestamp, color) for timestamp, color in tokens]
+    expected = [
+        Note.from_raw("text", timestamp, color).to_dict() for timestamp, color in tokens
+    ]
+
+    Note.decode_all(notes)
+
+    assert all(n._raw_timestamp is None and n._raw_color is None for n in notes)
+    assert [n.to_dict() for n in notes] == expected
+
+
+def test_many_notes_are_serialized_at_once():
+    tokens = [("1451686942123", "-256"), ("1441449604670", "-16711936")]
+    notes = [Note.from_raw("text", timestamp, color) for timestamp, color in tokens]
+    expected = [
+        Note.from_raw("text", timestamp, color).to_dict() for timestamp, color in tokens
+    ]
+
+    assert Note.to_dicts(notes) == expected
+
+
+def test_malformed_raw_fields_fail_validation():
+    valid = Note.from_raw("text", "1451686942123", "-256")
+    Note.validate_all([valid])
+    assert valid._raw_timestamp is not None and valid._raw_color is not None
+
+    for timestamp, color in [("notatime", "-256"), ("1451686942123", "notacolor")]:
+        with pytest.raises(ValueError):
+            Note.validate_all([valid, Note.from_raw("text", timestamp, color)])
@@ -37,3 +37,10 @@ def test_is_empty_returns_true_for_non_zero_values(input_combinations):
 
     stats = Statistics(*input_combinations)
     assert stats.is_empty() is False
+
+
+def test_unknown_fields_are_kept_in_slots():
+    stats = Statistics("1392540515970", 15, 7.8, no1="0", no2="6095")
+
+    assert not hasattr(stats, "__dict__")
+    assert Statistics.from_record(stats.to_record()).no2 == "6095"
@@ -0,0 +1,120 @@
+"""
+In-memory stand-in for the dropbox client,
+implementing the subset of API used by the library
+"""
+import hashlib
+import io
+import os
+import zipfile
+from types import SimpleNamespace
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+class FakeDropboxClient:
+    def __init__(self, folder="/cache", page_size=None):
+        self.folder = folder
+        self.page_size = page_size
+        self.files = {}
+        self.changes = []
+        self.downloads = []
+        self.zip_downloads = []
+        self.errors = {}
+        self.continue_calls = 0
+        self._pages = {}
+
+    @classmethod
+    def with_fixtures(cls, **kwargs):
+        client = cls(**kwargs)
+        for fname in sorted(os.listdir(FIXTURE_DIR)):
+            with open(os.path.join(FIXTURE_DIR, fname), "rb") as f:
+                client.upload(fname, f.read())
+        return client
+
+    def upload(self, fname, content):
+        path_display = "{}/{}".format(self.folder, fname)
+        self.files[path_display.lower()] = path_display, content
+        self.changes.append(path_display.lower())
+
+    def delete(self, fname):
+        path_lower = "{}/{}".format(self.folder, fname).lower()
+        del self.files[path_lower]
+        self.changes.append(path_lower)
+
+    def files_list_folder(self, path):
+        return self._paginate([self._metadata(path_lower) for path_lower in self.files])
+
+    def files_list_folder_continue(self, cursor):
+        self.continue_calls += 1
+        if cursor in self._pages:
+            return self._pages.pop(cursor)
+        changed = dict.fromkeys(self.changes[int(cursor) :])
+        return self._paginate([self._metadata(path_lower) for path_lower in changed])
+
+    def fail_downloads(self, fname, *errors):
+        """Next downloads of the file raise the given errors one by one"""
+        path_lower = "{}/{}".format(self.folder, fname).lower()
+        self.errors.setdefault(path_lower, []).extend(errors)
+
+    def files_download(self, path):
+        self.downloads.append(path)
+        errors = self.errors.get(path.lower())
+        if errors:
+            raise errors.pop(0)
+        path_display, content = self.files[path.lower()]
+        metadata = SimpleNamespace(path_display=path_display, path_lower=path.lower())
+        return metadata, SimpleNamespace(content=content)
+
+    def files_download_zip(self, path):
+        """Archive members are named after the folder, e.g. cache/Book.pdf.an"""
+        self.zip_downloads.append(path)
+        prefix = path.lower().rstrip("/") + "/"
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            for path_lower, (path_display, content) in self.files.items():
+                if path_lower.startswith(prefix):
+                    zip_file.writestr(path_display.lstrip("/"), content)
+        metadata = SimpleNamespace(path_display=path, path_lower=path.lower())
+        return SimpleNamespace(metadata=metadata), _FakeResponse(archive.getvalue())
+
+    def _metadata(self, path_lower):
+        if path_lower not in self.files:
+            return SimpleNamespace(path_lower=path_lower, path_display=path_lower)
+        path_display, content = self.files[path_lower]
+        return SimpleNamespace(
+            path_lower=path_lower,
+            path_display=path_display,
+            content_hash=hashlib.sha256(content).hexdigest(),
+            size=len(content),
+        )
+
+    def _paginate(self, entries):
+        page_size = self.page_size or len(entries) or 1
+        pages = [
+            entries[i : i + page_size] for i in range(0, len(entries), page_size)
+        ] or [[]]
+        final_cursor = str(len(self.changes))
+        results = []
+        for i, page in enumerate(pages):
+            has_more = i < len(pages) - 1
+            cursor = "page-{}-{}".format(final_cursor, i) if has_more else final_cursor
+            results.append(
+                SimpleNamespace(entries=page, has_more=has_more, cursor=cursor)
+            )
+        for result, next_result in zip(results, results[1:]):
+            self._pages[result.cursor] = next_result
+        return results[0]
+
+
+class _FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,74 @@
+import datetime
+import os
+
+import pytest
+
+from moonreader_tools import analytics
+from moonreader_tools.analytics import NoteTable
+from moonreader_tools.datamodel.annotation import NoteStyle
+from moonreader_tools.finders import FilesystemFinder
+from moonreader_tools.utils import get_moonreader_files, get_same_book_files
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(analytics, "np", None)
+    return request.param
+
+
+@pytest.fixture
+def table(backend):
+    pairs = get_same_book_files(sorted(get_moonreader_files(FIXTURE_DIR)))
+    return NoteTable.from_files(pairs)
+
+
+def test_table_built_from_files_matches_finder_output(table):
+    books = list(FilesystemFinder(FIXTURE_DIR).get_books())
+    from_books = NoteTable.from_books(books)
+
+    assert len(table) == len(from_books) == sum(len(b.notes) for b in books)
+    assert table.count_by_book() == from_books.count_by_book()
+    assert table.count_by_color() == from_books.count_by_color()
+    assert table.count_by_month() == from_books.count_by_month()
+
+
+def test_notes_are_counted_by_book(table):
+    assert table.count_by_book() == {
+        "Brinkman_S._Konec_Yepohi_Self_Help_Ka": 29,
+        "Do_Smerti_Zdorov": 20,
+        "How_Linux_Works": 79,
+        "LoremIpsum": 13,
+    }
+    assert table.count_by_style() == {NoteStyle.SELECTED: 141}
+
+
+def test_notes_are_filtered(table):
+    linux_notes = table.filter(book="How_Linux_Works")
+
+    assert len(linux_notes) == 79
+    assert linux_notes.text(78) == "need"
+    assert linux_notes.row(78)["color"] == (0, 255, 255, 255)
+    assert table.count(color=(0, 255, 255, 255)) == 74
+    assert table.count(book="How_Linux_Works", color=(0, 255, 255, 255)) == 72
+
+
+def test_notes_are_counted_by_month(table):
+    since = datetime.datetime(2017, 1, 1)
+    until = datetime.datetime(2018, 1, 1)
+
+    assert table.filter(since=since, until=until).count_by_month() == {(2017, 10): 13}
+    assert sum(table.count_by_month().values()) == len(table)
+
+
+def test_empty_table(backend):
+    table = NoteTable.from_files([])
+
+    assert len(table) == 0
+    assert table.count_by_month() == {}
+    assert table.filter(book="title").count_by_book() == {}
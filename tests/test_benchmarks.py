@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from benchmarks.runner import main
+from moonreader_tools.finders import FilesystemFinder
+
+
+def test_generated_corpus_is_parsed(tmp_path):
+    spec = CorpusSpec(books=20, notes_mean=10, seed=1)
+    generated = {book.title: book for book in generate_corpus(str(tmp_path), spec)}
+    books = list(FilesystemFinder(str(tmp_path)).get_books())
+    assert {book.title: len(book.notes) for book in books} == {
+        title: book.notes for title, book in generated.items()
+    }
+    assert {book.book_type for book in generated.values()} == {"pdf", "fb2"}
+    assert {book.compressed for book in generated.values()} == {True, False}
+    assert all(book.pages for book in books)
+
+
+def test_corpus_is_reproducible(tmp_path):
+    spec = CorpusSpec(books=5, seed=2)
+    first = generate_corpus(str(tmp_path / "first"), spec)
+    second = generate_corpus(str(tmp_path / "second"), spec)
+    for first_book, second_book in zip(first, second):
+        with open(first_book.note_file, "rb") as f1, open(
+            second_book.note_file, "rb"
+        ) as f2:
+            assert f1.read() == f2.read()
+
+
+def test_unknown_distribution_is_rejected():
+    with pytest.raises(ValueError):
+        CorpusSpec(distribution="normal")
+
+
+def test_results_are_saved(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    main(["--books", "5", "--repeat", "1", "--output", str(output)])
+    results = json.loads(output.read_text())
+    assert results["meta"]["corpus"]["books"] == 5
+    assert results["results"]["filesystem_finder"]["items"] == 5
+    assert "pdf_parser" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+import datetime
+import os
+import shutil
+from unittest.mock import patch
+
+import pytest
+
+from moonreader_tools.cache import BookCache, file_fingerprint
+from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.datamodel.statistics import Statistics
+from moonreader_tools.finders import FilesystemFinder
+from moonreader_tools.finders.fs.finder import parse_book
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with BookCache(str(tmp_path / "cache.sqlite")) as book_cache:
+        yield book_cache
+
+
+@pytest.fixture
+def book():
+    created = datetime.datetime(2016, 1, 1, 22, 22, 22)
+    notes = [Note(text="text", created=created, note="remark")]
+    return Book("Title", stats=Statistics("1451686942123", 10, 55.5), notes=notes)
+
+
+def test_cached_book_is_returned_for_the_same_fingerprint(cache, book):
+    cache.put("key", "1:1|2:2", book)
+    cached = cache.get("key", "1:1|2:2")
+
+    assert cached.to_dict() == book.to_dict()
+    assert cached.stats.timestamp == book.stats.timestamp
+
+
+def test_stale_book_is_not_returned(cache, book):
+    cache.put("key", "1:1|2:2", book)
+
+    assert cache.get("key", "1:1|2:3") is None
+    assert cache.get("other_key", "1:1|2:2") is None
+
+
+def test_invalidated_book_is_not_returned(cache, book):
+    cache.put("key", "fingerprint", book)
+    cache.invalidate("key")
+
+    assert cache.get("key", "fingerprint") is None
+
+
+def test_least_recently_used_books_are_evicted(tmp_path, book):
+    with BookCache(str(tmp_path / "cache.sqlite"), max_entries=2) as cache:
+        cache.put("first", "fingerprint", book)
+        cache.put("second", "fingerprint", book)
+        cache.get("first", "fingerprint")
+        cache.put("third", "fingerprint", book)
+        cache.flush()
+
+        assert len(cache) == 2
+        assert cache.get("second", "fingerprint") is None
+        assert cache.get("first", "fingerprint") is not None
+
+
+def test_fingerprint_changes_with_file_content(tmp_path):
+    fname = str(tmp_path / "book.pdf.po")
+    with open(fname, "w") as f:
+        f.write("1392540515970*15@0#6095:7.8%")
+    fingerprint = file_fingerprint(fname, hash_content=True)
+    with open(fname, "w") as f:
+        f.write("1392540515970*15@0#6095:9.9%")
+
+    assert file_fingerprint(fname, hash_content=True) != fingerprint
+    assert file_fingerprint("") == file_fingerprint("")
+
+
+def test_finder_parses_only_changed_books(tmp_path, cache):
+    for fname in os.listdir(FIXTURE_DIR):
+        shutil.copy(os.path.join(FIXTURE_DIR, fname), str(tmp_path))
+    finder = FilesystemFinder(str(tmp_path), cache=cache)
+    first_scan = [book.to_dict() for book in finder.get_books()]
+
+    with open(str(tmp_path / "How_Linux_Works.pdf.po"), "w") as f:
+        f.write("1481711834080*151:75.0%")
+    with patch(
+        "moonreader_tools.finders.fs.finder.parse_book", wraps=parse_book
+    ) as parse_book_mock:
+        second_scan = [book.to_dict() for book in finder.get_books()]
+
+    assert parse_book_mock.call_count == 1
+    for book_dict in first_scan:
+        if book_dict["title"] == "How_Linux_Works":
+            book_dict["percentage"] = 75.0
+    assert second_scan == first_scan
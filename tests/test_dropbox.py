@@ -0,0 +1,450 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+
+import pytest
+import requests
+from dropbox.exceptions import RateLimitError
+
+from moonreader_tools.cache import BookCache
+from moonreader_tools.finders import DropboxFinder
+from moonreader_tools.finders.aio import iterate_in_thread
+from moonreader_tools.finders.dropbox.scheduler import DownloadScheduler
+from moonreader_tools.finders.dropbox.sync import SyncState
+from moonreader_tools.instrumentation import Metrics
+from tests.fake_dropbox import FakeDropboxClient
+
+
+@pytest.fixture
+def client():
+    return FakeDropboxClient.with_fixtures()
+
+
+@pytest.fixture
+def incremental_finder_factory(tmp_path, client):
+    caches = []
+
+    def factory():
+        cache = BookCache(str(tmp_path / "cache.sqlite"))
+        caches.append(cache)
+        return DropboxFinder(
+            client,
+            books_path=client.folder,
+            sync_state=SyncState.load(str(tmp_path / "state.json")),
+            cache=cache,
+        )
+
+    yield factory
+    for cache in caches:
+        cache.close()
+
+
+def book_dicts(books):
+    return sorted(
+        (book.to_dict() for book in books), key=lambda b: json.dumps(b, sort_keys=True)
+    )
+
+
+def test_all_books_are_downloaded_from_folder(client):
+    finder = DropboxFinder(client, books_path=client.folder)
+    books = list(finder.get_books())
+
+    assert len(books) == 5
+    assert len(client.downloads) == 10
+
+
+def test_all_pages_of_folder_listing_are_read():
+    client = FakeDropboxClient.with_fixtures(page_size=3)
+    finder = DropboxFinder(client, books_path=client.folder)
+
+    assert len(list(finder.get_books())) == 5
+    assert client.continue_calls == 3
+
+
+def test_listing_stops_once_enough_books_are_found():
+    client = FakeDropboxClient.with_fixtures(page_size=2)
+    finder = DropboxFinder(client, books_path=client.folder)
+
+    books = list(finder.get_books(book_count=1))
+    assert len(books) == 1
+    assert client.continue_calls == 0
+    assert len(client.downloads) == 2
+
+
+def test_incremental_run_downloads_only_changed_books(
+    client, incremental_finder_factory
+):
+    first_run = book_dicts(incremental_finder_factory().get_books())
+    client.downloads.clear()
+
+    second_run = book_dicts(incremental_finder_factory().get_books())
+    assert client.downloads == []
+    assert second_run == first_run
+
+    client.upload("How_Linux_Works.pdf.po", b"1481711834080*151:75.0%")
+    third_run = book_dicts(incremental_finder_factory().get_books())
+    assert sorted(client.downloads) == [
+        "/cache/how_linux_works.pdf.an",
+        "/cache/how_linux_works.pdf.po",
+    ]
+    assert len(third_run) == 5
+    assert [b["percentage"] for b in third_run if b["title"] == "How_Linux_Works"] == [
+        75.0
+    ]
+
+
+def test_deleted_books_are_not_returned_by_incremental_run(
+    client, incremental_finder_factory
+):
+    list(incremental_finder_factory().get_books())
+    client.delete("LoremIpsum.pdf.an")
+    client.delete("LoremIpsum.pdf.po")
+
+    books = list(incremental_finder_factory().get_books())
+    assert len(books) == 4
+
+
+def test_sync_state_is_persisted(tmp_path):
+    state = SyncState(str(tmp_path / "state.json"))
+    state.path, state.cursor, state.files = "/cache", "10", {"/cache/a.pdf.po": "h"}
+    state.save()
+
+    loaded = SyncState.load(str(tmp_path / "state.json"))
+    assert (loaded.path, loaded.cursor, loaded.files) == (
+        state.path,
+        state.cursor,
+        state.files,
+    )
+
+
+def test_books_are_iterated_asynchronously(client):
+    finder = DropboxFinder(client, books_path=client.folder, workers=2)
+
+    async def collect():
+        return [book async for book in finder.aget_books()]
+
+    books = asyncio.run(collect())
+    assert book_dicts(books) == book_dicts(finder.get_books())
+
+
+def test_incremental_books_are_iterated_asynchronously(
+    client, incremental_finder_factory
+):
+    async def collect():
+        return [book async for book in incremental_finder_factory().aget_books()]
+
+    first_run = asyncio.run(collect())
+    client.downloads.clear()
+    second_run = asyncio.run(collect())
+
+    assert client.downloads == []
+    assert book_dicts(second_run) == book_dicts(first_run)
+
+
+def test_notes_are_downloaded_on_access_in_lazy_mode(client):
+    expected = book_dicts(DropboxFinder(client, books_path=client.folder).get_books())
+    client.downloads.clear()
+    finder = DropboxFinder(client, books_path=client.folder, lazy_notes=True)
+    books = list(finder.get_books())
+    assert len(client.downloads) == 5
+    assert all(path.endswith(".po") for path in client.downloads)
+    assert book_dicts(books) == expected
+    assert len(client.downloads) == 10
+
+
+def test_lazy_book_without_statistics_keeps_title_case(client):
+    client.delete("How_Linux_Works.pdf.po")
+    finder = DropboxFinder(client, books_path=client.folder, lazy_notes=True)
+
+    async def collect():
+        return [book async for book in finder.aget_books()]
+
+    books = list(finder.get_books())
+    async_books = asyncio.run(collect())
+
+    assert "How_Linux_Works" in {book.title for book in books}
+    assert {book.title for book in async_books} == {book.title for book in books}
+    eager_books = DropboxFinder(client, books_path=client.folder).get_books()
+    assert {book.title for book in books} == {book.title for book in eager_books}
+
+
+def test_folder_is_downloaded_as_single_archive_in_bulk_mode(client):
+    expected = book_dicts(DropboxFinder(client, books_path=client.folder).get_books())
+    client.downloads.clear()
+    finder = DropboxFinder(client, books_path=client.folder, bulk=True)
+
+    assert book_dicts(finder.get_books()) == expected
+    assert client.zip_downloads == [client.folder]
+    assert client.downloads == []
+
+
+def test_bulk_mode_honors_book_count(client):
+    finder = DropboxFinder(client, books_path=client.folder, bulk=True)
+
+    assert len(list(finder.get_books(book_count=2))) == 2
+
+
+def test_bulk_mode_falls_back_to_file_downloads_for_large_folder(client):
+    finder = DropboxFinder(client, books_path=client.folder, bulk=True, bulk_max_size=1)
+
+    assert len(list(finder.get_books())) == 5
+    assert client.zip_downloads == []
+    assert len(client.downloads) == 10
+
+
+def test_large_archive_is_kept_in_temporary_file(client, monkeypatch):
+    expected = book_dicts(DropboxFinder(client, books_path=client.folder).get_books())
+    monkeypatch.setattr(DropboxFinder, "ZIP_IN_MEMORY_SIZE", 1)
+    finder = DropboxFinder(client, books_path=client.folder, bulk=True)
+
+    assert book_dicts(finder.get_books()) == expected
+
+
+def test_bulk_books_are_iterated_asynchronously(client):
+    finder = DropboxFinder(client, books_path=client.folder, bulk=True)
+
+    async def collect():
+        return [book async for book in finder.aget_books()]
+
+    assert len(asyncio.run(collect())) == 5
+    assert client.zip_downloads == [client.folder]
+
+
+def quick_scheduler(**kwargs):
+    # Constant clock gives equal latencies and no delays between retries
+    return DownloadScheduler(backoff=0, clock=lambda: 0.0, **kwargs)
+
+
+def recording_scheduler(schedulers, **kwargs):
+    def factory(**settings):
+        scheduler = quick_scheduler(**kwargs, **settings)
+        schedulers.append(scheduler)
+        return scheduler
+
+    return factory
+
+
+def test_throttled_downloads_are_retried(client):
+    client.fail_downloads("How_Linux_Works.pdf.an", RateLimitError("id"))
+    client.fail_downloads("LoremIpsum.fb2.po", RateLimitError("id"))
+    metrics = Metrics()
+    schedulers = []
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        metrics=metrics,
+        scheduler_factory=recording_scheduler(schedulers),
+    )
+
+    assert len(list(finder.get_books())) == 5
+    # Both files of the pair are downloaded again on retry
+    assert len(client.downloads) == 13
+    assert metrics.counters["retries"] == 2
+    assert "failures" not in metrics.counters
+    assert schedulers[0].report()["completed"] == 5
+
+
+def test_throttled_downloads_are_retried_asynchronously(client):
+    client.fail_downloads("How_Linux_Works.pdf.an", RateLimitError("id"))
+    client.fail_downloads("LoremIpsum.fb2.po", ConnectionResetError())
+    metrics = Metrics()
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        metrics=metrics,
+        scheduler_factory=quick_scheduler,
+    )
+
+    async def collect():
+        return [book async for book in finder.aget_books()]
+
+    assert len(asyncio.run(collect())) == 5
+    assert metrics.counters["retries"] == 2
+    assert "failures" not in metrics.counters
+
+
+def test_book_is_skipped_when_retries_are_exhausted(client):
+    client.fail_downloads("How_Linux_Works.pdf.an", *[RateLimitError("id")] * 3)
+    metrics = Metrics()
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        metrics=metrics,
+        scheduler_factory=functools.partial(quick_scheduler, max_retries=2),
+    )
+
+    assert len(list(finder.get_books())) == 4
+    assert metrics.counters["retries"] == 2
+    assert metrics.counters["failures"] == 1
+
+
+def test_permanent_errors_are_not_retried(client):
+    client.fail_downloads("How_Linux_Works.pdf.an", ValueError("Not found"))
+    schedulers = []
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        scheduler_factory=recording_scheduler(schedulers),
+    )
+
+    assert len(list(finder.get_books())) == 4
+    assert client.downloads.count("/cache/how_linux_works.pdf.an") == 1
+    assert schedulers[0].report()["failed"] == 1
+
+
+def test_http_client_errors_are_retried(client):
+    client.fail_downloads(
+        "How_Linux_Works.pdf.an",
+        requests.exceptions.ConnectionError(),
+        requests.exceptions.ReadTimeout(),
+    )
+    metrics = Metrics()
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        metrics=metrics,
+        scheduler_factory=quick_scheduler,
+    )
+
+    assert len(list(finder.get_books())) == 5
+    assert metrics.counters["retries"] == 2
+
+
+@pytest.mark.parametrize("error", [PermissionError(), FileNotFoundError()])
+def test_local_os_errors_are_not_retried(client, error):
+    client.fail_downloads("How_Linux_Works.pdf.an", error)
+    finder = DropboxFinder(
+        client, books_path=client.folder, scheduler_factory=quick_scheduler
+    )
+
+    assert len(list(finder.get_books())) == 4
+    assert client.downloads.count("/cache/how_linux_works.pdf.an") == 1
+
+
+def test_every_run_has_its_own_scheduler(client):
+    schedulers = []
+    finder = DropboxFinder(
+        client,
+        books_path=client.folder,
+        scheduler_factory=recording_scheduler(schedulers),
+    )
+
+    async def collect():
+        return [book async for book in finder.aget_books(concurrency=2)]
+
+    first, second = finder.get_books(), finder.get_books(book_count=3)
+    next(first), next(second)
+    assert len(asyncio.run(collect())) == 5
+    assert len(list(second)) == 2
+    assert len(list(first)) == 4
+
+    assert len({id(scheduler) for scheduler in schedulers}) == 3
+    assert [scheduler.report()["completed"] for scheduler in schedulers] == [5, 3, 5]
+    assert schedulers[2].max_workers == 2
+
+
+def test_concurrency_grows_while_downloads_are_healthy():
+    scheduler = quick_scheduler(max_workers=4, initial_workers=1)
+
+    results = [future.result() for future in scheduler.run(str, range(50))]
+
+    assert sorted(results) == sorted(map(str, range(50)))
+    assert scheduler.concurrency == 4
+    assert scheduler.report()["max_concurrency"] == 4
+
+
+def test_concurrency_is_decreased_when_throttled():
+    throttled = []
+
+    def download(item):
+        if item == 0 and not throttled:
+            throttled.append(item)
+            raise RateLimitError("id")
+        return item
+
+    scheduler = quick_scheduler(max_workers=8, initial_workers=8)
+    results = [future.result() for future in scheduler.run(download, range(10))]
+
+    assert sorted(results) == list(range(10))
+    assert scheduler.report()["retries"] == 1
+    assert scheduler.concurrency < 8
+
+
+def test_retry_waits_for_delay_requested_by_server():
+    scheduler = DownloadScheduler(backoff=0.5)
+
+    delay = scheduler._retry_delay(RateLimitError("id", backoff=10), attempt=0)
+    assert 10 <= delay <= 10.5
+    assert 0.5 <= scheduler._retry_delay(RuntimeError(), attempt=1) <= 1
+
+
+def counting(items, pulled, closed):
+    try:
+        for item in items:
+            pulled.append(item)
+            yield item
+    finally:
+        closed.append(True)
+
+
+def test_books_are_downloaded_as_they_are_consumed(client):
+    finder = DropboxFinder(client, books_path=client.folder, max_pending_books=1)
+    books = finder.get_books()
+
+    next(books)
+    assert len(client.downloads) == 2
+    next(books)
+    assert len(client.downloads) == 4
+    books.close()
+
+
+def test_downloads_are_held_while_results_take_max_pending_bytes():
+    pulled, consumed = [], []
+    scheduler = quick_scheduler(max_workers=4, initial_workers=4, max_pending_bytes=10)
+    futures = scheduler.run(str, counting(range(20), pulled, []), size=lambda _: 10)
+
+    for future in futures:
+        consumed.append(future.result())
+        assert len(pulled) - len(consumed) <= 4
+
+    assert sorted(consumed) == sorted(map(str, range(20)))
+
+
+def test_closing_generator_cancels_downloads_without_waiting():
+    pulled, closed = [], []
+    release = threading.Event()
+
+    def download(item):
+        if item > 0:
+            release.wait(5)
+        return item
+
+    scheduler = quick_scheduler(max_workers=4, initial_workers=4)
+    futures = scheduler.run(download, counting(range(100), pulled, closed))
+    assert next(futures).result() == 0
+
+    started = time.monotonic()
+    futures.close()
+    release.set()
+
+    assert time.monotonic() - started < 1
+    assert closed == [True]
+    assert len(pulled) <= 5
+
+
+def test_downloads_are_closed_when_async_consumer_stops_early():
+    pulled, closed = [], []
+    scheduler = quick_scheduler(max_workers=2, initial_workers=2)
+    futures = scheduler.run(lambda item: item, counting(range(100), pulled, closed))
+
+    async def first():
+        async for future in iterate_in_thread(futures, buffer_size=1):
+            result = future.result()
+            break
+        return result
+
+    assert asyncio.run(first()) == 0
+    assert closed == [True]
+    assert len(pulled) < 100
@@ -0,0 +1,99 @@
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from moonreader_tools.exporters import JSONWriter, NDJSONWriter, export_books
+from moonreader_tools.finders import FilesystemFinder
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+@pytest.fixture(scope="module")
+def books():
+    return list(FilesystemFinder(FIXTURE_DIR).get_books())
+
+
+def test_json_writer_produces_books_document(books):
+    stream = io.StringIO()
+    with JSONWriter(stream) as writer:
+        assert writer.write_all(books) == len(books)
+    assert json.loads(stream.getvalue()) == {
+        "books": [book.to_dict() for book in books]
+    }
+
+
+def test_json_writer_without_books_produces_valid_document():
+    stream = io.StringIO()
+    with JSONWriter(stream):
+        pass
+    assert json.loads(stream.getvalue()) == {"books": []}
+
+
+def test_failed_export_is_not_finished(books):
+    def generate():
+        yield books[0]
+        raise RuntimeError("Export failed")
+
+    stream = io.StringIO()
+    with pytest.raises(RuntimeError):
+        with JSONWriter(stream) as writer:
+            writer.write_all(generate())
+    assert stream.getvalue().startswith('{"books": [')
+    with pytest.raises(ValueError):
+        json.loads(stream.getvalue())
+
+
+def test_book_is_written_before_the_next_one_is_obtained(books):
+    stream = io.StringIO()
+    writer = NDJSONWriter(stream)
+
+    def generate():
+        for book in books:
+            yield book
+            assert json.loads(stream.getvalue().splitlines()[-1])["title"] == book.title
+
+    writer.write_all(generate())
+    assert len(stream.getvalue().splitlines()) == len(books)
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+def test_gz_output_is_compressed(books, tmp_path, fmt):
+    filename = str(tmp_path / "books.json.gz")
+    assert export_books(iter(books), filename, fmt=fmt) == len(books)
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        content = f.read()
+    if fmt == "json":
+        dicts = json.loads(content)["books"]
+    else:
+        dicts = [json.loads(line) for line in content.splitlines()]
+    assert dicts == [book.to_dict() for book in books]
+
+
+def test_only_requested_fields_are_written(books):
+    stream = io.StringIO()
+    with NDJSONWriter(stream, fields=["title", "percentage"]) as writer:
+        writer.write_all(books)
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == [
+        {"title": book.title, "percentage": book.percentage} for book in books
+    ]
+
+
+def test_fields_option(books, tmp_path):
+    output = subprocess.run(
+        [sys.executable, "-m", "moonreader_tools.main", "--path", FIXTURE_DIR]
+        + ["--fields", "title,pages", "--format", "ndjson"],
+        cwd=str(tmp_path),
+        env=dict(os.environ, PYTHONPATH=os.path.dirname(BASE_DIR)),
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    assert [json.loads(line) for line in output.splitlines()] == [
+        {"title": book.title, "pages": book.pages} for book in books
+    ]
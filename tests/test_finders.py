@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from moonreader_tools.cache import BookCache
+from moonreader_tools.finders import FilesystemFinder
+from moonreader_tools.finders.fs.finder import parse_book
+from moonreader_tools.finders.fs import discovery
+from moonreader_tools.finders.fs.discovery import scan_files
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+def book_dicts(books):
+    return [book.to_dict() for book in books]
+
+
+def sort_dicts(dicts):
+    return sorted(dicts, key=lambda d: json.dumps(d, sort_keys=True))
+
+
+@pytest.fixture(scope="module")
+def serial_books():
+    return book_dicts(FilesystemFinder(FIXTURE_DIR).get_books())
+
+
+def test_books_are_parsed_in_process_pool(serial_books):
+    finder = FilesystemFinder(FIXTURE_DIR, workers=2)
+    with patch.object(FilesystemFinder, "PARALLEL_THRESHOLD", 1):
+        assert book_dicts(finder.get_books()) == serial_books
+
+
+def test_books_are_parsed_serially_for_small_libraries(serial_books):
+    finder = FilesystemFinder(FIXTURE_DIR, workers=2)
+    with patch(
+        "moonreader_tools.finders.fs.finder.ProcessPoolExecutor"
+    ) as executor_mock:
+        assert book_dicts(finder.get_books()) == serial_books
+    executor_mock.assert_not_called()
+
+
+def test_books_are_returned_in_completion_order(serial_books):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        finder = FilesystemFinder(FIXTURE_DIR, executor=executor, ordered=False)
+        books = book_dicts(finder.get_books())
+
+    assert sort_dicts(books) == sort_dicts(serial_books)
+
+
+def collect_async(books):
+    async def collect():
+        return [book async for book in books]
+
+    return asyncio.run(collect())
+
+
+def test_books_are_iterated_asynchronously(serial_books):
+    finder = FilesystemFinder(FIXTURE_DIR)
+    books = book_dicts(collect_async(finder.aget_books(concurrency=2)))
+
+    assert sort_dicts(books) == sort_dicts(serial_books)
+
+
+def test_async_iteration_stops_cleanly(serial_books):
+    async def take_first():
+        async for book in FilesystemFinder(FIXTURE_DIR).aget_books(concurrency=1):
+            return book
+
+    assert asyncio.run(take_first()).to_dict() in serial_books
+
+
+@pytest.fixture
+def nested_library(tmp_path):
+    """Fixture books spread across the nested directories"""
+    for index, fname in enumerate(sorted(os.listdir(FIXTURE_DIR))):
+        directory = tmp_path / "shelf_{}".format(index // 4) / "cache"
+        directory.mkdir(parents=True, exist_ok=True)
+        shutil.copy(os.path.join(FIXTURE_DIR, fname), str(directory))
+    (tmp_path / "shelf_0" / "readme.txt").write_text("not a book")
+    return tmp_path
+
+
+@pytest.mark.parametrize("scan_workers", [1, 4])
+def test_books_are_found_in_subdirectories(nested_library, serial_books, scan_workers):
+    finder = FilesystemFinder(
+        str(nested_library), recursive=True, scan_workers=scan_workers
+    )
+    books = book_dicts(finder.get_books())
+
+    assert sort_dicts(books) == sort_dicts(serial_books)
+
+
+def test_subdirectories_are_not_searched_by_default(nested_library):
+    assert list(FilesystemFinder(str(nested_library)).get_books()) == []
+
+
+def test_books_are_found_in_several_directories(nested_library, serial_books):
+    roots = sorted(str(path / "cache") for path in nested_library.iterdir())
+    books = book_dicts(FilesystemFinder(roots).get_books())
+
+    assert sort_dicts(books) == sort_dicts(serial_books)
+
+
+def test_missing_directory_is_reported(nested_library):
+    finder = FilesystemFinder([str(nested_library), str(nested_library / "missing")])
+    with pytest.raises(ValueError):
+        list(finder.get_books())
+
+
+def test_symlinked_directories_are_not_followed(nested_library):
+    os.symlink(str(nested_library), str(nested_library / "shelf_0" / "loop"))
+    files = list(scan_files([str(nested_library)], recursive=True, workers=4))
+
+    assert len(files) == len(os.listdir(FIXTURE_DIR))
+
+
+def test_books_are_parsed_while_directories_are_listed(serial_books):
+    listed = []
+
+    def scan(*args, **kwargs):
+        for entry in scan_files(*args, **kwargs):
+            listed.append(entry.path)
+            yield entry
+
+    with patch("moonreader_tools.finders.fs.finder.scan_files", scan):
+        books = FilesystemFinder(FIXTURE_DIR).get_books()
+        assert next(books).to_dict() in serial_books
+        assert len(listed) < len(os.listdir(FIXTURE_DIR))
+        assert len(list(books)) == len(serial_books) - 1
+
+
+def test_only_statistics_are_parsed_in_lazy_mode(serial_books):
+    finder = FilesystemFinder(FIXTURE_DIR, lazy_notes=True, workers=4)
+    with patch("moonreader_tools.finders.fs.finder.parse_book") as parse_book:
+        books = list(finder.get_books())
+    parse_book.assert_not_called()
+    assert not any(book.notes_loaded for book in books)
+    fields = ["title", "pages", "percentage"]
+    assert [book.to_dict(fields) for book in books] == [
+        {field: book[field] for field in fields} for book in serial_books
+    ]
+    assert not any(book.notes_loaded for book in books)
+    assert book_dicts(books) == serial_books
+
+
+def test_listing_stops_once_enough_books_are_found(nested_library):
+    with patch.object(
+        discovery, "scan_directory", wraps=discovery.scan_directory
+    ) as scan_directory:
+        finder = FilesystemFinder(str(nested_library), recursive=True, scan_workers=1)
+        books = list(finder.get_books(book_count=1))
+    # root, shelf_0 and its cache directory holding the first pair
+    assert len(books) == 1
+    assert scan_directory.call_count == 3
+
+
+def test_recent_books_are_ordered_by_statistics_timestamp():
+    finder = FilesystemFinder(FIXTURE_DIR)
+    with patch(
+        "moonreader_tools.finders.fs.finder.parse_book", wraps=parse_book
+    ) as parse:
+        books = list(finder.get_recent_books(2))
+    assert [book.title for book in books] == [
+        "Brinkman_S._Konec_Yepohi_Self_Help_Ka",
+        "LoremIpsum",
+    ]
+    assert [int(book.stats.timestamp) for book in books] == [
+        1523469066989,
+        1499405761647,
+    ]
+    assert parse.call_count == 2
+
+
+def test_recent_books_are_ordered_by_modification_time(tmp_path):
+    for fname in os.listdir(FIXTURE_DIR):
+        shutil.copy(os.path.join(FIXTURE_DIR, fname), str(tmp_path))
+        os.utime(str(tmp_path / fname), (1000, 1000))
+    os.utime(str(tmp_path / "How_Linux_Works.pdf.an"), (3000, 3000))
+    os.utime(str(tmp_path / "Do_Smerti_Zdorov.fb2.po"), (2000, 2000))
+
+    books = FilesystemFinder(str(tmp_path)).get_recent_books(2, by="mtime")
+
+    assert [book.title for book in books] == ["How_Linux_Works", "Do_Smerti_Zdorov"]
+
+
+def test_book_with_malformed_note_is_skipped(tmp_path):
+    shutil.copytree(FIXTURE_DIR, str(tmp_path / "books"))
+    note_file = tmp_path / "books" / "LoremIpsum.pdf.an"
+    text = zlib.decompress(note_file.read_bytes()).decode("utf-8")
+    note_file.write_text(text.replace("#A4#-256#A5#", "#A4#notacolor#A5#", 1))
+
+    books = [
+        book.to_dict() for book in FilesystemFinder(str(tmp_path / "books")).get_books()
+    ]
+
+    assert len(books) == 4
+
+
+def test_notes_of_found_books_are_decoded_on_access():
+    books = list(FilesystemFinder(FIXTURE_DIR).get_books())
+    notes = [note for book in books for note in book.notes]
+    assert notes
+    assert all(n._raw_timestamp is not None and n._raw_color is not None for n in notes)
+
+    assert all(note.created and note.color for note in notes)
+    assert all(n._raw_timestamp is None and n._raw_color is None for n in notes)
+
+
+def test_book_with_out_of_range_color_is_skipped(tmp_path):
+    shutil.copytree(FIXTURE_DIR, str(tmp_path / "books"))
+    note_file = tmp_path / "books" / "LoremIpsum.pdf.an"
+    text = zlib.decompress(note_file.read_bytes()).decode("utf-8")
+    note_file.write_text(text.replace("#A4#-256#A5#", "#A4#99999999999#A5#", 1))
+
+    books = list(FilesystemFinder(str(tmp_path / "books")).get_books())
+
+    assert len(books) == 4
+
+
+@pytest.fixture
+def recorded_entries():
+    recorded = []
+    new_entries = FilesystemFinder._new_entries
+
+    def record(self, *args):
+        entries = new_entries(self, *args)
+        recorded.append(entries)
+        return entries
+
+    with patch.object(FilesystemFinder, "_new_entries", record):
+        yield recorded
+
+
+def test_directory_entries_are_kept_only_for_cache(tmp_path, recorded_entries):
+    assert len(list(FilesystemFinder(FIXTURE_DIR).get_books())) == 5
+    with BookCache(str(tmp_path / "cache.sqlite")) as cache:
+        finder = FilesystemFinder(FIXTURE_DIR, cache=cache)
+        assert len(list(finder.get_books())) == 5
+        assert len(list(finder.get_recent_books(2, by="mtime"))) == 2
+
+    assert recorded_entries == [None, {}, {}]
+
+
+def test_directory_entries_are_not_kept_in_lazy_mode(tmp_path, recorded_entries):
+    with BookCache(str(tmp_path / "cache.sqlite")) as cache:
+        finder = FilesystemFinder(FIXTURE_DIR, cache=cache, lazy_notes=True)
+        assert len(list(finder.get_books())) == 5
+        assert len(list(finder.get_recent_books(2, by="mtime"))) == 2
+
+    assert recorded_entries == [None, {}]
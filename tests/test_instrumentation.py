@@ -0,0 +1,87 @@
+import io
+import os
+import time
+from unittest.mock import patch
+
+from moonreader_tools.exporters import NDJSONWriter
+from moonreader_tools.finders import DropboxFinder, FilesystemFinder
+from moonreader_tools.instrumentation import NULL_METRICS, Metrics
+from tests.fake_dropbox import FakeDropboxClient
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+def test_nested_stage_time_is_not_counted_in_outer_stage():
+    metrics = Metrics()
+    with metrics.stage("outer"):
+        with metrics.stage("inner"):
+            time.sleep(0.05)
+    report = metrics.report()["stages"]
+    assert report["inner"]["seconds"] >= 0.05
+    assert report["outer"]["seconds"] < 0.05
+    assert report["outer"]["calls"] == report["inner"]["calls"] == 1
+
+
+def test_callback_receives_metrics():
+    events = []
+    metrics = Metrics(callback=lambda *event: events.append(event))
+    metrics.incr("notes", 3)
+    with metrics.stage("parse"):
+        pass
+    assert events[0] == ("count", "notes", 3)
+    assert events[1][:2] == ("time", "parse")
+
+
+def test_null_metrics_collect_nothing():
+    with NULL_METRICS.stage("parse"):
+        NULL_METRICS.incr("notes")
+    assert NULL_METRICS.report() == {"stages": {}, "counters": {}}
+
+
+def test_filesystem_finder_reports_stages_and_counters():
+    metrics = Metrics()
+    books = list(FilesystemFinder(FIXTURE_DIR, metrics=metrics).get_books())
+    report = metrics.report()
+    assert report["counters"]["books"] == len(books)
+    assert report["counters"]["notes"] == sum(len(book.notes) for book in books)
+    assert report["counters"]["bytes_inflated"] > report["counters"]["bytes_read"]
+    assert {"list", "open", "read", "inflate", "decode", "parse"} <= set(
+        report["stages"]
+    )
+
+
+def test_worker_metrics_are_merged():
+    serial, parallel = Metrics(), Metrics()
+    list(FilesystemFinder(FIXTURE_DIR, metrics=serial).get_books())
+    finder = FilesystemFinder(FIXTURE_DIR, workers=2, metrics=parallel)
+    with patch.object(FilesystemFinder, "PARALLEL_THRESHOLD", 1):
+        list(finder.get_books())
+    assert parallel.report()["counters"] == serial.report()["counters"]
+
+
+def test_failures_are_counted():
+    metrics = Metrics()
+    finder = FilesystemFinder(FIXTURE_DIR, metrics=metrics)
+    with patch("moonreader_tools.finders.fs.finder.parse_book", side_effect=ValueError):
+        assert list(finder.get_books()) == []
+    assert metrics.report()["counters"]["failures"] == 5
+
+
+def test_dropbox_finder_reports_downloads():
+    metrics = Metrics()
+    client = FakeDropboxClient.with_fixtures()
+    finder = DropboxFinder(client, books_path=client.folder, metrics=metrics)
+    books = list(finder.get_books())
+    report = metrics.report()
+    assert report["counters"]["books"] == len(books)
+    assert report["counters"]["bytes_downloaded"] > 0
+    assert report["stages"]["download"]["calls"] == len(client.downloads)
+
+
+def test_serialization_is_measured():
+    metrics = Metrics()
+    books = list(FilesystemFinder(FIXTURE_DIR).get_books())
+    with NDJSONWriter(io.StringIO(), metrics) as writer:
+        writer.write_all(books)
+    assert metrics.report()["stages"]["serialize"]["calls"] == len(books)
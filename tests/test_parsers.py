@@ -1,5 +1,9 @@
+import io
+import os
 import sys
+import tempfile
 import unittest
+import zlib
 from unittest.mock import mock_open, patch
 
 from moonreader_tools.conf import STAT_EXTENSION
@@ -23,6 +27,47 @@ class TestPDFParserRoutines(BaseTest):
         self.assertEqual(note_texts[0], "#A*#<note_contents_1>#A@#")
         self.assertEqual(note_texts[1], "#A*#<note_contents_2>#A@#")
 
+    def test_notes_are_yielded_lazily(self):
+        text = "245#A*#8#A1#1451496313379#A2#291#A3#301#A4#-256#A5#0#A6##A7# sample_text_1#A@##A*#9#A1#1451496349963#A2#4#A3#0#A4#-16711936#A5#0#A6##A7# sample_text_2#A@#"
+        notes = PDFNoteParser.iter_notes_from_text(text)
+
+        self.assertEqual(next(notes).text, " sample_text_1")
+        self.assertEqual(next(notes).text, " sample_text_2")
+        with self.assertRaises(StopIteration):
+            next(notes)
+
+    def test_scanner_matches_splitting_of_note_pieces(self):
+        text = "245#A*#8#A1#1451496313379#A2#291#A3#301#A4#-256#A5#0#A6#remark#A7#multi\r\nline#A@#trailing#A1#"
+        pieces = PDFNoteParser._find_note_text_pieces(text)
+        scanned = list(PDFNoteParser._iter_note_tokens(text))
+
+        self.assertEqual(
+            scanned, [PDFNoteParser.SPLITTER_RE.split(piece) for piece in pieces]
+        )
+
+    def test_note_longer_than_chunk_is_scanned_once(self):
+        long_text = "word " * 2000
+        text = (
+            "245#A*#8#A1#1451496313379#A2#291#A3#301#A4#-256#A5#0#A6##A7#"
+            + long_text
+            + "#A@##A*#9#A1#1451496349963#A2#4#A3#0#A4#-16711936#A5#0#A6##A7#short#A@#"
+        )
+        # Chunks split the end markers too
+        chunks = [text[i : i + 7] for i in range(0, len(text), 7)]
+
+        with patch.object(
+            PDFNoteParser,
+            "_scan_note_tokens",
+            wraps=PDFNoteParser._scan_note_tokens,
+        ) as scan:
+            tokens = list(PDFNoteParser._iter_note_tokens_from_chunks(chunks))
+
+        self.assertEqual(tokens, list(PDFNoteParser._iter_note_tokens(text)))
+        self.assertEqual([t[8] for t in tokens], [long_text, "short"])
+        self.assertEqual(scan.call_count, 2)
+        scanned = sum(len(call.args[0]) for call in scan.call_args_list)
+        self.assertLess(scanned, len(text) + 14)
+
 
 class TestFB2ParserRoutines(BaseTest):
     def test_note_text_correctly_splitted_into_header_and_rest(self):
@@ -43,6 +88,144 @@ class TestFB2ParserRoutines(BaseTest):
 
         self.assertEqual(note_1.text, "Some text")
 
+    def test_notes_are_streamed_from_file_object(self):
+        fobj = io.BytesIO(self.sample_note_text.encode("utf-8"))
+        with patch.object(FB2NoteParser, "CHUNK_SIZE", 7):
+            notes = FB2NoteParser.iter_notes(fobj)
+            self.assertEqual(next(notes).text, "Some text")
+            self.assertEqual(next(notes).text, "Some text 2")
+            with self.assertRaises(StopIteration):
+                next(notes)
+
+    def test_notes_of_the_same_book_share_metadata(self):
+        lines = self.sample_note_text.splitlines()
+        # The first note repeated at the end of the file
+        notes = FB2NoteParser.from_text("\n".join(lines + lines[3:20]))
+
+        self.assertEqual(len(notes), 3)
+        self.assertIs(notes[0].meta, notes[2].meta)
+        self.assertIsNot(notes[0].meta, notes[1].meta)
+        self.assertEqual(notes[0].meta.title, "Sample book title")
+        self.assertEqual(notes[0].meta.path, "/sdcard/Books/MoonReader/Book.fb2.zip")
+        self.assertEqual(
+            notes[0].meta.path_lower, "/sdcard/books/moonreader/book.fb2.zip"
+        )
+
+    def test_note_positions_are_parsed_as_integers(self):
+        note = FB2NoteParser.from_text(self.sample_note_text)[0]
+
+        self.assertEqual(note.last_chapter, 2)
+        self.assertEqual(note.last_position, 222)
+        self.assertEqual(note.highlight_length, 131)
+        self.assertEqual(note.position, (2, 222, 131))
+        self.assertNotIn("last_position", note.to_dict())
+
+    def test_too_short_text_raises_error(self):
+        with self.assertRaises(ValueError):
+            FB2NoteParser.from_text("1\nindent:false")
+
+
+class TestCompiledDecoders(BaseTest):
+    """Compiled decoders are to match the schema-interpreting path"""
+
+    FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "book_fixtures")
+
+    def _fixture_text(self, suffix):
+        for filename in sorted(os.listdir(self.FIXTURES_DIR)):
+            if filename.endswith(suffix):
+                with open(os.path.join(self.FIXTURES_DIR, filename), "rb") as f:
+                    yield FB2NoteParser.read_file_obj(f)
+
+    def assertNotesEqual(self, compiled, interpreted):
+        self.assertEqual(len(compiled), len(interpreted))
+        for compiled_note, interpreted_note in zip(compiled, interpreted):
+            self.assertEqual(compiled_note.to_record(), interpreted_note.to_record())
+            self.assertEqual(compiled_note.meta, interpreted_note.meta)
+
+    def test_pdf_decoder_matches_interpreted_schema(self):
+        for text in self._fixture_text(".pdf.an"):
+            tokens = list(PDFNoteParser._iter_note_tokens(text))
+            self.assertTrue(tokens)
+            self.assertEqual(
+                [PDFNoteParser._decode_record(t) for t in tokens],
+                [
+                    PDFNoteParser.record_from_dictionary(
+                        PDFNoteParser._dict_from_tokens(t)
+                    )
+                    for t in tokens
+                ],
+            )
+            self.assertNotesEqual(
+                PDFNoteParser.from_text(text),
+                [
+                    PDFNoteParser.single_note_from_text(piece)
+                    for piece in PDFNoteParser._find_note_text_pieces(text)
+                ],
+            )
+
+    def test_fb2_decoder_matches_interpreted_schema(self):
+        deleted = self.sample_note_text.replace("0\n0\n0\n#", "0\n0\n*DELETED*\n#", 1)
+        texts = list(self._fixture_text(".fb2.an")) + [self.sample_note_text, deleted]
+        for text in texts:
+            chunks = list(FB2NoteParser._iter_note_line_chunks(text.splitlines()))
+            self.assertTrue(chunks)
+            self.assertEqual(
+                [FB2NoteParser._decode_record(c) for c in chunks],
+                [
+                    FB2NoteParser.record_from_dictionary(
+                        FB2NoteParser._dict_from_str_list(c)
+                    )
+                    for c in chunks
+                ],
+            )
+            self.assertNotesEqual(
+                FB2NoteParser.from_text(text),
+                [FB2NoteParser.from_str_list(c) for c in chunks],
+            )
+        self.assertEqual(FB2NoteParser.from_text(deleted)[0].style.value, "DELETED")
+
+    def test_too_short_notes_are_rejected(self):
+        with self.assertRaises(ValueError):
+            PDFNoteParser.note_from_tokens(["", "1", "2"])
+        with self.assertRaises(ValueError):
+            FB2NoteParser._decode_note(["1", "title"], {})
+
+
+class TestFileReaderRoutines(unittest.TestCase):
+    def test_lines_are_split_across_chunk_boundaries(self):
+        text = "first\r\nsecond\r\n\nthird\rfourth\n"
+        chunks = [text[i : i + 2] for i in range(0, len(text), 2)]
+        lines = list(FB2NoteParser._lines_from_chunks(chunks))
+        self.assertEqual(lines, text.splitlines())
+
+    def test_multibyte_characters_are_decoded_across_chunks(self):
+        text = "Наверное\nнужно"
+        fobj = io.BytesIO(text.encode("utf-8"))
+        with patch.object(FB2NoteParser, "CHUNK_SIZE", 3):
+            self.assertEqual(list(FB2NoteParser.iter_lines(fobj)), text.splitlines())
+
+    def test_compressed_content_is_inflated_in_bounded_chunks(self):
+        content = ("line of text\n" * 1000).encode("utf-8")
+        fobj = io.BytesIO(zlib.compress(content))
+        chunks = list(FB2NoteParser.iter_byte_chunks(fobj, chunk_size=64))
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), content)
+
+    def test_regular_files_are_memory_mapped(self):
+        content = "1\nindent:false\ntrim:false\n"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "book.fb2.an")
+            with open(path, "wb") as f:
+                f.write(content.encode("utf-8"))
+            with open(path, "rb") as f:
+                mapped = FB2NoteParser._mmap_file_obj(f)
+                self.assertIsNotNone(mapped)
+                mapped.close()
+                self.assertEqual(FB2NoteParser.read_file_obj(f), content)
+
+    def test_empty_file_is_read_as_empty_text(self):
+        self.assertEqual(FB2NoteParser.read_file_obj(io.BytesIO(b"")), "")
+
 
 class TestStatisticsParser(unittest.TestCase):
     def setUp(self):
@@ -72,3 +255,98 @@ class TestStatisticsParser(unittest.TestCase):
         path_exists_mock.return_value = True
         s = StatsAccessor.stats_from_file("aaaa" + STAT_EXTENSION)
         self.assertTrue(s.is_empty())
+
+
+class TestStatisticsWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.stats = StatsAccessor.stats_from_string("1392540515970*15@0#6095:7.8%")
+
+    def _path(self, name="book.pdf" + STAT_EXTENSION):
+        return os.path.join(self.temp_dir.name, name)
+
+    def test_statistics_are_serialized_back_to_the_same_string(self):
+        for text in (
+            "1392540515970*15@0#6095:7.8%",
+            "1481711834080*151:44.9%",
+            "1481711834080*53@0#12397:100%",
+            "1499405761647*0:25.0%",
+        ):
+            stats = StatsAccessor.stats_from_string(text)
+            self.assertEqual(StatsAccessor.stats_to_string(stats), text)
+
+    def test_new_files_are_written_uncompressed(self):
+        path = self._path()
+        StatsAccessor.stats_to_file(self.stats, path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"1392540515970*15@0#6095:7.8%")
+
+    def test_compressed_files_are_readable(self):
+        path = self._path()
+        for level in (1, 9):
+            StatsAccessor.stats_to_file(self.stats, path, compress=True, level=level)
+            with open(path, "rb") as f:
+                self.assertTrue(StatsAccessor._is_zipped(f.read(2)))
+            self.assertEqual(
+                StatsAccessor.stats_from_file(path).to_record(), self.stats.to_record()
+            )
+
+    def test_only_zlib_headers_are_taken_for_compression(self):
+        for head in (b"x?", b"x}", b"x", b"", "x\x9c"):
+            self.assertFalse(StatsAccessor._is_zipped(head), head)
+        for level in range(10):
+            self.assertTrue(StatsAccessor._is_zipped(zlib.compress(b"1", level)[:2]))
+
+    def test_compression_of_existing_file_is_kept(self):
+        path = self._path()
+        with open(path, "wb") as f:
+            f.write(zlib.compress(b"1392540515970*15:1.0%"))
+        StatsAccessor.stats_to_file(self.stats, path)
+        with open(path, "rb") as f:
+            self.assertEqual(zlib.decompress(f.read()), b"1392540515970*15@0#6095:7.8%")
+
+    def test_file_is_replaced_without_leftovers(self):
+        path = self._path()
+        with open(path, "wb") as f:
+            f.write(b"1392540515970*15:1.0%")
+        os.chmod(path, 0o640)
+        StatsAccessor.stats_to_file(self.stats, path, fsync=True)
+        self.assertEqual(os.listdir(self.temp_dir.name), [os.path.basename(path)])
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+        self.assertEqual(
+            StatsAccessor.stats_from_file(path).to_record(), self.stats.to_record()
+        )
+
+    def test_new_file_permissions_follow_umask(self):
+        path = self._path()
+        umask = os.umask(0o027)
+        try:
+            StatsAccessor.stats_to_file(self.stats, path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+    def test_failed_write_keeps_original_file(self):
+        path = self._path()
+        with open(path, "wb") as f:
+            f.write(b"1392540515970*15:1.0%")
+        with patch("os.replace", side_effect=OSError):
+            with self.assertRaises(OSError):
+                StatsAccessor.stats_to_file(self.stats, path)
+        self.assertEqual(os.listdir(self.temp_dir.name), [os.path.basename(path)])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"1392540515970*15:1.0%")
+
+    def test_many_files_are_written_in_bulk(self):
+        items = [
+            (self._path("book{}.pdf{}".format(i, STAT_EXTENSION)), self.stats)
+            for i in range(20)
+        ]
+        items.append((self._path("missing/book.pdf" + STAT_EXTENSION), self.stats))
+        for workers in (1, 4):
+            self.assertEqual(StatsAccessor.stats_to_files(items, workers=workers), 20)
+            for path, stats in items[:-1]:
+                self.assertEqual(
+                    StatsAccessor.stats_from_file(path).to_record(), stats.to_record()
+                )
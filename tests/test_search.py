@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from moonreader_tools.datamodel.annotation import Note
+from moonreader_tools.datamodel.book import Book
+from moonreader_tools.finders import FilesystemFinder
+from moonreader_tools.search import SearchIndex, parse_query
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, "book_fixtures")
+
+
+@pytest.fixture(scope="module")
+def books():
+    return list(FilesystemFinder(FIXTURE_DIR).get_books())
+
+
+@pytest.fixture
+def index(tmp_path, books):
+    with SearchIndex(str(tmp_path / "index.sqlite")) as search_index:
+        search_index.update(books)
+        yield search_index
+
+
+def make_book(title, *texts):
+    created = datetime.datetime(2017, 1, 1)
+    return Book(title, notes=[Note(text=text, created=created) for text in texts])
+
+
+def test_query_is_split_into_terms_and_phrases():
+    assert parse_query('Kernel "context  switch" CPU') == (
+        ["kernel", "cpu"],
+        [["context", "switch"]],
+    )
+
+
+def test_all_notes_are_indexed(index, books):
+    assert len(index) == sum(len(book.notes) for book in books)
+
+
+def test_notes_containing_all_terms_are_found(index, books):
+    expected = [
+        note.text
+        for book in books
+        for note in book.notes
+        if {"kernel", "process"} <= set(note.text.casefold().split())
+    ]
+    hits = index.search("Kernel process")
+    assert expected and sorted(hit.text for hit in hits) == sorted(expected)
+
+
+def test_phrase_is_matched_as_a_whole(index):
+    hits = index.search('"context switch"')
+    assert [hit.title for hit in hits] == ["How_Linux_Works"]
+    assert index.search('"switch context"') == []
+
+
+def test_filters_are_applied(index):
+    hits = index.search("lorem", book="LoremIpsum")
+    assert hits and all(hit.title == "LoremIpsum" for hit in hits)
+    assert index.search("lorem", book="How_Linux_Works") == []
+    color = hits[0].color
+    assert all(hit.color == color for hit in index.search(color=color))
+    created = hits[0].created
+    assert all(hit.created >= created for hit in index.search("lorem", since=created))
+    assert all(hit.created < created for hit in index.search(until=created))
+    assert len(index.search(limit=3)) == 3
+
+
+def test_unchanged_books_are_not_indexed_again(index, books):
+    assert index.update(books) == 0
+
+
+def test_changed_book_replaces_its_notes(index):
+    assert index.update_book(make_book("How_Linux_Works", "new quote"))
+    assert index.search('"context switch"') == []
+    assert [hit.text for hit in index.search("quote")] == ["new quote"]
+    assert not index.update_book(make_book("How_Linux_Works", "new quote"))
+
+
+def test_changed_book_replaces_its_notes_without_pruning(index):
+    index.update([make_book("Alpha", "alpha one")], prune=False)
+    assert index.update([make_book("Alpha", "alpha two")], prune=False) == 1
+    assert [hit.text for hit in index.search("alpha")] == ["alpha two"]
+    assert "How_Linux_Works" in index.titles()
+
+
+def test_books_of_same_title_are_kept_without_pruning(index):
+    index.update(
+        [make_book("Alpha", "alpha one"), make_book("Alpha", "alpha two")],
+        prune=False,
+    )
+    assert len(index.search("alpha")) == 2
+
+
+def test_missing_books_are_pruned(index, books):
+    index.update(book for book in books if book.title != "How_Linux_Works")
+    assert "How_Linux_Works" not in index.titles()
+    assert index.search("kernel") == []
+
+
+def run_cli(cwd, *args):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(BASE_DIR))
+    return subprocess.run(
+        [sys.executable, "-m", "moonreader_tools.main", *args],
+        cwd=str(cwd),
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+
+def test_search_subcommand(tmp_path):
+    argv = ["search", "--index-file", "index.sqlite", '"context switch"']
+    output = run_cli(tmp_path, *argv, "--path", FIXTURE_DIR, "--format", "ndjson")
+    hits = [json.loads(line) for line in output.splitlines()]
+    assert [hit["title"] for hit in hits] == ["How_Linux_Works"]
+    # index is queried without the source files
+    assert run_cli(tmp_path, *argv).startswith("How_Linux_Works")
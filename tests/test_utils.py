@@ -1,13 +1,22 @@
 import os
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch
 
 from moonreader_tools.errors import BookTypeError
 from moonreader_tools.utils import (
+    color_tuple_as_hex_code,
+    color_tuple_from_overflowed_integer,
+    colors_from_overflowed_integers,
+    date_from_long_timestamp,
+    dates_from_long_timestamps,
     get_book_type,
     get_moonreader_files,
     get_same_book_files,
+    hex_codes_from_color_tuples,
+    iter_same_book_files,
     one_obj_or_list,
+    seconds_from_long_timestamps,
 )
 
 
@@ -22,17 +31,15 @@ class TestHelperMethods(unittest.TestCase):
 
 
 class TestFileRoutines(unittest.TestCase):
-    @patch("moonreader_tools.utils.os.listdir")
-    def test_correct_files_taken(self, patched_listdir):
+    @patch("moonreader_tools.utils.os.scandir")
+    def test_correct_files_taken(self, patched_scandir):
         dir_name = "test"
-        patched_listdir.return_value = [
-            "test.an",
-            "test.po",
-            "..",
-            ".",
-            "unused_file.file",
-            "no_ext_file",
+        names = ["test.an", "test.po", "..", ".", "unused_file.file", "no_ext_file"]
+        entries = [
+            SimpleNamespace(name=name, path=os.path.join(dir_name, name))
+            for name in names
         ]
+        patched_scandir.return_value.__enter__.return_value = entries
         files = get_moonreader_files(dir_name)
         self.assertEqual(
             list(sorted(files)),
@@ -60,6 +67,21 @@ class TestFileRoutines(unittest.TestCase):
         pairs = get_same_book_files(files)
         self.assertEqual(pairs, [("test_book_1.an", ""), ("test_book_2.an", "")])
 
+    def test_pairs_are_streamed_as_soon_as_both_files_are_met(self):
+        files = iter(
+            ["test_book_1.po", "test_book_2.an", "test_book_2.po", "test_book_1.an"]
+        )
+        pairs = iter_same_book_files(files)
+        self.assertEqual(next(pairs), ("test_book_2.an", "test_book_2.po"))
+        self.assertEqual(next(files), "test_book_1.an")
+
+    def test_single_files_are_streamed_after_pairs(self):
+        files = ["test_book_1.po", "unused_file", "test_book_2.an", "test_book_2.po"]
+        pairs = list(iter_same_book_files(files))
+        self.assertEqual(
+            pairs, [("test_book_2.an", "test_book_2.po"), ("", "test_book_1.po")]
+        )
+
 
 class TestBookType(unittest.TestCase):
     def test_book_type_correctly_parsed_from_simple_name(self):
@@ -100,5 +122,48 @@ class TestBookType(unittest.TestCase):
             get_book_type(filename)
 
 
+class TestFieldDecoding(unittest.TestCase):
+    timestamps = ["1451686942123", "1441449604670", "1481916371291"]
+    colors = ["-256", "-16711936", "1996532479", "-256"]
+
+    def test_timestamps_are_converted_column_wise(self):
+        self.assertEqual(
+            seconds_from_long_timestamps(self.timestamps),
+            [1451686942, 1441449604, 1481916371],
+        )
+        self.assertEqual(
+            dates_from_long_timestamps(self.timestamps),
+            [date_from_long_timestamp(t) for t in self.timestamps],
+        )
+
+    def test_timestamps_are_parsed_alike_one_by_one_and_column_wise(self):
+        timestamps = ["1451686942.5", "14516869"]
+        self.assertEqual(
+            dates_from_long_timestamps(timestamps),
+            [date_from_long_timestamp(t) for t in timestamps],
+        )
+
+    def test_colors_are_converted_column_wise(self):
+        colors = colors_from_overflowed_integers(self.colors)
+        self.assertEqual(
+            colors, [color_tuple_from_overflowed_integer(int(c)) for c in self.colors]
+        )
+        self.assertIs(colors[0], colors[3])
+        self.assertEqual(
+            hex_codes_from_color_tuples([list(c) for c in colors]),
+            [color_tuple_as_hex_code(c) for c in colors],
+        )
+
+    def test_decoded_colors_are_memoized(self):
+        color_tuple_from_overflowed_integer.cache_clear()
+        for _ in range(3):
+            self.assertEqual(
+                color_tuple_from_overflowed_integer(-256), (0, 255, 255, 255)
+            )
+        info = color_tuple_from_overflowed_integer.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+        self.assertEqual(color_tuple_as_hex_code((0, 255, 255, 255)), "#ffffff")
+
+
 if __name__ == "__main__":
     unittest.main()